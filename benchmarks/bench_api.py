@@ -0,0 +1,421 @@
+"""
+Benchmark de carga de la API HTTP y de la capa de servicios.
+
+Genera payloads sintéticos realistas (lecturas stm32, heartbeats y eventos de
+cortocircuito que alternan activo/inactivo), carga un dataset inicial y mide
+cada escenario llamando a las funciones de servicio directamente y a la app
+Flask con su cliente de pruebas, con la concurrencia indicada. Por escenario
+informa throughput, latencia (media, p50, p95, p99, máxima), errores y
+consultas SQL por operación. Uso:
+
+    python -m benchmarks.bench_api --requests 500 --concurrency 4 --output base.json
+    python -m benchmarks.bench_api --requests 500 --concurrency 4 --baseline base.json
+
+La base es un archivo SQLite que se recrea en cada corrida (--database).
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+START = datetime(2024, 1, 1)
+SEED_CHUNK_SIZE = 500
+
+
+def stm32_payload(rng: random.Random, serial_number: str) -> dict:
+    """
+    Lectura stm32 con el formato que envían los equipos.
+    """
+    return {
+        "stm32_details": {"serial_number": serial_number, "firmware_version": "1.0.0"},
+        "alarm_status": {
+            "status": rng.choices(("normal", "warning", "critical"), (90, 8, 2))[0]
+        },
+        "ln_switch_status": {"L1": True, "L2": True, "L3": True, "N": False},
+        "currents": {
+            "leakage": round(rng.gauss(12, 2), 4),
+            "L1": round(rng.uniform(0, 20), 3),
+            "L2": round(rng.uniform(0, 20), 3),
+            "L3": round(rng.uniform(0, 20), 3),
+        },
+        "measurements": {
+            "cos_fi": round(rng.uniform(0.8, 1), 3),
+            "apparent_power_va": round(rng.uniform(0, 5000), 1),
+            "active_power_w": round(rng.uniform(0, 4500), 1),
+        },
+        "voltages": {
+            "L1_N": round(rng.gauss(230, 2), 1),
+            "L2_N": round(rng.gauss(230, 2), 1),
+            "L3_N": round(rng.gauss(230, 2), 1),
+            "L1_L2": round(rng.gauss(400, 3), 1),
+            "L1_L3": round(rng.gauss(400, 3), 1),
+            "L2_L3": round(rng.gauss(400, 3), 1),
+            "L1_peak": 3,
+            "L2_peak": 3,
+            "L3_peak": 3,
+        },
+    }
+
+
+def heartbeat_payload(rng: random.Random, serial_number: str) -> dict:
+    return {
+        "serial_number": serial_number,
+        "device_name": f"Tablero {serial_number[-4:]}",
+        "mac_address": _mac(int(serial_number[2:])),
+        "state_duration": rng.randint(0, 3600),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+class ShortCircuitSimulator:
+    """
+    Secuencia de eventos por control_mac: cada evento cambia el estado y
+    trae el anterior en previous, como los envía el firmware.
+    """
+
+    def __init__(self, rng: random.Random, devices: int):
+        self.rng = rng
+        self.macs = [_mac(0xC0FFEE000000 + number) for number in range(devices)]
+        self.state = {mac: (False, START) for mac in self.macs}
+        self._lock = threading.Lock()
+
+    def next(self) -> dict:
+        with self._lock:
+            mac = self.rng.choice(self.macs)
+            active, since = self.state[mac]
+            now = since + timedelta(seconds=self.rng.randint(1, 600))
+            self.state[mac] = (not active, now)
+        return {
+            "control_mac": mac,
+            "wifi_mac": mac.replace("C0", "D0", 1),
+            "timestamp": now.isoformat() + "Z",
+            "short_circuit": {
+                "current": {"active": not active, "duration_seconds": 0},
+                "previous": {
+                    "active": active,
+                    "timestamp": since.isoformat() + "Z",
+                    "duration_seconds": int((now - since).total_seconds()),
+                },
+            },
+        }
+
+
+def _mac(number: int) -> str:
+    return ":".join(f"{b:02X}" for b in number.to_bytes(6, "big"))
+
+
+class QueryCounter:
+    """
+    Cuenta las sentencias SQL ejecutadas por el hilo actual.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def value(self) -> int:
+        return getattr(self._local, "count", 0)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Percentil por rango más cercano de una lista ya ordenada.
+    """
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(fraction * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+def run_scenario(operation, requests: int, concurrency: int, counter) -> dict:
+    """
+    Ejecuta operation(index) requests veces repartidas en concurrency hilos.
+    operation retorna False (o lanza) si la operación falló; en los servicios
+    se mide la llamada y en HTTP la respuesta completa.
+    """
+
+    def measure(index: int):
+        counter.reset()
+        started = time.perf_counter()
+        try:
+            error = None if operation(index) is not False else "respuesta fallida"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return time.perf_counter() - started, counter.value, error
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(measure, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _, _ in samples)
+    errors = [error for _, _, error in samples if error]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0][:300] if errors else None,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "queries_per_request": (
+            sum(queries for _, queries, _ in samples) / requests if requests else 0.0
+        ),
+    }
+
+
+def _seed(args, rng, serials, short_circuits):
+    from core.config import SessionLocal
+    from services.consume_service import save_sensor_data_batch
+    from services.short_circuit_service import create_short_circuit
+
+    for offset in range(0, args.seed_readings, SEED_CHUNK_SIZE):
+        count = min(SEED_CHUNK_SIZE, args.seed_readings - offset)
+        items = [stm32_payload(rng, rng.choice(serials)) for _ in range(count)]
+        items += [heartbeat_payload(rng, serial) for serial in serials[:count]]
+        with SessionLocal() as db:
+            save_sensor_data_batch(db, items)
+    for _ in range(args.seed_short_circuits):
+        with SessionLocal() as db:
+            create_short_circuit(db, short_circuits.next())
+
+
+def _service_scenarios(rng, serials, short_circuits, batch_size) -> dict:
+    from core.config import SessionLocal
+    from services.consume_service import (
+        get_energy_readings_page,
+        save_sensor_data,
+        save_sensor_data_batch,
+    )
+    from services.short_circuit_service import (
+        create_short_circuit,
+        get_short_circuits,
+        get_short_circuits_keyset,
+    )
+
+    def session_call(function):
+        def operation(index):
+            with SessionLocal() as db:
+                return function(db, index)
+
+        return operation
+
+    def created(result):
+        return result[1] is None
+
+    return {
+        "service save_sensor_data stm32": session_call(
+            lambda db, i: save_sensor_data(
+                db, stm32_payload(rng, serials[i % len(serials)])
+            )
+        ),
+        "service save_sensor_data heartbeat": session_call(
+            lambda db, i: save_sensor_data(
+                db, heartbeat_payload(rng, serials[i % len(serials)])
+            )
+        ),
+        f"service save_sensor_data_batch x{batch_size}": session_call(
+            lambda db, i: all(
+                result["status"] == "success"
+                for result in save_sensor_data_batch(
+                    db,
+                    [
+                        stm32_payload(rng, rng.choice(serials))
+                        for _ in range(batch_size)
+                    ],
+                )
+            )
+        ),
+        "service create_short_circuit": session_call(
+            lambda db, i: created(create_short_circuit(db, short_circuits.next()))
+        ),
+        "service get_short_circuits": session_call(
+            lambda db, i: created(get_short_circuits(db, (i % 10) * 10, 10))
+        ),
+        "service get_short_circuits_keyset": session_call(
+            lambda db, i: created(get_short_circuits_keyset(db, 10))
+        ),
+        "service get_energy_readings_page": session_call(
+            lambda db, i: get_energy_readings_page(
+                db, limit=100, serial_number=serials[i % len(serials)]
+            )
+        ),
+    }
+
+
+def _http_scenarios(app, rng, serials, short_circuits, batch_size) -> dict:
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        return local.client
+
+    def post(path, payload_for, expected=(200, 201)):
+        def operation(index):
+            response = client().post(path, json=payload_for(index))
+            return response.status_code in expected
+
+        return operation
+
+    def get(path_for):
+        def operation(index):
+            response = client().get(path_for(index))
+            response.get_data()  # consumir respuestas en streaming
+            return response.status_code in (200, 304)
+
+        return operation
+
+    def serial(index):
+        return serials[index % len(serials)]
+
+    return {
+        "http POST /api/save_sensor_data stm32": post(
+            "/api/save_sensor_data", lambda i: stm32_payload(rng, serial(i))
+        ),
+        "http POST /api/save_sensor_data heartbeat": post(
+            "/api/save_sensor_data", lambda i: heartbeat_payload(rng, serial(i))
+        ),
+        f"http POST /api/save_sensor_data/batch x{batch_size}": post(
+            "/api/save_sensor_data/batch",
+            lambda i: [
+                stm32_payload(rng, rng.choice(serials)) for _ in range(batch_size)
+            ],
+        ),
+        "http POST /api/short-circuit": post(
+            "/api/short-circuit", lambda i: short_circuits.next()
+        ),
+        "http GET /api/short-circuits": get(
+            lambda i: f"/api/short-circuits?page={i % 10 + 1}&per_page=10"
+        ),
+        "http GET /api/short-circuits?cursor": get(
+            lambda i: "/api/short-circuits?cursor=&per_page=10"
+        ),
+        "http GET /api/sensor_data/readings": get(
+            lambda i: f"/api/sensor_data/readings?serial_number={serial(i)}&limit=100"
+        ),
+        "http GET /api/sensor_data/aggregates": get(
+            lambda i: f"/api/sensor_data/aggregates?serial_number={serial(i)}"
+            f"&start={START.isoformat()}&end={datetime.utcnow().isoformat()}"
+        ),
+        "http GET /api/devices/latest": get(lambda i: "/api/devices/latest"),
+        "http GET /api/devices/status": get(lambda i: "/api/devices/status"),
+        "http GET /api/short-circuits/summary": get(
+            lambda i: "/api/short-circuits/summary"
+        ),
+    }
+
+
+def _compare(results: dict, baseline_path: str):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    print(f"\nComparación con {baseline_path} (p50 y throughput, + = mejor)")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        p50 = previous["latency_ms"]["p50"] / result["latency_ms"]["p50"] - 1
+        rps = result["throughput_rps"] / previous["throughput_rps"] - 1
+        print(f"{name:52s} p50 {p50 * 100:+7.1f}%  rps {rps * 100:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="./bench_api.db")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed-readings", type=int, default=20000)
+    parser.add_argument("--seed-short-circuits", type=int, default=2000)
+    parser.add_argument("--mode", choices=("service", "http", "both"), default="both")
+    parser.add_argument("--only", help="Solo escenarios que contengan este texto")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior a comparar")
+    args = parser.parse_args()
+
+    # La configuración se lee del entorno al importar core.config
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.database}"
+    os.environ["INGEST_ASYNC"] = "false"
+    logging.basicConfig(level=logging.CRITICAL)
+
+    import sqlalchemy
+    from core.config import engine
+    from main import app
+
+    rng = random.Random(args.random_seed)
+    serials = [f"SN{number:06d}" for number in range(args.devices)]
+    short_circuits = ShortCircuitSimulator(rng, max(1, args.devices // 5))
+    _seed(args, rng, serials, short_circuits)
+    counter = QueryCounter(engine)
+
+    scenarios = {}
+    if args.mode in ("service", "both"):
+        scenarios.update(
+            _service_scenarios(rng, serials, short_circuits, args.batch_size)
+        )
+    if args.mode in ("http", "both"):
+        scenarios.update(
+            _http_scenarios(app, rng, serials, short_circuits, args.batch_size)
+        )
+
+    results = {}
+    for name, operation in scenarios.items():
+        if args.only and args.only not in name:
+            continue
+        result = run_scenario(operation, args.requests, args.concurrency, counter)
+        results[name] = result
+        latency = result["latency_ms"]
+        print(
+            f"{name:52s} {result['throughput_rps']:8.1f} req/s  "
+            f"p50 {latency['p50']:7.2f}  p95 {latency['p95']:7.2f}  "
+            f"p99 {latency['p99']:7.2f} ms  "
+            f"{result['queries_per_request']:5.1f} SQL/op  "
+            f"{result['errors']} errores"
+        )
+
+    if args.baseline:
+        _compare(results, args.baseline)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {
+                    "args": vars(args),
+                    "started_at": datetime.utcnow().isoformat(),
+                    "python": platform.python_version(),
+                    "sqlalchemy": sqlalchemy.__version__,
+                    "results": results,
+                },
+                output,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark de exportación: NDJSON (/api/sensor_data/readings?format=ndjson)
+contra el formato columnar binario (/api/sensor_data/export) para las mismas
+filas. Mide bytes transferidos y tiempo de CPU del servidor. Uso:
+
+    python -m benchmarks.bench_export --readings 200000
+"""
+
+import argparse
+import json
+import os
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.bench_serialization import load_dataset
+from core.serialization import dumps
+from models.models import Base
+from services.columnar_export import decode_export, iter_export
+from services.consume_service import iter_energy_readings
+
+
+def _ndjson(engine) -> int:
+    size = 0
+    with Session(engine) as db:
+        for reading in iter_energy_readings(db):
+            size += len(dumps(reading) + b"\n")
+    return size
+
+
+def _columnar(engine, float_size: int) -> bytes:
+    with Session(engine) as db:
+        return b"".join(iter_export(db, float_size=float_size))
+
+
+def _timed(function):
+    started = time.process_time()
+    result = function()
+    return time.process_time() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="./bench_export.db")
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    engine = create_engine(f"sqlite:///{args.database}")
+    Base.metadata.create_all(engine)
+    load_dataset(engine, args.readings, args.devices)
+
+    results = {}
+    seconds, size = _timed(lambda: _ndjson(engine))
+    results["ndjson"] = {"cpu_seconds": seconds, "bytes": size}
+    for float_size in (4, 8):
+        seconds, body = _timed(lambda: _columnar(engine, float_size))
+        if len(decode_export(body)["created_at"]) != args.readings:
+            raise SystemExit("El flujo columnar no contiene todas las filas")
+        results[f"columnar_f{float_size * 8}"] = {
+            "cpu_seconds": seconds,
+            "bytes": len(body),
+        }
+
+    baseline = results["ndjson"]
+    for name, result in results.items():
+        print(
+            f"{name:14s} {result['bytes'] / 1e6:9.2f} MB "
+            f"({result['bytes'] / args.readings:6.1f} B/fila, "
+            f"x{baseline['bytes'] / result['bytes']:.1f})  "
+            f"{result['cpu_seconds']:7.2f} s CPU "
+            f"(x{baseline['cpu_seconds'] / result['cpu_seconds']:.1f})"
+        )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"args": vars(args), "results": results}, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark de índices para las consultas de series de tiempo.
+
+Genera un dataset sintético en SQLite sin índices secundarios, mide los planes
+de consulta y los tiempos de las consultas reales de la API, aplica la
+migración de índices y vuelve a medir. Uso:
+
+    python -m benchmarks.bench_indexes --readings 2000000 --devices 500
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, inspect, text
+
+from core.ids import uuid7
+from core.migrations import _0002_time_series_indexes
+from models.models import Base
+
+CHUNK_SIZE = 50000
+START = datetime(2024, 1, 1)
+
+QUERIES = {
+    "readings_device_range": (
+        "SELECT id, created_at FROM energy_readings "
+        "WHERE device_id = :device_id AND created_at >= :start AND created_at < :end "
+        "ORDER BY created_at DESC"
+    ),
+    "readings_latest_per_device": (
+        "SELECT device_id, MAX(created_at) FROM energy_readings GROUP BY device_id"
+    ),
+    "readings_page": (
+        "SELECT id, created_at FROM energy_readings "
+        "ORDER BY created_at DESC, id DESC LIMIT 100"
+    ),
+    "short_circuits_page": (
+        "SELECT id, timestamp FROM short_circuits "
+        "ORDER BY timestamp DESC, id DESC LIMIT 10"
+    ),
+    "short_circuits_by_mac": (
+        "SELECT id, timestamp FROM short_circuits "
+        "WHERE control_mac = :control_mac AND timestamp >= :start "
+        "ORDER BY timestamp DESC"
+    ),
+    "heartbeats_latest_per_device": (
+        "SELECT serial_number, MAX(timestamp) FROM device_alive GROUP BY serial_number"
+    ),
+}
+
+
+def _mac(number: int) -> str:
+    return ":".join(f"{b:02X}" for b in number.to_bytes(6, "big"))
+
+
+def load_dataset(engine, readings: int, devices: int, short_circuits: int, alive: int):
+    tables = Base.metadata.tables
+    device_ids = [uuid7() for _ in range(devices)]
+    span_seconds = 90 * 24 * 3600
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(tables["energy_devices"]),
+            [
+                {
+                    "id": device_id,
+                    "serial_number": f"SN{number:06d}",
+                    "firmware_version": "1.0.0",
+                    "created_at": START,
+                    "updated_at": START,
+                }
+                for number, device_id in enumerate(device_ids)
+            ],
+        )
+
+    def chunks(total, build):
+        for offset in range(0, total, CHUNK_SIZE):
+            with engine.begin() as connection:
+                rows = [
+                    build(n) for n in range(offset, min(offset + CHUNK_SIZE, total))
+                ]
+                connection.execute(insert(build.table), rows)
+
+    def reading(n):
+        return {
+            "id": uuid7(),
+            "device_id": device_ids[n % devices],
+            "alarm_status": "normal",
+            "switch_status": {},
+            "current_measurements": {"leakage": random.random(), "L1": 1.0},
+            "power_measurements": {"active_power_w": 100.0},
+            "voltage_measurements": {"L1_N": 230.0},
+            "raw_data": {},
+            "created_at": START + timedelta(seconds=random.randrange(span_seconds)),
+        }
+
+    def short_circuit(n):
+        return {
+            "control_mac": _mac(n % devices),
+            "wifi_mac": _mac(n % devices + 1),
+            "timestamp": START + timedelta(seconds=random.randrange(span_seconds)),
+            "current_active": bool(n % 2),
+            "current_duration_seconds": random.randrange(600),
+        }
+
+    def heartbeat(n):
+        return {
+            "id": uuid7(),
+            "device_name": "bench",
+            "mac_address": _mac(n % devices),
+            "serial_number": f"SN{n % devices:06d}",
+            "state_duration": random.randrange(600),
+            "timestamp": START + timedelta(seconds=random.randrange(span_seconds)),
+        }
+
+    reading.table = tables["energy_readings"]
+    short_circuit.table = tables["short_circuits"]
+    heartbeat.table = tables["device_alive"]
+
+    chunks(readings, reading)
+    chunks(short_circuits, short_circuit)
+    chunks(alive, heartbeat)
+    return device_ids
+
+
+def measure(engine, params: dict, repeat: int) -> dict:
+    explain = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    results = {}
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            plan = [
+                " ".join(str(value) for value in row)
+                for row in connection.execute(text(explain + sql), params)
+            ]
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                connection.execute(text(sql), params).fetchall()
+                timings.append(time.perf_counter() - started)
+            results[name] = {"plan": plan, "best_ms": min(timings) * 1000}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="./bench_indexes.db")
+    parser.add_argument("--readings", type=int, default=2000000)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--short-circuits", type=int, default=500000)
+    parser.add_argument("--alive", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    engine = create_engine(f"sqlite:///{args.database}")
+
+    # Esquema sin índices secundarios (como antes de la migración)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table_name in ("energy_readings", "short_circuits", "device_alive"):
+            for index in inspect(connection).get_indexes(table_name):
+                connection.execute(text(f"DROP INDEX {index['name']}"))
+
+    started = time.perf_counter()
+    device_ids = load_dataset(
+        engine, args.readings, args.devices, args.short_circuits, args.alive
+    )
+    print(f"Dataset cargado en {time.perf_counter() - started:.1f}s")
+
+    params = {
+        "device_id": device_ids[0].bytes,  # BinaryUUID guarda 16 bytes
+        "control_mac": _mac(0),
+        "start": START + timedelta(days=30),
+        "end": START + timedelta(days=37),
+    }
+
+    before = measure(engine, params, args.repeat)
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        _0002_time_series_indexes(connection)
+    print(f"Índices creados en {time.perf_counter() - started:.1f}s")
+    after = measure(engine, params, args.repeat)
+
+    for name in QUERIES:
+        speedup = before[name]["best_ms"] / max(after[name]["best_ms"], 1e-6)
+        print(f"\n{name}")
+        print(f"  antes:   {before[name]['best_ms']:10.2f} ms  {before[name]['plan']}")
+        print(f"  después: {after[name]['best_ms']:10.2f} ms  {after[name]['plan']}")
+        print(f"  mejora:  x{speedup:.1f}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"args": vars(args), "before": before, "after": after}, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark de serialización de lecturas.
+
+Compara, sobre un dataset sintético en SQLite:
+- Codificación: objetos ORM + to_dict() + json estándar (camino anterior)
+  contra filas proyectadas (services.serializers) + core.serialization.
+- Decodificación: json.loads estándar contra core.serialization.loads para un
+  lote de payloads stm32 (arreglo JSON y NDJSON).
+
+Uso:
+
+    python -m benchmarks.bench_serialization --readings 50000
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from core import serialization
+from core.ids import uuid7
+from models.models import Base, EnergyDevice, EnergyReading
+from services.measurements import split_reading
+from services.serializers import READING_COLUMNS, READING_WIDTH, reading_rows
+
+CHUNK_SIZE = 20000
+START = datetime(2024, 1, 1)
+
+
+def _payload(serial_number: str) -> dict:
+    return {
+        "stm32_details": {"serial_number": serial_number, "firmware_version": "1.0"},
+        "alarm_status": {"status": random.choice(("normal", "warning"))},
+        "ln_switch_status": {"L1": True, "L2": True, "L3": False, "N": True},
+        "currents": {
+            "leakage": random.random(),
+            "L1": random.uniform(0, 20),
+            "L2": random.uniform(0, 20),
+            "L3": random.uniform(0, 20),
+        },
+        "measurements": {
+            "cos_fi": random.random(),
+            "apparent_power_va": random.uniform(0, 5000),
+            "active_power_w": random.uniform(0, 5000),
+        },
+        "voltages": {
+            "L1_N": random.uniform(220, 240),
+            "L2_N": random.uniform(220, 240),
+            "L3_N": random.uniform(220, 240),
+            "L1_L2": random.uniform(380, 420),
+            "L1_L3": random.uniform(380, 420),
+            "L2_L3": random.uniform(380, 420),
+            "rms": {"L1": 230.1},
+        },
+    }
+
+
+def load_dataset(engine, readings: int, devices: int):
+    device_ids = [uuid7() for _ in range(devices)]
+    with engine.begin() as connection:
+        connection.execute(
+            insert(EnergyDevice.__table__),
+            [
+                {
+                    "id": device_id,
+                    "serial_number": f"SN{number:06d}",
+                    "firmware_version": "1.0",
+                    "created_at": START,
+                    "updated_at": START,
+                }
+                for number, device_id in enumerate(device_ids)
+            ],
+        )
+
+    for offset in range(0, readings, CHUNK_SIZE):
+        rows = []
+        for n in range(offset, min(offset + CHUNK_SIZE, readings)):
+            payload = _payload(f"SN{n % devices:06d}")
+            values = split_reading(
+                payload["voltages"],
+                payload["currents"],
+                payload["measurements"],
+                payload["ln_switch_status"],
+            )
+            values.update(
+                id=uuid7(),
+                device_id=device_ids[n % devices],
+                alarm_status=payload["alarm_status"]["status"],
+                raw_data={},
+                created_at=START + timedelta(seconds=n),
+            )
+            rows.append(values)
+        with engine.begin() as connection:
+            connection.execute(insert(EnergyReading.__table__), rows)
+
+
+def _best(function, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def encode_orm(engine) -> bytes:
+    # Camino anterior: hidratar objetos ORM, to_dict() y json estándar ordenado
+    with Session(engine) as db:
+        rows = db.execute(
+            select(EnergyReading, EnergyDevice.serial_number).join(
+                EnergyDevice, EnergyReading.device_id == EnergyDevice.id
+            )
+        ).all()
+        records = []
+        for reading, serial_number in rows:
+            result = reading.to_dict()
+            result["serial_number"] = serial_number
+            records.append(result)
+    return json.dumps({"data": records}, sort_keys=True).encode("utf-8")
+
+
+def encode_projected(engine) -> bytes:
+    with Session(engine) as db:
+        rows = db.execute(
+            select(*READING_COLUMNS, EnergyDevice.serial_number).join(
+                EnergyDevice, EnergyReading.device_id == EnergyDevice.id
+            )
+        ).all()
+        records = reading_rows(rows, serial_index=READING_WIDTH)
+    return serialization.dumps({"data": records}, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default="./bench_serialization.db")
+    parser.add_argument("--readings", type=int, default=50000)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    engine = create_engine(f"sqlite:///{args.database}")
+    Base.metadata.create_all(engine)
+    load_dataset(engine, args.readings, args.devices)
+    print(f"Backend JSON: {serialization.BACKEND}, {args.readings} lecturas")
+
+    results = {}
+    orm_seconds, orm_body = _best(lambda: encode_orm(engine), args.repeat)
+    projected_seconds, projected_body = _best(
+        lambda: encode_projected(engine), args.repeat
+    )
+    if json.loads(orm_body) != json.loads(projected_body):
+        raise SystemExit("Las salidas codificadas no coinciden")
+    results["encode_orm"] = orm_seconds
+    results["encode_projected"] = projected_seconds
+
+    payloads = [_payload(f"SN{n % args.devices:06d}") for n in range(args.readings)]
+    array_body = json.dumps(payloads).encode("utf-8")
+    ndjson_body = "\n".join(json.dumps(payload) for payload in payloads).encode("utf-8")
+    results["decode_array_json"], _ = _best(lambda: json.loads(array_body), args.repeat)
+    results["decode_array_backend"], _ = _best(
+        lambda: serialization.loads(array_body), args.repeat
+    )
+    results["decode_ndjson_json"], _ = _best(
+        lambda: [json.loads(line) for line in ndjson_body.splitlines()], args.repeat
+    )
+    results["decode_ndjson_backend"], _ = _best(
+        lambda: [serialization.loads(line) for line in ndjson_body.splitlines()],
+        args.repeat,
+    )
+
+    sizes = {
+        "encode": len(projected_body),
+        "decode_array": len(array_body),
+        "decode_ndjson": len(ndjson_body),
+    }
+    for name, seconds in results.items():
+        size = sizes[next(key for key in sizes if name.startswith(key))]
+        print(
+            f"{name:24s} {seconds * 1000:10.1f} ms "
+            f"{args.readings / seconds:12.0f} filas/s {size / seconds / 1e6:8.1f} MB/s"
+        )
+    for base, fast in (
+        ("encode_orm", "encode_projected"),
+        ("decode_array_json", "decode_array_backend"),
+        ("decode_ndjson_json", "decode_ndjson_backend"),
+    ):
+        print(f"mejora {fast}: x{results[base] / results[fast]:.1f}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"args": vars(args), "seconds": results}, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Compresión HTTP de requests y respuestas.
+
+- Requests: DecompressMiddleware descomprime los cuerpos con Content-Encoding
+  gzip, deflate o zstd antes de que Flask los lea, en bloques y cortando al
+  superar REQUEST_MAX_DECOMPRESSED_BYTES (protección contra bombas de
+  descompresión). Los handlers reciben el JSON sin cambios.
+- Respuestas: init_app comprime según Accept-Encoding las respuestas de más
+  de COMPRESSION_MIN_BYTES. Las respuestas en streaming se comprimen bloque a
+  bloque sin armarlas completas; los eventos SSE no se comprimen para no
+  retrasarlos.
+
+zstd requiere el paquete zstandard; sin él solo se usan gzip y deflate.
+"""
+
+import json
+import zlib
+from http import HTTPStatus
+from io import BytesIO
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+
+from core.config import (
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_BYTES,
+    COMPRESSION_LEVEL,
+    REQUEST_MAX_DECOMPRESSED_BYTES,
+)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Preferencia del servidor ante calidades iguales en Accept-Encoding
+ENCODINGS = (("zstd",) if zstandard is not None else ()) + ("gzip", "deflate")
+_ALIASES = {"x-gzip": "gzip"}
+
+# Tipos que no se comprimen: ya comprimidos o que deben llegar sin demora
+_SKIP_MIMETYPES = ("text/event-stream", "application/gzip", "application/zip")
+_SKIP_PREFIXES = ("image/", "video/", "audio/")
+
+
+class DecompressionError(ValueError):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _zlib_decompressor(encoding: str, first_bytes: bytes):
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # "deflate" debería ser formato zlib, pero algunos clientes envían
+    # deflate crudo: se distingue por la cabecera zlib
+    if (
+        len(first_bytes) >= 2
+        and first_bytes[0] & 0x0F == 8
+        and (first_bytes[0] << 8 | first_bytes[1]) % 31 == 0
+    ):
+        return zlib.decompressobj(zlib.MAX_WBITS)
+    return zlib.decompressobj(-zlib.MAX_WBITS)
+
+
+def decompress_stream(stream, encoding: str, limit: int) -> bytes:
+    """
+    Lee y descomprime stream en bloques. Lanza DecompressionError si el
+    resultado supera limit bytes o los datos están dañados.
+    """
+    too_large = DecompressionError(
+        f"El cuerpo descomprimido supera {limit} bytes", status=413
+    )
+    if encoding == "zstd":
+        if zstandard is None:
+            raise DecompressionError("zstd no está disponible", status=415)
+        output = bytearray()
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(stream)
+            while True:
+                chunk = reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                output += chunk
+                if len(output) > limit:
+                    raise too_large
+        except zstandard.ZstdError as e:
+            raise DecompressionError(f"Cuerpo zstd inválido: {e}")
+        return bytes(output)
+
+    output = bytearray()
+    decompressor = None
+    try:
+        while True:
+            data = stream.read(CHUNK_SIZE)
+            if not data:
+                break
+            if decompressor is None:
+                decompressor = _zlib_decompressor(encoding, data)
+            while data and not decompressor.eof:
+                # max_length acota cada paso: nunca se expande más del límite
+                output += decompressor.decompress(data, limit - len(output) + 1)
+                if len(output) > limit:
+                    raise too_large
+                data = decompressor.unconsumed_tail
+        if decompressor is None:
+            return b""
+        output += decompressor.flush()
+    except zlib.error as e:
+        raise DecompressionError(f"Cuerpo {encoding} inválido: {e}")
+    if len(output) > limit:
+        raise too_large
+    if not decompressor.eof:
+        raise DecompressionError(f"Cuerpo {encoding} incompleto")
+    return bytes(output)
+
+
+class DecompressMiddleware:
+    """
+    Middleware WSGI: reemplaza el cuerpo comprimido por el descomprimido y
+    quita Content-Encoding, así que Flask y los handlers no notan la diferencia.
+    """
+
+    def __init__(self, wsgi_app, limit: int = REQUEST_MAX_DECOMPRESSED_BYTES):
+        self.wsgi_app = wsgi_app
+        self.limit = limit
+
+    def __call__(self, environ, start_response):
+        header = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        encodings = [
+            _ALIASES.get(value.strip(), value.strip())
+            for value in header.split(",")
+            if value.strip() and value.strip() != "identity"
+        ]
+        if not encodings:
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            if len(encodings) > 1:
+                raise DecompressionError(
+                    "Solo se admite una Content-Encoding", status=415
+                )
+            encoding = encodings[0]
+            if encoding not in ("gzip", "deflate", "zstd"):
+                raise DecompressionError(
+                    f"Content-Encoding no soportada: {encoding}", status=415
+                )
+            # El cuerpo comprimido tampoco puede superar el límite
+            stream = get_input_stream(environ, max_content_length=self.limit)
+            body = decompress_stream(stream, encoding, self.limit)
+        except DecompressionError as e:
+            return _error(start_response, e.status, str(e))
+        except RequestEntityTooLarge:
+            return _error(start_response, 413, f"El cuerpo supera {self.limit} bytes")
+
+        environ.pop("HTTP_CONTENT_ENCODING", None)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        environ["wsgi.input"] = BytesIO(body)
+        environ["wsgi.input_terminated"] = False
+        return self.wsgi_app(environ, start_response)
+
+
+def _error(start_response, status: int, message: str):
+    body = json.dumps({"status": "error", "message": message}).encode("utf-8")
+    start_response(
+        f"{status} {HTTPStatus(status).phrase}",
+        [("Content-Type", "application/json"), ("Content-Length", str(len(body)))],
+    )
+    return [body]
+
+
+def _compressor(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=min(COMPRESSION_LEVEL, 19)).compressobj()
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, wbits)
+
+
+def _compress_chunks(chunks, encoding: str):
+    """
+    Comprime un iterable de bloques a medida que se consume.
+    """
+    compressor = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _compressible(response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if "Content-Encoding" in response.headers or response.direct_passthrough:
+        return False
+    mimetype = response.mimetype or ""
+    return mimetype not in _SKIP_MIMETYPES and not mimetype.startswith(_SKIP_PREFIXES)
+
+
+def init_app(app):
+    """
+    Registra la descompresión de requests y la compresión de respuestas.
+    """
+    from flask import request
+
+    if not COMPRESSION_ENABLED:
+        return
+    app.wsgi_app = DecompressMiddleware(app.wsgi_app)
+
+    @app.after_request
+    def _compress_response(response):
+        if request.method == "HEAD" or not _compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compress_chunks(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESSION_MIN_BYTES:
+                return response
+            compressor = _compressor(encoding)
+            response.set_data(compressor.compress(data) + compressor.flush())
+        response.headers["Content-Encoding"] = encoding
+        # Otra representación del mismo recurso: el ETag pasa a ser débil
+        # (If-None-Match se compara en forma débil, así que el 304 se mantiene)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -1,21 +1,228 @@
 import os
-from sqlalchemy import create_engine
+from functools import partial
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from core.pool import InstrumentedQueuePool, instrument_engine
+from core.metrics import instrument_queries, instrument_sessions
+from core.replicas import ReplicaRouter
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./site.db")
+# Réplicas de lectura (URLs separadas por comas): los GET leen de ellas en
+# round-robin y vuelven al primario si ninguna responde
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# Segundos entre verificaciones (SELECT 1) de cada réplica
+DB_REPLICA_CHECK_INTERVAL_SECONDS = float(
+    os.getenv("DB_REPLICA_CHECK_INTERVAL_SECONDS", 5)
+)
 
-# Crear el engine y el sessionmaker
-engine = create_engine(DATABASE_URL)
-# engine = create_engine(DATABASE_URL)
+# Pool de conexiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Tiempo máximo por sentencia en milisegundos (0 = sin límite)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+
+# Métricas (/metrics) y log de lentitud (logger eneraq.slow; 0 = desactivado)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 500))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+
+
+def _engine_options(url: str) -> dict:
+    """
+    Opciones de create_engine según el backend.
+    SQLite en memoria usa su pool por defecto (una conexión por hilo).
+    """
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    database_url = make_url(url)
+    if database_url.get_backend_name() == "sqlite" and database_url.database in (
+        None,
+        "",
+        ":memory:",
+    ):
+        return options
+    options.update(
+        {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+    )
+    return options
+
+
+def _set_statement_timeout(backend, dbapi_connection, connection_record):
+    """
+    Aplica DB_STATEMENT_TIMEOUT_MS a cada conexión nueva (MySQL y PostgreSQL).
+    """
+    if backend == "mysql":
+        statement = f"SET SESSION MAX_EXECUTION_TIME = {DB_STATEMENT_TIMEOUT_MS}"
+    elif backend == "postgresql":
+        statement = f"SET statement_timeout = {DB_STATEMENT_TIMEOUT_MS}"
+    else:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(statement)
+    cursor.close()
+
+
+def _create_engine(url: str):
+    """
+    Engine con el pool, el timeout por sentencia y las métricas configurados.
+    """
+    new_engine = create_engine(url, **_engine_options(url))
+    instrument_engine(new_engine)
+    if DB_STATEMENT_TIMEOUT_MS:
+        event.listen(
+            new_engine,
+            "connect",
+            partial(_set_statement_timeout, new_engine.dialect.name),
+        )
+    if METRICS_ENABLED:
+        instrument_queries(new_engine, slow_query_ms=SLOW_QUERY_MS)
+    return new_engine
+
+
+# Engine primario compartido por la aplicación y los workers (escrituras)
+engine = _create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if METRICS_ENABLED:
+    instrument_sessions(SessionLocal)
+# Lecturas de los GET (ver core.session.read_bind)
+replica_router = ReplicaRouter(
+    engine,
+    [_create_engine(url) for url in DATABASE_REPLICA_URLS],
+    DB_REPLICA_CHECK_INTERVAL_SECONDS,
+)
+
+# Caché de dispositivos (serial_number -> id)
+DEVICE_CACHE_MAX_SIZE = int(os.getenv("DEVICE_CACHE_MAX_SIZE", 10000))
+
+# Conteo de cortocircuitos: segundos entre resincronizaciones con COUNT(*)
+SHORT_CIRCUIT_COUNT_TTL_SECONDS = float(
+    os.getenv("SHORT_CIRCUIT_COUNT_TTL_SECONDS", 300)
+)
+
+# Almacenamiento del payload crudo de lecturas: json, compressed o none
+RAW_DATA_STORAGE = os.getenv("RAW_DATA_STORAGE", "json")
+
+# Retención (días; 0 = conservar indefinidamente) y archivo
+RETENTION_READINGS_DAYS = int(os.getenv("RETENTION_READINGS_DAYS", 90))
+RETENTION_ROLLUP_1M_DAYS = int(os.getenv("RETENTION_ROLLUP_1M_DAYS", 30))
+RETENTION_ROLLUP_1H_DAYS = int(os.getenv("RETENTION_ROLLUP_1H_DAYS", 730))
+RETENTION_ROLLUP_1D_DAYS = int(os.getenv("RETENTION_ROLLUP_1D_DAYS", 0))
+RETENTION_DEVICE_ALIVE_DAYS = int(os.getenv("RETENTION_DEVICE_ALIVE_DAYS", 7))
+RETENTION_SHORT_CIRCUITS_DAYS = int(os.getenv("RETENTION_SHORT_CIRCUITS_DAYS", 0))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "./archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 1000))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", 0.05))
+
+# Presencia de dispositivos (heartbeats)
+# Un heartbeat tras más de PRESENCE_GAP_SECONDS sin noticias cuenta como reconexión
+PRESENCE_GAP_SECONDS = int(os.getenv("PRESENCE_GAP_SECONDS", 120))
+# Un dispositivo sin heartbeats por más de este tiempo se considera offline
+PRESENCE_OFFLINE_AFTER_SECONDS = int(os.getenv("PRESENCE_OFFLINE_AFTER_SECONDS", 120))
+# Registrar todos los heartbeats en device_alive (comportamiento anterior)
+HEARTBEAT_LOG_ALL = os.getenv("HEARTBEAT_LOG_ALL", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Caché de la última lectura por dispositivo: segundos antes de releer la tabla
+# (para incluir lecturas ingresadas por otros procesos)
+LATEST_READINGS_TTL_SECONDS = float(os.getenv("LATEST_READINGS_TTL_SECONDS", 5))
+
+# Eventos en tiempo real (SSE / long-poll)
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", 10000))
+EVENT_STREAM_KEEPALIVE_SECONDS = float(os.getenv("EVENT_STREAM_KEEPALIVE_SECONDS", 15))
+EVENT_POLL_MAX_WAIT_SECONDS = float(os.getenv("EVENT_POLL_MAX_WAIT_SECONDS", 30))
+
+# Exportación columnar: filas por bloque (y por lote del cursor)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 10000))
+
+# Análisis de calidad de energía: umbrales por defecto
+ANALYTICS_NOMINAL_VOLTAGE = float(os.getenv("ANALYTICS_NOMINAL_VOLTAGE", 230))
+ANALYTICS_VOLTAGE_TOLERANCE = float(os.getenv("ANALYTICS_VOLTAGE_TOLERANCE", 0.1))
+ANALYTICS_LEAKAGE_LIMIT = float(os.getenv("ANALYTICS_LEAKAGE_LIMIT", 30))
+ANALYTICS_POWER_FACTOR_MIN = float(os.getenv("ANALYTICS_POWER_FACTOR_MIN", 0.9))
+# Corriente máxima por fase (0 = no evaluar)
+ANALYTICS_CURRENT_LIMIT = float(os.getenv("ANALYTICS_CURRENT_LIMIT", 0))
+# Huecos más largos que esto no se integran al calcular la energía
+ANALYTICS_MAX_GAP_SECONDS = float(os.getenv("ANALYTICS_MAX_GAP_SECONDS", 300))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", 50000))
+ANALYTICS_MAX_WINDOW_DAYS = int(os.getenv("ANALYTICS_MAX_WINDOW_DAYS", 366))
+
+# Idempotencia de la ingesta: claves recientes recordadas en memoria y si se
+# derivan claves (dispositivo + timestamp + hash) cuando no llega el header
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 100000))
+IDEMPOTENCY_DERIVED_KEYS = (
+    os.getenv("IDEMPOTENCY_DERIVED_KEYS", "true").lower() == "true"
+)
+
+# Caché de respuestas de lectura: memory (por proceso) o redis (compartida).
+# Las escrituras la invalidan; el TTL acota lo que tardan en verse las de
+# otros procesos con el backend en memoria
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 30))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Compresión HTTP: cuerpos de request con Content-Encoding gzip/deflate/zstd
+# (límite al descomprimir) y respuestas según Accept-Encoding
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 6))
+REQUEST_MAX_DECOMPRESSED_BYTES = int(
+    os.getenv("REQUEST_MAX_DECOMPRESSED_BYTES", 16 * 1024 * 1024)
+)
+
+# Detección de anomalías en la ingesta (ventana deslizante por dispositivo)
+ANOMALY_DETECTION = os.getenv("ANOMALY_DETECTION", "true").lower() == "true"
+ANOMALY_WINDOW_SIZE = int(os.getenv("ANOMALY_WINDOW_SIZE", 60))
+# Muestras mínimas en la ventana antes de evaluar desvíos
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", 20))
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", 0.2))
+ANOMALY_ZSCORE = float(os.getenv("ANOMALY_ZSCORE", 4))
+# Desviaciones (de la EWMA) sobre la media para considerar que la fuga crece
+ANOMALY_CREEP_SIGMA = float(os.getenv("ANOMALY_CREEP_SIGMA", 3))
+# Desviaciones de la tasa de cambio habitual para alertar un salto
+ANOMALY_RATE_ZSCORE = float(os.getenv("ANOMALY_RATE_ZSCORE", 6))
+ANOMALY_MAX_DEVICES = int(os.getenv("ANOMALY_MAX_DEVICES", 10000))
+
+# Serialización JSON: auto (orjson si está instalado), orjson o json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+
+# Ingesta por lotes
+INGEST_BATCH_MAX_ITEMS = int(os.getenv("INGEST_BATCH_MAX_ITEMS", 5000))
+
+# Ingesta asíncrona (write-behind): los POST encolan y responden 202
+INGEST_ASYNC = os.getenv("INGEST_ASYNC", "false").lower() in ("1", "true", "yes")
+INGEST_QUEUE_MAX_SIZE = int(os.getenv("INGEST_QUEUE_MAX_SIZE", 10000))
+INGEST_FLUSH_BATCH_SIZE = int(os.getenv("INGEST_FLUSH_BATCH_SIZE", 500))
+INGEST_FLUSH_INTERVAL_SECONDS = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", 0.5))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
 
 
 # Flask settings
 class Config:
-    SQLALCHEMY_DATABASE_URI = DATABASE_URL
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "1234567890123456")
     JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES", 3600))
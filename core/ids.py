@@ -0,0 +1,97 @@
+"""
+Identificadores ordenados por tiempo y su tipo de columna.
+
+uuid7 genera UUID versión 7 (RFC 9562): 48 bits de milisegundos desde epoch
+seguidos de bits aleatorios, por lo que las claves nuevas se insertan al final
+del índice en lugar de en posiciones al azar. BinaryUUID los guarda en 16
+bytes en todos los backends: uuid nativo en PostgreSQL, BINARY(16) en MySQL y
+BLOB en SQLite.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.types import TypeDecorator
+
+_lock = threading.Lock()
+_last_millis = 0
+_sequence = 0
+
+
+def uuid7() -> uuid.UUID:
+    """
+    UUID versión 7. Dentro de un mismo milisegundo los 12 bits rand_a se usan
+    como contador (empezando en un valor al azar), así que los ids generados
+    por el proceso son estrictamente crecientes.
+    """
+    global _last_millis, _sequence
+    with _lock:
+        millis = time.time_ns() // 1_000_000
+        if millis > _last_millis:
+            _last_millis = millis
+            _sequence = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            # Mismo milisegundo (o reloj atrasado): seguir desde el último
+            _sequence += 1
+            if _sequence > 0xFFF:
+                _last_millis += 1
+                _sequence = 0
+            millis = _last_millis
+        sequence = _sequence
+
+    value = (millis & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76  # versión
+    value |= sequence << 64
+    value |= 0x2 << 62  # variante RFC 4122
+    value |= int.from_bytes(os.urandom(8), "big") & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=value)
+
+
+def uuid7_time(value: uuid.UUID) -> float:
+    """
+    Segundos desde epoch codificados en un UUID versión 7.
+    """
+    return (value.int >> 80) / 1000
+
+
+class BinaryUUID(TypeDecorator):
+    """
+    uuid.UUID guardado en 16 bytes. Al leer también acepta el texto
+    hexadecimal de las filas anteriores a la migración 10.
+    """
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(mysql.BINARY(16))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = (
+                uuid.UUID(bytes=bytes(value))
+                if isinstance(value, (bytes, bytearray, memoryview))
+                else uuid.UUID(str(value))
+            )
+        return value if dialect.name == "postgresql" else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, str):
+            return uuid.UUID(value)
+        return uuid.UUID(bytes=bytes(value))
+
+    @property
+    def python_type(self):
+        return uuid.UUID
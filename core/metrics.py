@@ -0,0 +1,334 @@
+"""
+Métricas en proceso con exposición en formato de texto de Prometheus.
+
+Histogramas y contadores con etiquetas, alimentados por:
+- los eventos del engine (instrument_queries): duración de cada sentencia,
+  filas insertadas por tabla y log de consultas lentas;
+- los eventos de las sesiones: duración de los commits (incluye el flush);
+- los hooks de Flask (init_app): latencia, tamaño del payload y consultas por
+  request para cada ruta, y log de requests lentos.
+
+Con varios procesos cada uno expone sus propias métricas.
+"""
+
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+SLOW_STATEMENT_MAX_CHARS = 2000
+
+slow_log = logging.getLogger("eneraq.slow")
+
+_INSERT_TABLE = re.compile(r"^\s*INSERT\s+(?:\w+\s+)*?INTO\s+[`\"]?(\w+)", re.I)
+
+
+class Metric:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(names, values) -> str:
+        if not names:
+            return ""
+        pairs = ",".join(
+            f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+        )
+        return "{" + pairs + "}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, tuple(label_names))
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{self._labels(self.label_names, labels)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Histograma acumulativo con buckets fijos: observar cuesta una búsqueda
+    binaria y un incremento.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, tuple(label_names))
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # conteos por bucket (+Inf al final), suma y cantidad
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        names = self.label_names + ("le",)
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _number(bound)
+                yield (
+                    f"{self.name}_bucket{self._labels(names, labels + (le,))} "
+                    f"{cumulative}"
+                )
+            suffix = self._labels(self.label_names, labels)
+            yield f"{self.name}_sum{suffix} {total}"
+            yield f"{self.name}_count{suffix} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def counter(self, name, help_text, label_names=()) -> Counter:
+        metric = Counter(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple]]):
+        """
+        collector() retorna tuplas (nombre, tipo, ayuda, valor) o
+        (nombre, tipo, ayuda, {etiquetas: valor}) leídas al exponer.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            try:
+                collected = list(collector())
+            except Exception as e:
+                logging.error(f"Metrics collector error: {e}")
+                continue
+            for name, kind, help_text, value in collected:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if isinstance(value, dict):
+                    for labels, sample in value.items():
+                        pairs = ",".join(
+                            f'{key}="{_escape(str(label))}"' for key, label in labels
+                        )
+                        lines.append(f"{name}{{{pairs}}} {_number(sample)}")
+                else:
+                    lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "eneraq_http_request_duration_seconds",
+    "Latencia de los requests por ruta (hasta generar la respuesta)",
+    ("method", "route", "status"),
+)
+http_request_bytes = registry.histogram(
+    "eneraq_http_request_size_bytes",
+    "Tamaño del cuerpo de los requests por ruta",
+    ("method", "route"),
+    SIZE_BUCKETS,
+)
+http_request_queries = registry.histogram(
+    "eneraq_http_request_queries",
+    "Sentencias SQL por request",
+    ("method", "route"),
+    COUNT_BUCKETS,
+)
+http_request_db_seconds = registry.histogram(
+    "eneraq_http_request_db_seconds",
+    "Tiempo en la base de datos por request",
+    ("method", "route"),
+)
+db_query_seconds = registry.histogram(
+    "eneraq_db_query_duration_seconds",
+    "Duración de las sentencias SQL por operación",
+    ("operation",),
+    QUERY_BUCKETS,
+)
+db_commit_seconds = registry.histogram(
+    "eneraq_db_commit_duration_seconds",
+    "Duración de los commits de sesión (incluye el flush)",
+)
+db_rows_inserted = registry.counter(
+    "eneraq_db_rows_inserted_total",
+    "Filas insertadas por tabla",
+    ("table",),
+)
+db_slow_queries = registry.counter(
+    "eneraq_db_slow_queries_total",
+    "Sentencias que superaron SLOW_QUERY_MS",
+)
+db_pool_wait_seconds = registry.histogram(
+    "eneraq_db_pool_wait_seconds",
+    "Espera por una conexión libre del pool",
+    buckets=QUERY_BUCKETS,
+)
+
+
+class _RequestStats(threading.local):
+    active = False
+    queries = 0
+    db_seconds = 0.0
+
+
+_request_stats = _RequestStats()
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+        return "SELECT" if word == "WITH" else word
+    return "OTHER"
+
+
+def instrument_queries(engine, slow_query_ms: float = 0):
+    """
+    Mide cada sentencia del engine. Las que superan slow_query_ms (0 = no
+    registrar) se escriben en el logger eneraq.slow con su texto y duración.
+    """
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        operation = _operation(statement)
+        db_query_seconds.observe(elapsed, operation)
+        if _request_stats.active:
+            _request_stats.queries += 1
+            _request_stats.db_seconds += elapsed
+        if operation == "INSERT" and cursor.rowcount and cursor.rowcount > 0:
+            match = _INSERT_TABLE.match(statement)
+            db_rows_inserted.inc(
+                match.group(1) if match else "unknown", amount=cursor.rowcount
+            )
+        if slow_query_ms and elapsed * 1000 >= slow_query_ms:
+            db_slow_queries.inc()
+            batch = f" x{len(parameters)}" if executemany else ""
+            slow_log.warning(
+                f"Slow query {elapsed * 1000:.1f} ms{batch}: "
+                f"{' '.join(statement.split())[:SLOW_STATEMENT_MAX_CHARS]}"
+            )
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+
+
+def instrument_sessions(session_factory):
+    """
+    Mide la duración de cada commit de las sesiones creadas por la fábrica.
+    """
+
+    def before_commit(session):
+        session.info["metrics_commit_started"] = time.perf_counter()
+
+    def after_commit(session):
+        started = session.info.pop("metrics_commit_started", None)
+        if started is not None:
+            db_commit_seconds.observe(time.perf_counter() - started)
+
+    event.listen(session_factory, "before_commit", before_commit)
+    event.listen(session_factory, "after_commit", after_commit)
+
+
+def init_app(app, slow_request_ms: float = 0):
+    """
+    Registra los hooks de Flask que miden cada request. Los que superan
+    slow_request_ms (0 = no registrar) se escriben en el logger eneraq.slow.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        _request_stats.active = True
+        _request_stats.queries = 0
+        _request_stats.db_seconds = 0.0
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        method = request.method
+        queries = _request_stats.queries
+        db_seconds = _request_stats.db_seconds
+        _request_stats.active = False
+
+        http_request_seconds.observe(elapsed, method, route, response.status_code)
+        http_request_queries.observe(queries, method, route)
+        http_request_db_seconds.observe(db_seconds, method, route)
+        if request.content_length:
+            http_request_bytes.observe(request.content_length, method, route)
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            slow_log.warning(
+                f"Slow request {method} {request.full_path.rstrip('?')} "
+                f"-> {response.status_code} en {elapsed * 1000:.1f} ms "
+                f"({queries} consultas, {db_seconds * 1000:.1f} ms en la base)"
+            )
+        return response
+
+
+def render_metrics() -> str:
+    return registry.render()
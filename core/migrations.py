@@ -0,0 +1,354 @@
+"""
+Migraciones de esquema versionadas.
+
+Cada migración es una función idempotente que recibe una conexión abierta
+dentro de una transacción. Las versiones aplicadas se registran en la tabla
+schema_migrations. Uso:
+
+    python -m core.migrations            # aplica las pendientes
+    python -m core.migrations --status   # muestra el estado
+"""
+
+import argparse
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.dialects import mysql
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from core.ids import BinaryUUID
+from models.models import Base
+
+_migration_metadata = MetaData()
+
+# Nombre (MySQL) y clave (PostgreSQL) del lock que serializa las migraciones
+MIGRATION_LOCK_NAME = "eneraq_migrations"
+MIGRATION_LOCK_KEY = 0x656E6572  # "ener"
+MIGRATION_LOCK_TIMEOUT_SECONDS = 300
+
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_missing_indexes(connection: Connection, table_name: str):
+    """
+    Crea los índices declarados en el modelo que aún no existen en la tabla.
+    Los índices sobre columnas que todavía no existen se omiten: los crea la
+    migración que agrega esas columnas.
+    """
+    table = Base.metadata.tables[table_name]
+    inspector = inspect(connection)
+    existing = {index["name"] for index in inspector.get_indexes(table_name)}
+    columns = {column["name"] for column in inspector.get_columns(table_name)}
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        if all(column.name in columns for column in index.columns):
+            index.create(connection)
+
+
+def _add_missing_columns(connection: Connection, table_name: str):
+    """
+    Agrega (como columnas nulas) las columnas declaradas en el modelo que aún
+    no existen en la tabla.
+    """
+    table = Base.metadata.tables[table_name]
+    existing = {
+        column["name"] for column in inspect(connection).get_columns(table_name)
+    }
+    preparer = connection.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(
+            text(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {preparer.format_column(column)} {column_type}"
+            )
+        )
+
+
+def _uuid_bytes(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return uuid.UUID(str(value)).bytes
+
+
+def _convert_uuid_columns(connection: Connection):
+    """
+    Pasa las columnas BinaryUUID de texto hexadecimal a 16 bytes conservando
+    los valores; los ids nuevos ya se generan con uuid7. En PostgreSQL el tipo
+    uuid nativo ya ocupa 16 bytes. Es idempotente.
+    """
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        return
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    targets = [
+        (table, column)
+        for table in Base.metadata.sorted_tables
+        if table.name in existing
+        for column in table.columns
+        if isinstance(column.type, BinaryUUID)
+    ]
+
+    if dialect == "sqlite":
+        # SQLite guarda el BLOB aunque el tipo declarado sea el anterior
+        connection.connection.dbapi_connection.create_function(
+            "uuid_bytes", 1, _uuid_bytes, deterministic=True
+        )
+        for table, column in targets:
+            name = preparer.format_column(column)
+            connection.execute(
+                text(
+                    f"UPDATE {preparer.format_table(table)} "
+                    f"SET {name} = uuid_bytes({name}) WHERE typeof({name}) = 'text'"
+                )
+            )
+        return
+
+    # MySQL: CHAR(32) -> VARBINARY (mismos bytes) -> UNHEX -> BINARY(16); las
+    # claves foráneas se desactivan mientras padre e hijos tienen tipos distintos
+    connection.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+    try:
+        for table, column in targets:
+            current = {
+                info["name"]: info["type"] for info in inspector.get_columns(table.name)
+            }[column.name]
+            if isinstance(current, (mysql.BINARY, mysql.VARBINARY)):
+                continue
+            table_name = preparer.format_table(table)
+            name = preparer.format_column(column)
+            null = "NULL" if column.nullable else "NOT NULL"
+            connection.execute(
+                text(f"ALTER TABLE {table_name} MODIFY {name} VARBINARY(36) {null}")
+            )
+            connection.execute(
+                text(
+                    f"UPDATE {table_name} SET {name} = UNHEX(REPLACE({name}, '-', '')) "
+                    f"WHERE LENGTH({name}) > 16"
+                )
+            )
+            connection.execute(
+                text(f"ALTER TABLE {table_name} MODIFY {name} BINARY(16) {null}")
+            )
+    finally:
+        connection.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+
+
+def _0001_initial_schema(connection: Connection):
+    Base.metadata.create_all(connection)
+
+
+def _0002_time_series_indexes(connection: Connection):
+    for table_name in ("energy_readings", "short_circuits", "device_alive"):
+        _create_missing_indexes(connection, table_name)
+
+
+def _0003_energy_reading_rollups(connection: Connection):
+    Base.metadata.tables["energy_reading_rollups"].create(connection, checkfirst=True)
+
+
+def _0004_typed_reading_columns(connection: Connection):
+    _add_missing_columns(connection, "energy_readings")
+
+
+def _0005_device_presence(connection: Connection):
+    Base.metadata.tables["device_presence"].create(connection, checkfirst=True)
+    _add_missing_columns(connection, "device_alive")
+
+
+def _0006_device_latest_readings(connection: Connection):
+    from services.latest_reading_service import backfill_latest_readings
+
+    Base.metadata.tables["device_latest_readings"].create(connection, checkfirst=True)
+    with Session(bind=connection) as db:
+        backfill_latest_readings(db)
+
+
+def _0007_short_circuit_incidents(connection: Connection):
+    from services.incident_service import rebuild_incidents
+
+    for table_name in (
+        "short_circuit_incidents",
+        "short_circuit_summaries",
+        "short_circuit_daily_stats",
+    ):
+        Base.metadata.tables[table_name].create(connection, checkfirst=True)
+    with Session(bind=connection) as db:
+        rebuild_incidents(db)
+
+
+def _0008_anomaly_alerts(connection: Connection):
+    Base.metadata.tables["anomaly_alerts"].create(connection, checkfirst=True)
+
+
+def _0009_idempotency_keys(connection: Connection):
+    for table_name in ("energy_readings", "short_circuits"):
+        _add_missing_columns(connection, table_name)
+        _create_missing_indexes(connection, table_name)
+
+
+def _0010_binary_uuid_keys(connection: Connection):
+    _convert_uuid_columns(connection)
+
+
+MIGRATIONS = [
+    (1, "Esquema inicial", _0001_initial_schema),
+    (2, "Índices para consultas de series de tiempo", _0002_time_series_indexes),
+    (3, "Rollups de lecturas por minuto, hora y día", _0003_energy_reading_rollups),
+    (4, "Columnas tipadas de mediciones en lecturas", _0004_typed_reading_columns),
+    (5, "Estado actual de dispositivos y log de cambios", _0005_device_presence),
+    (6, "Última lectura por dispositivo", _0006_device_latest_readings),
+    (7, "Incidentes y contadores de cortocircuitos", _0007_short_circuit_incidents),
+    (8, "Alertas de anomalías", _0008_anomaly_alerts),
+    (9, "Claves de idempotencia de la ingesta", _0009_idempotency_keys),
+    (10, "Ids UUID en 16 bytes binarios", _0010_binary_uuid_keys),
+]
+
+
+def applied_versions(connection: Connection) -> set:
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+@contextmanager
+def migration_lock(engine: Engine, timeout: float = MIGRATION_LOCK_TIMEOUT_SECONDS):
+    """
+    Lock a nivel de base de datos mientras se aplican las migraciones, para
+    que varios procesos (por ejemplo, los workers de gunicorn al arrancar) no
+    las apliquen a la vez: GET_LOCK en MySQL, pg_advisory_lock en PostgreSQL y
+    un lock de archivo junto a la base en SQLite. Lanza TimeoutError si no se
+    obtiene en timeout segundos.
+    """
+    dialect = engine.dialect.name
+    if dialect == "mysql":
+        with engine.connect() as connection:
+            acquired = connection.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {"name": MIGRATION_LOCK_NAME, "timeout": int(timeout)},
+            ).scalar()
+            if acquired != 1:
+                raise TimeoutError("No se obtuvo el lock de migraciones")
+            try:
+                yield
+            finally:
+                connection.execute(
+                    text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME}
+                )
+    elif dialect == "postgresql":
+        with engine.connect() as connection:
+            connection.execute(
+                text("SELECT set_config('lock_timeout', :timeout, false)"),
+                {"timeout": f"{int(timeout * 1000)}ms"},
+            )
+            try:
+                connection.execute(
+                    text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+                )
+            except OperationalError:
+                raise TimeoutError("No se obtuvo el lock de migraciones")
+            # El lock es de sesión: se libera a mano antes de devolver la conexión
+            connection.commit()
+            try:
+                yield
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY}
+                )
+                connection.execute(text("RESET lock_timeout"))
+                connection.commit()
+    elif dialect == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        import fcntl
+
+        with open(f"{engine.url.database}.migrate.lock", "a") as lock_file:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("No se obtuvo el lock de migraciones")
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+def run_migrations(engine: Engine) -> list:
+    """
+    Aplica en orden las migraciones pendientes, cada una en su transacción,
+    bajo migration_lock: los procesos que esperan el lock encuentran las
+    migraciones ya aplicadas. Retorna las versiones aplicadas.
+    """
+    with migration_lock(engine):
+        return _apply_pending(engine)
+
+
+def _apply_pending(engine: Engine) -> list:
+    applied = []
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            logging.info(f"Aplicando migración {version}: {description}")
+            migrate(connection)
+            connection.execute(
+                schema_migrations.insert().values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.utcnow(),
+                )
+            )
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    from core.config import engine
+
+    parser = argparse.ArgumentParser(description="Migraciones de esquema de EneraQ")
+    parser.add_argument("--status", action="store_true", help="Solo mostrar estado")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        with engine.begin() as connection:
+            done = applied_versions(connection)
+        for version, description, _ in MIGRATIONS:
+            state = "aplicada" if version in done else "pendiente"
+            print(f"{version:04d} {state:9} {description}")
+    else:
+        versions = run_migrations(engine)
+        print(f"Migraciones aplicadas: {versions or 'ninguna'}")
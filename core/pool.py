@@ -0,0 +1,95 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from core.metrics import db_pool_wait_seconds
+
+
+class PoolMetrics:
+    """
+    Contadores del pool de conexiones: checkouts, tiempo de espera y timeouts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "invalidations": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def count(self, key: str, amount=1):
+        with self._lock:
+            self._values[key] += amount
+
+    def record_wait(self, seconds: float):
+        db_pool_wait_seconds.observe(seconds)
+        with self._lock:
+            self._values["wait_seconds_total"] += seconds
+            if seconds > self._values["wait_seconds_max"]:
+                self._values["wait_seconds_max"] = seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = dict(self._values)
+        checkouts = values["checkouts"]
+        values["wait_seconds_avg"] = (
+            values["wait_seconds_total"] / checkouts if checkouts else 0.0
+        )
+        return values
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool que mide cuánto espera cada checkout por una conexión libre.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.count("timeouts")
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    """
+    Registra los eventos del pool que alimentan pool_metrics.
+    """
+    event.listen(engine, "connect", lambda *args: pool_metrics.count("connects"))
+    event.listen(engine, "checkout", lambda *args: pool_metrics.count("checkouts"))
+    event.listen(engine, "checkin", lambda *args: pool_metrics.count("checkins"))
+    event.listen(
+        engine, "invalidate", lambda *args: pool_metrics.count("invalidations")
+    )
+
+
+def pool_status(engine) -> dict:
+    """
+    Estado actual del pool más los contadores acumulados.
+    """
+    pool = engine.pool
+    status = pool_metrics.snapshot()
+    if isinstance(pool, QueuePool):
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            }
+        )
+    return status
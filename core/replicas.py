@@ -0,0 +1,106 @@
+"""
+Ruteo de lecturas a réplicas.
+
+ReplicaRouter reparte las lecturas entre los engines de réplica en
+round-robin. Una réplica que falla (desconexión o error al conectar) se
+marca caída y se vuelve a probar con SELECT 1 cada check_interval segundos;
+si ninguna está disponible se lee del primario.
+"""
+
+import logging
+import threading
+import time
+from typing import List
+
+from sqlalchemy import event, text
+
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = True
+        self.checked_at = float("-inf")  # se verifica en el primer uso
+        self.failures = 0
+        self.reads = 0
+
+
+class ReplicaRouter:
+    def __init__(self, primary, replicas: List, check_interval: float = 5):
+        self.primary = primary
+        self.check_interval = check_interval
+        self.replicas = [Replica(engine) for engine in replicas]
+        self._next = 0
+        self._fallbacks = 0
+        self._lock = threading.Lock()
+        for replica in self.replicas:
+            event.listen(replica.engine, "handle_error", self._on_error(replica))
+
+    def _on_error(self, replica: Replica):
+        def handle_error(context):
+            # Solo los errores de conexión sacan a la réplica de la rotación
+            if context.is_disconnect or context.connection is None:
+                self._mark_down(replica, context.original_exception)
+
+        return handle_error
+
+    def _mark_down(self, replica: Replica, error):
+        with self._lock:
+            if replica.healthy:
+                logging.error(f"Read replica {replica.engine.url!r} down: {error}")
+            replica.healthy = False
+            replica.failures += 1
+            replica.checked_at = time.monotonic()
+
+    def _check(self, replica: Replica) -> bool:
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception as e:
+            self._mark_down(replica, e)
+            return False
+        with self._lock:
+            if not replica.healthy:
+                logging.info(f"Read replica {replica.engine.url!r} back up")
+            replica.healthy = True
+        return True
+
+    def read_engine(self):
+        """
+        Engine para la próxima lectura: la siguiente réplica disponible o el
+        primario si no hay ninguna.
+        """
+        count = len(self.replicas)
+        for _ in range(count):
+            with self._lock:
+                replica = self.replicas[self._next % count]
+                self._next += 1
+                due = time.monotonic() - replica.checked_at >= self.check_interval
+                if due:
+                    # Solo un hilo verifica la réplica por intervalo
+                    replica.checked_at = time.monotonic()
+                healthy = replica.healthy
+            if due:
+                healthy = self._check(replica)
+            if healthy:
+                with self._lock:
+                    replica.reads += 1
+                return replica.engine
+        if count:
+            with self._lock:
+                self._fallbacks += 1
+        return self.primary
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "replicas": [
+                    {
+                        "url": replica.engine.url.render_as_string(hide_password=True),
+                        "healthy": replica.healthy,
+                        "reads": replica.reads,
+                        "failures": replica.failures,
+                    }
+                    for replica in self.replicas
+                ],
+                "primary_fallbacks": self._fallbacks,
+            }
@@ -0,0 +1,277 @@
+"""
+Caché de respuestas de los endpoints de lectura.
+
+Cada entrada se guarda bajo la ruta, los parámetros de la URL y la generación
+actual de los espacios de los que depende (SHORT_CIRCUITS, SENSOR_DATA). Las
+escrituras llaman a bump() después del commit: la generación cambia y las
+entradas anteriores dejan de encontrarse (se descartan por LRU o TTL).
+
+Backends:
+- MemoryBackend (por defecto): LRU acotado por entradas y bytes, por proceso.
+  Las escrituras de otros procesos solo se ven al vencer el TTL.
+- RedisBackend: compartido entre procesos (generaciones incluidas). Recibe
+  cualquier cliente con get/set/mget/incr, por lo que en pruebas se puede
+  reemplazar con un equivalente local mediante use_backend().
+
+Las respuestas llevan ETag (hash del cuerpo) y Last-Modified, y se responden
+con 304 cuando el cliente ya tiene la versión vigente.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import wraps
+from typing import NamedTuple, Optional
+
+from flask import Response, make_response, request
+
+from core.config import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_URL,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_BYTES,
+)
+from core.serialization import dumps, loads
+from core.session import read_your_writes
+
+# Espacios de invalidación
+SHORT_CIRCUITS = "short_circuits"
+SENSOR_DATA = "sensor_data"
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    mimetype: str
+    etag: str
+    created_at: float
+
+    def encode(self) -> bytes:
+        header = dumps(
+            {
+                "mimetype": self.mimetype,
+                "etag": self.etag,
+                "created_at": self.created_at,
+            }
+        )
+        return header + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, value: bytes) -> "CacheEntry":
+        header, body = bytes(value).split(b"\n", 1)
+        header = loads(header)
+        return cls(body, header["mimetype"], header["etag"], header["created_at"])
+
+
+class MemoryBackend:
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # clave -> (vence, CacheEntry)
+        self._bytes = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, entry: CacheEntry, ttl: float):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + ttl, entry)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: str):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[1].body)
+
+    def generations(self, namespaces) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(name, 0) for name in namespaces)
+
+    def bump(self, namespace: str):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class RedisBackend:
+    """
+    Backend compartido. El tamaño lo acota la política maxmemory del servidor.
+    """
+
+    def __init__(self, client, prefix: str = "eneraq:cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        value = self.client.get(self.prefix + key)
+        return CacheEntry.decode(value) if value is not None else None
+
+    def set(self, key: str, entry: CacheEntry, ttl: float):
+        self.client.set(self.prefix + key, entry.encode(), ex=max(int(ttl), 1))
+
+    def generations(self, namespaces) -> tuple:
+        values = self.client.mget([f"{self.prefix}gen:{name}" for name in namespaces])
+        return tuple(int(value or 0) for value in values)
+
+    def bump(self, namespace: str):
+        self.client.incr(f"{self.prefix}gen:{namespace}")
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def _default_backend():
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return MemoryBackend()
+    if RESPONSE_CACHE_BACKEND == "redis":
+        try:
+            import redis
+        except ImportError:  # pragma: no cover - depende del entorno
+            raise ImportError("RESPONSE_CACHE_BACKEND=redis requiere el paquete redis")
+        return RedisBackend(redis.Redis.from_url(RESPONSE_CACHE_URL))
+    raise ValueError("RESPONSE_CACHE_BACKEND debe ser memory o redis")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        backend=None,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+    ):
+        self.backend = backend or _default_backend()
+        self.ttl = ttl
+        self.enabled = enabled
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def use_backend(self, backend):
+        self.backend = backend
+
+    def bump(self, *namespaces: str):
+        """
+        Invalida las respuestas que dependen de los espacios indicados.
+        Se llama después del commit de la escritura.
+        """
+        for namespace in namespaces:
+            self.backend.bump(namespace)
+
+    def key(self, namespaces, path: str, args) -> str:
+        # La generación se lee antes de consultar la base: si una escritura
+        # confirma en el medio, la respuesta queda bajo la generación anterior
+        generations = self.backend.generations(namespaces)
+        params = "&".join(
+            f"{name}={value}"
+            for name in sorted(args)
+            for value in sorted(args.getlist(name))
+        )
+        version = ".".join(str(generation) for generation in generations)
+        return f"{path}?{params}#{version}"
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.backend.get(key)
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return entry
+
+    def store(self, key: str, response: Response, ttl: float = None) -> CacheEntry:
+        body = response.get_data()
+        entry = CacheEntry(
+            body,
+            response.mimetype,
+            hashlib.blake2b(body, digest_size=16).hexdigest(),
+            time.time(),
+        )
+        self.backend.set(key, entry, ttl or self.ttl)
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            stats = {
+                "enabled": self.enabled,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
+        stats.update(self.backend.stats())
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def _respond(entry: CacheEntry) -> Response:
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.headers["Last-Modified"] = formatdate(entry.created_at, usegmt=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def cached_response(*namespaces: str, ttl: float = None):
+    """
+    Decorador de vistas GET: sirve la respuesta desde la caché mientras no
+    cambie la generación de los espacios indicados. Solo se guardan las
+    respuestas 200; Cache-Control: no-cache o X-Read-Your-Writes en el request
+    fuerzan la consulta.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return view(*args, **kwargs)
+
+            key = response_cache.key(namespaces, request.path, request.args)
+            # read-your-writes también saltea la caché: pudo llenarse desde
+            # una réplica atrasada
+            fresh = request.cache_control.no_cache or read_your_writes()
+            entry = None if fresh else response_cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = response_cache.store(key, response, ttl)
+            return _respond(entry)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,108 @@
+"""
+Capa de serialización JSON.
+
+Usa orjson cuando está instalado (JSON_BACKEND=auto u orjson) y el módulo json
+estándar en caso contrario. Ambos backends producen la misma salida: datetime
+en ISO 8601 y UUID como texto, por lo que los serializadores pueden entregar
+los valores nativos sin convertirlos campo por campo.
+"""
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from core.config import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+if JSON_BACKEND not in ("auto", "orjson", "json"):
+    raise ValueError("JSON_BACKEND debe ser auto, orjson o json")
+if JSON_BACKEND == "orjson" and orjson is None:
+    raise ImportError("JSON_BACKEND=orjson requiere el paquete orjson")
+
+BACKEND = "orjson" if orjson is not None and JSON_BACKEND != "json" else "json"
+
+
+def _default(value):
+    """
+    Tipos que el backend no serializa por sí mismo.
+    """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """
+    Serializa a JSON compacto en UTF-8.
+    """
+    if BACKEND == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, default=_default, option=option)
+    return json.dumps(
+        value,
+        default=_default,
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+    ).encode("utf-8")
+
+
+def loads(data):
+    """
+    Deserializa JSON desde str o bytes. Los errores son json.JSONDecodeError
+    (ValueError) con ambos backends.
+    """
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask (jsonify y request.get_json) sobre dumps/loads.
+    Conserva el orden de claves y el formato legible en modo debug de Flask.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(
+            obj,
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+            indent=bool(kwargs.get("indent")),
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = dumps(obj, sort_keys=self.sort_keys, indent=indent) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """
+    Instala FastJSONProvider en la aplicación.
+    """
+    app.json = FastJSONProvider(app)
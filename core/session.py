@@ -0,0 +1,47 @@
+from flask import g, request
+
+from core.config import SessionLocal, engine, replica_router
+
+# Header con el que un request pide leer del primario (read-your-writes)
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+READ_METHODS = ("GET", "HEAD")
+
+
+def read_your_writes() -> bool:
+    """
+    True si el request actual pidió leer del primario.
+    """
+    value = request.headers.get(READ_YOUR_WRITES_HEADER, "")
+    return value.lower() in ("1", "true", "yes")
+
+
+def read_bind():
+    """
+    Engine del request actual: una réplica para los GET (salvo que pidan
+    read-your-writes) y el primario para el resto.
+    """
+    if request.method in READ_METHODS and not read_your_writes():
+        return replica_router.read_engine()
+    return engine
+
+
+def get_db():
+    """
+    Sesión de base de datos del request actual.
+    Se crea en el primer uso y se cierra al terminar el request (init_app).
+    """
+    if "db" not in g:
+        g.db = SessionLocal(bind=read_bind())
+    return g.db
+
+
+def close_db(exception=None):
+    db = g.pop("db", None)
+    if db is not None:
+        if exception is not None:
+            db.rollback()
+        db.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -1,14 +1,12 @@
-from flask_sqlalchemy import SQLAlchemy
 from routes.consume_routes import consume_bp
 from routes.short_circuit_routes import short_circuit_bp
-from core.config import Config, engine
-from flask_jwt_extended import (
-    JWTManager,
-    create_access_token,
-    jwt_required,
-    get_jwt_identity,
-)
-from models.models import Base
+from routes.events_routes import events_bp
+from routes.analytics_routes import analytics_bp
+from routes.metrics_routes import metrics_bp
+from core.config import Config, engine, METRICS_ENABLED, SLOW_REQUEST_MS
+from flask_jwt_extended import JWTManager
+from core.migrations import run_migrations
+from core import session, serialization, metrics, compression
 
 from flask import Flask
 
@@ -18,11 +16,20 @@ app.config.from_object(Config)
 jwt = JWTManager(app)
 app.register_blueprint(consume_bp)
 app.register_blueprint(short_circuit_bp)
+app.register_blueprint(events_bp)
+app.register_blueprint(analytics_bp)
+app.register_blueprint(metrics_bp)
 
-db = SQLAlchemy(app)
+session.init_app(app)
+serialization.init_app(app)
+compression.init_app(app)
+if METRICS_ENABLED:
+    metrics.init_app(app, slow_request_ms=SLOW_REQUEST_MS)
 
+# Cada worker llama a run_migrations; el lock de la base hace que solo uno
+# las aplique
 with app.app_context():
-    Base.metadata.create_all(engine)
+    run_migrations(engine)
 
 
 if __name__ == "__main__":
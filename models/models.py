@@ -1,8 +1,27 @@
 from sqlalchemy.orm import declarative_base, relationship
-import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Boolean, Integer
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    Column,
+    String,
+    Date,
+    DateTime,
+    ForeignKey,
+    JSON,
+    Boolean,
+    Integer,
+    Index,
+    Float,
+    LargeBinary,
+)
+from core.ids import BinaryUUID, uuid7
 from datetime import datetime
+from services.measurements import (
+    VOLTAGE_FIELDS,
+    CURRENT_FIELDS,
+    POWER_FIELDS,
+    SWITCH_FIELDS,
+    join_fields,
+    decompress_payload,
+)
 
 Base = declarative_base()
 
@@ -10,12 +29,20 @@ Base = declarative_base()
 class DeviceAlive(Base):
     __tablename__ = "device_alive"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(BinaryUUID, primary_key=True, default=uuid7)
     device_name = Column(String(100), nullable=False)
     mac_address = Column(String(17), unique=False, nullable=False)
     serial_number = Column(String(100), unique=False, nullable=False)
     state_duration = Column(Integer, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    # Motivo del registro: first_seen, state_change, reconnect o heartbeat
+    event = Column(String(20), nullable=True)
+
+    __table_args__ = (
+        # Heartbeats por dispositivo en un rango de tiempo / último heartbeat
+        Index("ix_device_alive_serial_timestamp", "serial_number", "timestamp"),
+        Index("ix_device_alive_timestamp", "timestamp"),
+    )
 
     def to_dict(self):
         """
@@ -28,13 +55,47 @@ class DeviceAlive(Base):
             "serial_number": self.serial_number,
             "state_duration": self.state_duration,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
+            "event": self.event,
+        }
+
+
+class DevicePresence(Base):
+    """
+    Último estado conocido de cada dispositivo que envía heartbeats.
+    Se actualiza en cada heartbeat; los cambios se registran en device_alive.
+    """
+
+    __tablename__ = "device_presence"
+
+    serial_number = Column(String(100), primary_key=True)
+    device_name = Column(String(100), nullable=False)
+    mac_address = Column(String(17), nullable=False)
+    state_duration = Column(Integer, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    online_since = Column(DateTime, nullable=False)
+    heartbeat_count = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        """
+        Convierte el objeto DevicePresence a un diccionario.
+        """
+        return {
+            "serial_number": self.serial_number,
+            "device_name": self.device_name,
+            "mac_address": self.mac_address,
+            "state_duration": self.state_duration,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "online_since": (
+                self.online_since.isoformat() if self.online_since else None
+            ),
+            "heartbeat_count": self.heartbeat_count,
         }
 
 
 class EnergyDevice(Base):
     __tablename__ = "energy_devices"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(BinaryUUID, primary_key=True, default=uuid7)
     serial_number = Column(String(100), unique=True, nullable=False)
     firmware_version = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -70,13 +131,32 @@ class EnergyDevice(Base):
 class EnergyReading(Base):
     __tablename__ = "energy_readings"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    device_id = Column(
-        UUID(as_uuid=True), ForeignKey("energy_devices.id"), nullable=False
-    )
+    id = Column(BinaryUUID, primary_key=True, default=uuid7)
+    device_id = Column(BinaryUUID, ForeignKey("energy_devices.id"), nullable=False)
 
     # Componentes principales de la lectura
     alarm_status = Column(String(50), nullable=False)  # normal, warning, critical
+
+    # Mediciones tipadas (extraídas del payload en save_sensor_data)
+    voltage_l1 = Column(Float, nullable=True)
+    voltage_l2 = Column(Float, nullable=True)
+    voltage_l3 = Column(Float, nullable=True)
+    voltage_l1_l2 = Column(Float, nullable=True)
+    voltage_l1_l3 = Column(Float, nullable=True)
+    voltage_l2_l3 = Column(Float, nullable=True)
+    current_l1 = Column(Float, nullable=True)
+    current_l2 = Column(Float, nullable=True)
+    current_l3 = Column(Float, nullable=True)
+    leakage_current = Column(Float, nullable=True)
+    active_power_w = Column(Float, nullable=True)
+    apparent_power_va = Column(Float, nullable=True)
+    cos_fi = Column(Float, nullable=True)
+    switch_l1 = Column(Boolean, nullable=True)
+    switch_l2 = Column(Boolean, nullable=True)
+    switch_l3 = Column(Boolean, nullable=True)
+    switch_n = Column(Boolean, nullable=True)
+
+    # Campos no reconocidos de cada grupo (los conocidos van en las columnas)
     switch_status = Column(
         JSON, nullable=False
     )  # {L1: false, L2: false, L3: false, N: false}
@@ -88,12 +168,24 @@ class EnergyReading(Base):
     )  # {cos_fi: 0, apparent_power_va: 0, active_power_w: 0}
     voltage_measurements = Column(JSON, nullable=False)
 
-    # Datos crudos completos
+    # Datos crudos completos: JSON, comprimidos o vacíos según RAW_DATA_STORAGE
     raw_data = Column(JSON, nullable=False)
+    raw_data_compressed = Column(LargeBinary, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Clave de idempotencia (services/idempotency.py); nula si no hay
+    idempotency_key = Column(String(32), nullable=True)
 
     device = relationship("EnergyDevice", back_populates="energy_readings")
 
+    __table_args__ = (
+        # Lecturas por dispositivo en un rango de tiempo / última lectura
+        Index("ix_energy_readings_device_created", "device_id", "created_at", "id"),
+        # Listados globales ordenados por (created_at, id)
+        Index("ix_energy_readings_created", "created_at", "id"),
+        # Rechaza reintentos de un mismo payload
+        Index("uq_energy_readings_idempotency_key", "idempotency_key", unique=True),
+    )
+
     def to_dict(self, include_device: bool = False, include_raw_data: bool = False):
         """
         Convierte el objeto EnergyReading a un diccionario.
@@ -106,10 +198,16 @@ class EnergyReading(Base):
             "id": str(self.id),
             "device_id": str(self.device_id),
             "alarm_status": self.alarm_status,
-            "switch_status": self.switch_status,
-            "current_measurements": self.current_measurements,
-            "power_measurements": self.power_measurements,
-            "voltage_measurements": self.voltage_measurements,
+            "switch_status": join_fields(self, SWITCH_FIELDS, self.switch_status),
+            "current_measurements": join_fields(
+                self, CURRENT_FIELDS, self.current_measurements
+            ),
+            "power_measurements": join_fields(
+                self, POWER_FIELDS, self.power_measurements
+            ),
+            "voltage_measurements": join_fields(
+                self, VOLTAGE_FIELDS, self.voltage_measurements
+            ),
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
@@ -120,10 +218,79 @@ class EnergyReading(Base):
             }
 
         if include_raw_data:
-            result["raw_data"] = self.raw_data
+            result["raw_data"] = self.raw_payload()
 
         return result
 
+    def raw_payload(self):
+        """
+        Devuelve el payload crudo, descomprimiéndolo si se guardó comprimido.
+        """
+        if self.raw_data_compressed is not None:
+            return decompress_payload(self.raw_data_compressed)
+        return self.raw_data
+
+
+class DeviceLatestReading(Base):
+    """
+    Proyección con la última lectura de cada dispositivo, actualizada en la
+    ingesta. reading guarda la lectura ya serializada (EnergyReading.to_dict).
+    """
+
+    __tablename__ = "device_latest_readings"
+
+    device_id = Column(BinaryUUID, ForeignKey("energy_devices.id"), primary_key=True)
+    serial_number = Column(String(100), nullable=False)
+    reading_id = Column(BinaryUUID, nullable=False)
+    alarm_status = Column(String(50), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    reading = Column(JSON, nullable=False)
+
+
+class EnergyReadingRollup(Base):
+    """
+    Agregados por dispositivo y ventana de tiempo (1m, 1h, 1d) de las lecturas.
+    Por cada métrica se guardan count, sum, min y max para poder combinar
+    buckets y calcular promedios.
+    """
+
+    __tablename__ = "energy_reading_rollups"
+
+    device_id = Column(BinaryUUID, ForeignKey("energy_devices.id"), primary_key=True)
+    granularity = Column(String(2), primary_key=True)  # 1m, 1h, 1d
+    bucket_start = Column(DateTime, primary_key=True)
+    sample_count = Column(Integer, nullable=False, default=0)
+
+    # Voltaje fase-neutro promedio de las tres fases
+    voltage_count = Column(Integer, nullable=False, default=0)
+    voltage_sum = Column(Float, nullable=False, default=0)
+    voltage_min = Column(Float, nullable=True)
+    voltage_max = Column(Float, nullable=True)
+
+    # Corriente promedio de las tres fases
+    current_count = Column(Integer, nullable=False, default=0)
+    current_sum = Column(Float, nullable=False, default=0)
+    current_min = Column(Float, nullable=True)
+    current_max = Column(Float, nullable=True)
+
+    # Corriente de fuga
+    leakage_count = Column(Integer, nullable=False, default=0)
+    leakage_sum = Column(Float, nullable=False, default=0)
+    leakage_min = Column(Float, nullable=True)
+    leakage_max = Column(Float, nullable=True)
+
+    # Potencia activa (W)
+    active_power_count = Column(Integer, nullable=False, default=0)
+    active_power_sum = Column(Float, nullable=False, default=0)
+    active_power_min = Column(Float, nullable=True)
+    active_power_max = Column(Float, nullable=True)
+
+    # Factor de potencia
+    cos_fi_count = Column(Integer, nullable=False, default=0)
+    cos_fi_sum = Column(Float, nullable=False, default=0)
+    cos_fi_min = Column(Float, nullable=True)
+    cos_fi_max = Column(Float, nullable=True)
+
 
 class ShortCircuit(Base):
     __tablename__ = "short_circuits"
@@ -137,6 +304,17 @@ class ShortCircuit(Base):
     previous_active = Column(Boolean, nullable=True)
     previous_timestamp = Column(DateTime, nullable=True)
     previous_duration_seconds = Column(Integer, nullable=True)
+    # Clave de idempotencia (services/idempotency.py); nula si no hay
+    idempotency_key = Column(String(32), nullable=True)
+
+    __table_args__ = (
+        # Listados ordenados por (timestamp, id)
+        Index("ix_short_circuits_timestamp", "timestamp", "id"),
+        # Eventos por control_mac en un rango de tiempo
+        Index("ix_short_circuits_control_mac_timestamp", "control_mac", "timestamp"),
+        # Rechaza reintentos de un mismo evento
+        Index("uq_short_circuits_idempotency_key", "idempotency_key", unique=True),
+    )
 
     def to_dict(self):
         """
@@ -155,3 +333,158 @@ class ShortCircuit(Base):
             ),
             "previous_duration_seconds": self.previous_duration_seconds,
         }
+
+
+class ShortCircuitIncident(Base):
+    """
+    Incidente de cortocircuito: eventos consecutivos de un control_mac desde que
+    se activa hasta que se normaliza. ended_at es None mientras sigue abierto.
+    """
+
+    __tablename__ = "short_circuit_incidents"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    control_mac = Column(String(17), nullable=False)
+    wifi_mac = Column(String(17), nullable=True)
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Integer, nullable=True)
+    event_count = Column(Integer, nullable=False, default=0)
+    # Ids de short_circuits (sin clave foránea: la retención puede borrarlos)
+    start_event_id = Column(Integer, nullable=True)
+    end_event_id = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_short_circuit_incidents_control_mac_started",
+            "control_mac",
+            "started_at",
+        ),
+    )
+
+    def to_dict(self):
+        """
+        Convierte el objeto ShortCircuitIncident a un diccionario.
+        """
+        return {
+            "id": self.id,
+            "control_mac": self.control_mac,
+            "wifi_mac": self.wifi_mac,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "ended_at": self.ended_at.isoformat() if self.ended_at else None,
+            "duration_seconds": self.duration_seconds,
+            "event_count": self.event_count,
+            "start_event_id": self.start_event_id,
+            "end_event_id": self.end_event_id,
+        }
+
+
+class ShortCircuitSummary(Base):
+    """
+    Contadores acumulados por control_mac, actualizados con cada evento.
+    """
+
+    __tablename__ = "short_circuit_summaries"
+
+    control_mac = Column(String(17), primary_key=True)
+    wifi_mac = Column(String(17), nullable=True)
+    trips = Column(Integer, nullable=False, default=0)
+    # Segundos en cortocircuito de los incidentes cerrados
+    active_seconds_total = Column(Integer, nullable=False, default=0)
+    # Segundos normales entre el fin de un incidente y el inicio del siguiente
+    uptime_seconds_total = Column(Integer, nullable=False, default=0)
+    first_trip_at = Column(DateTime, nullable=True)
+    last_trip_at = Column(DateTime, nullable=True)
+    last_cleared_at = Column(DateTime, nullable=True)
+    open_incident_id = Column(Integer, nullable=True)
+    event_count = Column(Integer, nullable=False, default=0)
+    last_event_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        """
+        Convierte el objeto ShortCircuitSummary a un diccionario, incluyendo el
+        MTBF (tiempo medio normal entre incidentes, en segundos).
+        """
+        return {
+            "control_mac": self.control_mac,
+            "wifi_mac": self.wifi_mac,
+            "trips": self.trips,
+            "active_seconds_total": self.active_seconds_total,
+            "mtbf_seconds": (
+                self.uptime_seconds_total / (self.trips - 1) if self.trips > 1 else None
+            ),
+            "active": self.open_incident_id is not None,
+            "open_incident_id": self.open_incident_id,
+            "first_trip_at": (
+                self.first_trip_at.isoformat() if self.first_trip_at else None
+            ),
+            "last_trip_at": (
+                self.last_trip_at.isoformat() if self.last_trip_at else None
+            ),
+            "last_cleared_at": (
+                self.last_cleared_at.isoformat() if self.last_cleared_at else None
+            ),
+            "event_count": self.event_count,
+            "last_event_at": (
+                self.last_event_at.isoformat() if self.last_event_at else None
+            ),
+        }
+
+
+class ShortCircuitDailyStats(Base):
+    """
+    Incidentes y segundos en cortocircuito por control_mac y día (UTC) de inicio
+    del incidente, para responder ventanas de tiempo sin recorrer los eventos.
+    """
+
+    __tablename__ = "short_circuit_daily_stats"
+
+    control_mac = Column(String(17), primary_key=True)
+    day = Column(Date, primary_key=True)
+    trips = Column(Integer, nullable=False, default=0)
+    active_seconds = Column(Integer, nullable=False, default=0)
+
+
+class AnomalyAlert(Base):
+    """
+    Alerta generada en la ingesta por el detector de anomalías
+    (services/anomaly_detector.py).
+    """
+
+    __tablename__ = "anomaly_alerts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(BinaryUUID, ForeignKey("energy_devices.id"), nullable=False)
+    serial_number = Column(String(100), nullable=False)
+    # Sin clave foránea: la retención puede borrar la lectura
+    reading_id = Column(BinaryUUID, nullable=True)
+    metric = Column(String(50), nullable=False)
+    kind = Column(String(50), nullable=False)
+    value = Column(Float, nullable=False)
+    reference = Column(Float, nullable=True)  # media móvil o umbral superado
+    zscore = Column(Float, nullable=True)
+    rate_per_second = Column(Float, nullable=True)
+    detected_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_anomaly_alerts_serial_detected", "serial_number", "detected_at"),
+        Index("ix_anomaly_alerts_detected", "detected_at", "id"),
+    )
+
+    def to_dict(self):
+        """
+        Convierte el objeto AnomalyAlert a un diccionario.
+        """
+        return {
+            "id": self.id,
+            "device_id": str(self.device_id),
+            "serial_number": self.serial_number,
+            "reading_id": str(self.reading_id) if self.reading_id else None,
+            "metric": self.metric,
+            "kind": self.kind,
+            "value": self.value,
+            "reference": self.reference,
+            "zscore": self.zscore,
+            "rate_per_second": self.rate_per_second,
+            "detected_at": self.detected_at.isoformat() if self.detected_at else None,
+        }
@@ -0,0 +1,97 @@
+from flask import Blueprint, request, jsonify
+from services.analytics_service import get_power_quality, default_thresholds
+from services.alert_service import get_alerts
+from core.config import ANALYTICS_MAX_WINDOW_DAYS
+from core.session import get_db
+from services.timestamps import parse_timestamp
+from datetime import datetime, timedelta
+import logging
+
+analytics_bp = Blueprint("analytics", __name__)
+
+
+@analytics_bp.route("/api/analytics/power_quality", methods=["GET"])
+def get_power_quality_route():
+    """
+    Calidad de energía de un dispositivo: desequilibrio de fases, factor de
+    potencia, energía (kWh), tendencia de la corriente de fuga y cruces de
+    umbral. Parámetros: serial_number, start, end (por defecto el último día) y,
+    opcionalmente, cualquiera de los umbrales de default_thresholds().
+    """
+    try:
+        serial_number = request.args.get("serial_number")
+        if not serial_number:
+            raise ValueError("serial_number es requerido")
+
+        end = parse_timestamp(request.args.get("end")) or datetime.utcnow()
+        start = parse_timestamp(request.args.get("start")) or end - timedelta(days=1)
+        if start >= end:
+            raise ValueError("start debe ser anterior a end")
+        if end - start > timedelta(days=ANALYTICS_MAX_WINDOW_DAYS):
+            raise ValueError(
+                f"La ventana no puede superar {ANALYTICS_MAX_WINDOW_DAYS} días"
+            )
+
+        thresholds = {}
+        for name in default_thresholds():
+            value = request.args.get(name)
+            if value is not None:
+                try:
+                    thresholds[name] = float(value)
+                except ValueError:
+                    raise ValueError(f"{name} debe ser numérico")
+
+        db = get_db()
+        result, error = get_power_quality(db, serial_number, start, end, thresholds)
+
+        if error:
+            logging.error(f"Analytics error: {error}")
+            return jsonify({"status": "error", "message": error}), 500
+
+        return jsonify({"status": "success", "data": result}), 200
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@analytics_bp.route("/api/alerts", methods=["GET"])
+def get_alerts_route():
+    """
+    Alertas de anomalías detectadas en la ingesta, de la más reciente a la más
+    antigua. Filtros opcionales: serial_number, kind, start, end y limit.
+    """
+    try:
+        start = parse_timestamp(request.args.get("start"))
+        end = parse_timestamp(request.args.get("end"))
+        limit = request.args.get("limit", 100, type=int)
+        if limit < 1 or limit > 1000:
+            raise ValueError("limit debe estar entre 1 y 1000")
+
+        db = get_db()
+        result, error = get_alerts(
+            db,
+            serial_number=request.args.get("serial_number"),
+            kind=request.args.get("kind"),
+            start=start,
+            end=end,
+            limit=limit,
+        )
+
+        if error:
+            logging.error(f"Alerts error: {error}")
+            return jsonify({"status": "error", "message": error}), 500
+
+        return jsonify({"status": "success", "data": result}), 200
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
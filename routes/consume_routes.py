@@ -1,10 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from services.consume_service import (
+    reading_key,
     save_sensor_data,
+    save_sensor_data_batch,
+    validate_sensor_data,
     get_all_energy_devices_with_readings,
+    get_energy_readings_page,
+    iter_energy_readings,
 )
-from core.config import SessionLocal
+from services.ingest_queue import ingest_queue, SENSOR_DATA
+from services.rollup_service import get_rollup_series
+from services.presence_service import get_fleet_status
+from services.latest_reading_service import (
+    get_latest_readings,
+    latest_readings_etag,
+)
+from services.device_registry import device_registry
+from services.idempotency import HEADER, DuplicateRequest, recent_keys
+from services.anomaly_detector import anomaly_detector
+from services.columnar_export import iter_export, MIMETYPE as COLUMNAR_MIMETYPE
+from services.timestamps import parse_timestamp
+from core.config import (
+    SessionLocal,
+    INGEST_BATCH_MAX_ITEMS,
+    INGEST_ASYNC,
+    engine,
+    replica_router,
+)
+from core.pool import pool_status
+from core.serialization import dumps, loads
+from core.session import get_db, read_bind
+from core.response_cache import cached_response, response_cache, SENSOR_DATA
 from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime, timedelta
+import json
 import logging
 
 consume_bp = Blueprint("consume", __name__)
@@ -18,9 +47,23 @@ def consume_sensor_data():
             return jsonify({"status": "error", "message": "Request must be JSON"}), 400
 
         data = request.get_json()
+        idempotency_key = request.headers.get(HEADER)
+
+        if INGEST_ASYNC:
+            validate_sensor_data(data)
+            recent_keys.check(reading_key(data, idempotency_key))
+            if not ingest_queue.submit(SENSOR_DATA, data, idempotency_key):
+                return (
+                    jsonify({"status": "error", "message": "Ingest queue is full"}),
+                    429,
+                )
+            return (
+                jsonify({"status": "accepted", "message": "Sensor data queued"}),
+                202,
+            )
 
-        with SessionLocal() as db:
-            record = save_sensor_data(db, data)
+        db = get_db()
+        record = save_sensor_data(db, data, idempotency_key)
 
         return (
             jsonify(
@@ -33,6 +76,92 @@ def consume_sensor_data():
             201,
         )
 
+    except DuplicateRequest as duplicate:
+        # Reintento de una lectura ya guardada: se confirma sin duplicarla
+        return (
+            jsonify(
+                {
+                    "status": "duplicate",
+                    "message": "Sensor data already saved",
+                    "record": {"id": str(duplicate.record_id)},
+                }
+            ),
+            200,
+        )
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
+    except SQLAlchemyError as e:
+        logging.error(f"Database error: {e}")
+        return jsonify({"status": "error", "message": "Database error"}), 500
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _parse_batch_body():
+    """
+    Lee el cuerpo de un lote: un arreglo JSON o NDJSON (un objeto por línea).
+    """
+    if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+        body = request.get_data()
+        return [loads(line) for line in body.splitlines() if line.strip()]
+
+    if not request.is_json:
+        raise ValueError("Request must be JSON or NDJSON")
+
+    data = request.get_json()
+    if not isinstance(data, list):
+        raise ValueError("El cuerpo del lote debe ser un arreglo JSON")
+    return data
+
+
+@consume_bp.route("/api/save_sensor_data/batch", methods=["POST"])
+def consume_sensor_data_batch():
+    try:
+        try:
+            items = _parse_batch_body()
+        except json.JSONDecodeError as je:
+            raise ValueError(f"NDJSON inválido: {je}")
+
+        if not items:
+            raise ValueError("El lote está vacío")
+        if len(items) > INGEST_BATCH_MAX_ITEMS:
+            raise ValueError(
+                f"El lote excede el máximo de {INGEST_BATCH_MAX_ITEMS} elementos"
+            )
+
+        # Con Idempotency-Key, cada elemento usa la clave seguida de su índice
+        idempotency_key = request.headers.get(HEADER)
+        idempotency_keys = (
+            [f"{idempotency_key}:{index}" for index in range(len(items))]
+            if idempotency_key
+            else None
+        )
+
+        db = get_db()
+        results = save_sensor_data_batch(db, items, idempotency_keys)
+
+        saved = sum(1 for result in results if result["status"] == "success")
+        duplicates = sum(1 for result in results if result["status"] == "duplicate")
+        accepted = saved + duplicates
+        return (
+            jsonify(
+                {
+                    "status": "success" if accepted == len(results) else "partial",
+                    "message": (
+                        f"{saved} of {len(results)} items saved"
+                        f" ({duplicates} duplicates)"
+                    ),
+                    "results": results,
+                }
+            ),
+            201 if saved else 200 if duplicates else 400,
+        )
+
     except ValueError as ve:
         logging.error(f"ValueError: {ve}")
         return jsonify({"status": "error", "message": str(ve)}), 400
@@ -47,20 +176,93 @@ def consume_sensor_data():
 
 
 @consume_bp.route("/api/sensor_data", methods=["GET"])
+@cached_response(SENSOR_DATA)
 def get_sensor_data():
     try:
-        with SessionLocal() as db:
-            sensor_data = get_all_energy_devices_with_readings(db)
-            return (
-                jsonify(
-                    {
-                        "status": "success",
-                        "data": sensor_data,
-                    }
-                ),
-                200,
+        db = get_db()
+        sensor_data = get_all_energy_devices_with_readings(db)
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "data": sensor_data,
+                }
+            ),
+            200,
+        )
+
+    except SQLAlchemyError as e:
+        logging.error(f"Database error: {e}")
+        return jsonify({"status": "error", "message": "Database error"}), 500
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _reading_filters() -> dict:
+    """
+    Lee los filtros de lecturas desde los parámetros de la URL.
+    """
+    filters = {
+        "serial_number": request.args.get("serial_number"),
+        "alarm_status": request.args.get("alarm_status"),
+    }
+    for name in ("start", "end"):
+        value = request.args.get(name)
+        filters[name] = parse_timestamp(value)
+    return filters
+
+
+@consume_bp.route("/api/sensor_data/readings", methods=["GET"])
+def get_sensor_readings():
+    """
+    Lecturas paginadas por cursor, con filtros por serial_number, rango de
+    fechas (start/end) y alarm_status. Con format=ndjson se transmiten todas
+    las lecturas en streaming.
+    """
+    try:
+        filters = _reading_filters()
+        cursor = request.args.get("cursor")
+
+        if request.args.get("format") == "ndjson":
+            bind = read_bind()
+
+            def generate():
+                # Sesión propia: el stream se consume fuera del handler
+                with SessionLocal(bind=bind) as db:
+                    for reading in iter_energy_readings(db, cursor=cursor, **filters):
+                        yield dumps(reading) + b"\n"
+
+            return Response(
+                stream_with_context(generate()), mimetype="application/x-ndjson"
             )
 
+        limit = request.args.get("limit", 100, type=int)
+        if limit < 1 or limit > 1000:
+            raise ValueError("limit debe estar entre 1 y 1000")
+
+        db = get_db()
+        page = get_energy_readings_page(db, limit=limit, cursor=cursor, **filters)
+
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "data": page["records"],
+                    "pagination": {
+                        "limit": limit,
+                        "next_cursor": page["next_cursor"],
+                    },
+                }
+            ),
+            200,
+        )
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
     except SQLAlchemyError as e:
         logging.error(f"Database error: {e}")
         return jsonify({"status": "error", "message": "Database error"}), 500
@@ -68,3 +270,171 @@ def get_sensor_data():
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@consume_bp.route("/api/sensor_data/export", methods=["GET"])
+def export_sensor_readings():
+    """
+    Exporta lecturas en formato columnar binario (ver services/columnar_export.py),
+    en streaming y ordenadas por created_at. Parámetros: serial_number (uno o
+    varios separados por coma), start, end y precision (32 o 64 bits).
+    """
+    try:
+        filters = _reading_filters()
+        serial_numbers = [
+            serial.strip()
+            for serial in (filters["serial_number"] or "").split(",")
+            if serial.strip()
+        ]
+        if filters["start"] and filters["end"] and filters["start"] >= filters["end"]:
+            raise ValueError("start debe ser anterior a end")
+        precision = request.args.get("precision", 32, type=int)
+        if precision not in (32, 64):
+            raise ValueError("precision debe ser 32 o 64")
+
+        bind = read_bind()
+
+        def generate():
+            # Sesión propia: el stream se consume fuera del handler
+            with SessionLocal(bind=bind) as db:
+                yield from iter_export(
+                    db,
+                    serial_numbers,
+                    filters["start"],
+                    filters["end"],
+                    float_size=precision // 8,
+                )
+
+        return Response(stream_with_context(generate()), mimetype=COLUMNAR_MIMETYPE)
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@consume_bp.route("/api/sensor_data/aggregates", methods=["GET"])
+def get_sensor_aggregates():
+    """
+    Promedio/mínimo/máximo de voltaje, corriente, fuga, potencia activa y cos φ
+    de un dispositivo, servidos desde los rollups (1m/1h/1d).
+    Parámetros: serial_number, start, end y resolution (segundos, opcional).
+    """
+    try:
+        filters = _reading_filters()
+        if not filters["serial_number"]:
+            raise ValueError("serial_number es requerido")
+        end = filters["end"] or datetime.utcnow()
+        start = filters["start"] or end - timedelta(days=1)
+        if start >= end:
+            raise ValueError("start debe ser anterior a end")
+
+        resolution = request.args.get("resolution", type=int)
+        if resolution is not None and resolution < 1:
+            raise ValueError("resolution debe ser mayor a 0")
+
+        db = get_db()
+        series, error = get_rollup_series(
+            db,
+            filters["serial_number"],
+            start,
+            end,
+            timedelta(seconds=resolution) if resolution else None,
+        )
+
+        if error:
+            logging.error(f"Database error: {error}")
+            return jsonify({"status": "error", "message": error}), 500
+
+        return jsonify({"status": "success", "data": series}), 200
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@consume_bp.route("/api/devices/status", methods=["GET"])
+def get_devices_status():
+    """
+    Dispositivos online/offline y desde cuándo, a partir del último heartbeat.
+    Parámetro opcional: status (online u offline).
+    """
+    try:
+        status = request.args.get("status")
+        if status not in (None, "online", "offline"):
+            raise ValueError("status debe ser online u offline")
+
+        db = get_db()
+        devices = get_fleet_status(db, status=status)
+        return jsonify({"status": "success", "data": devices}), 200
+
+    except ValueError as ve:
+        logging.error(f"ValueError: {ve}")
+        return jsonify({"status": "error", "message": str(ve)}), 400
+
+    except SQLAlchemyError as e:
+        logging.error(f"Database error: {e}")
+        return jsonify({"status": "error", "message": "Database error"}), 500
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@consume_bp.route("/api/devices/latest", methods=["GET"])
+def get_devices_latest():
+    """
+    Última lectura de cada dispositivo, con filtros opcionales alarm_status y
+    serial_number. Responde 304 si el ETag enviado en If-None-Match no cambió.
+    """
+    try:
+        db = get_db()
+        entries = get_latest_readings(
+            db,
+            alarm_status=request.args.get("alarm_status"),
+            serial_number=request.args.get("serial_number"),
+        )
+
+        etag = latest_readings_etag(entries)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(
+                {"status": "success", "data": [entry["reading"] for entry in entries]}
+            )
+        response.set_etag(etag)
+        return response
+
+    except SQLAlchemyError as e:
+        logging.error(f"Database error: {e}")
+        return jsonify({"status": "error", "message": "Database error"}), 500
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@consume_bp.route("/api/ingest/stats", methods=["GET"])
+def get_ingest_stats():
+    return (
+        jsonify(
+            {
+                "status": "success",
+                "queue": ingest_queue.stats(),
+                "device_cache": device_registry.stats(),
+                "idempotency_cache": recent_keys.stats(),
+                "anomaly_detector": anomaly_detector.stats(),
+                "response_cache": response_cache.stats(),
+                "db_pool": pool_status(engine),
+                "db_replicas": replica_router.status(),
+            }
+        ),
+        200,
+    )
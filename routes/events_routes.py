@@ -0,0 +1,106 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from services.event_bus import event_bus
+from core.config import EVENT_STREAM_KEEPALIVE_SECONDS, EVENT_POLL_MAX_WAIT_SECONDS
+from core.serialization import dumps
+import logging
+
+events_bp = Blueprint("events", __name__)
+
+
+def _event_filters() -> dict:
+    """
+    Filtros opcionales como listas separadas por coma:
+    type (reading, short_circuit, anomaly), device (serial_number o
+    control_mac) y level (alarm_status, active/inactive en cortocircuitos o
+    el tipo de alerta en anomalías).
+    """
+    filters = {}
+    for arg, key in (("type", "types"), ("device", "devices"), ("level", "levels")):
+        value = request.args.get(arg)
+        filters[key] = (
+            {item.strip() for item in value.split(",") if item.strip()}
+            if value
+            else None
+        )
+    return filters
+
+
+def _last_event_id() -> int:
+    """
+    Último id recibido por el cliente (cabecera Last-Event-ID al reconectar, o
+    parámetro last_event_id). Sin él, solo se envían los eventos nuevos.
+    """
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if value is None:
+        return event_bus.last_id
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("last_event_id must be an integer")
+
+
+def _sse_frame(event: dict) -> str:
+    data = dumps(event["data"]).decode("utf-8")
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+@events_bp.route("/api/events/stream", methods=["GET"])
+def stream_events():
+    try:
+        filters = _event_filters()
+        last_id = _last_event_id()
+
+        def generate():
+            nonlocal last_id
+            yield "retry: 3000\n\n"
+            while True:
+                events = event_bus.wait(
+                    last_id, EVENT_STREAM_KEEPALIVE_SECONDS, **filters
+                )
+                if not events:
+                    # Comentario para mantener viva la conexión en proxies
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield _sse_frame(event)
+                last_id = events[-1]["id"]
+
+        response = Response(
+            stream_with_context(generate()), mimetype="text/event-stream"
+        )
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    except ValueError as ve:
+        return jsonify({"status": "error", "message": str(ve)}), 400
+    except Exception as e:
+        logging.error(f"Error opening event stream: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@events_bp.route("/api/events/poll", methods=["GET"])
+def poll_events():
+    try:
+        filters = _event_filters()
+        last_id = _last_event_id()
+        timeout = request.args.get("timeout", EVENT_POLL_MAX_WAIT_SECONDS, type=float)
+        timeout = max(0.0, min(timeout, EVENT_POLL_MAX_WAIT_SECONDS))
+
+        events = event_bus.wait(last_id, timeout, **filters)
+        return (
+            jsonify(
+                {
+                    "status": "success",
+                    "data": events,
+                    "last_event_id": events[-1]["id"] if events else last_id,
+                }
+            ),
+            200,
+        )
+
+    except ValueError as ve:
+        return jsonify({"status": "error", "message": str(ve)}), 400
+    except Exception as e:
+        logging.error(f"Error polling events: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -0,0 +1,118 @@
+from flask import Blueprint, Response
+from services.ingest_queue import ingest_queue
+from services.device_registry import device_registry
+from services.idempotency import recent_keys
+from services.anomaly_detector import anomaly_detector
+from core.config import engine
+from core.metrics import registry, render_metrics
+from core.pool import pool_status
+from core.response_cache import response_cache
+import logging
+
+metrics_bp = Blueprint("metrics", __name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Contadores acumulados de las estadísticas en memoria: clave -> (métrica, ayuda)
+_POOL_COUNTERS = {
+    "connects": ("eneraq_db_pool_connects_total", "Conexiones abiertas por el pool"),
+    "checkouts": ("eneraq_db_pool_checkouts_total", "Conexiones tomadas del pool"),
+    "timeouts": ("eneraq_db_pool_timeouts_total", "Esperas del pool que expiraron"),
+    "invalidations": (
+        "eneraq_db_pool_invalidations_total",
+        "Conexiones invalidadas",
+    ),
+}
+_POOL_GAUGES = {
+    "size": ("eneraq_db_pool_size", "Tamaño configurado del pool"),
+    "checked_out": ("eneraq_db_pool_checked_out", "Conexiones en uso"),
+    "overflow": ("eneraq_db_pool_overflow", "Conexiones por encima del tamaño"),
+}
+_QUEUE_COUNTERS = {
+    "enqueued": ("eneraq_ingest_enqueued_total", "Payloads encolados"),
+    "rejected": ("eneraq_ingest_rejected_total", "Payloads rechazados (cola llena)"),
+    "flushed": ("eneraq_ingest_flushed_total", "Payloads guardados por los workers"),
+    "failed": ("eneraq_ingest_failed_total", "Payloads que fallaron al guardarse"),
+    "flushes": ("eneraq_ingest_flushes_total", "Lotes guardados por los workers"),
+    "flush_seconds_total": (
+        "eneraq_ingest_flush_seconds_total",
+        "Tiempo total guardando lotes",
+    ),
+}
+
+
+def _collect():
+    """
+    Lee las estadísticas de pool, cola, cachés y detector al momento de exponer.
+    """
+    pool = pool_status(engine)
+    for key, (name, help_text) in _POOL_COUNTERS.items():
+        yield name, "counter", help_text, pool[key]
+    for key, (name, help_text) in _POOL_GAUGES.items():
+        if key in pool:
+            # QueuePool.overflow() es negativo mientras no se llena el pool
+            yield name, "gauge", help_text, max(pool[key], 0)
+
+    queue = ingest_queue.stats()
+    for key, (name, help_text) in _QUEUE_COUNTERS.items():
+        yield name, "counter", help_text, queue[key]
+    yield (
+        "eneraq_ingest_queue_depth",
+        "gauge",
+        "Payloads en cola",
+        queue["queue_depth"],
+    )
+
+    devices = device_registry.stats()
+    yield (
+        "eneraq_device_cache_size",
+        "gauge",
+        "Dispositivos en caché",
+        devices["size"],
+    )
+    yield (
+        "eneraq_device_cache_lookups_total",
+        "counter",
+        "Búsquedas en la caché de dispositivos",
+        {
+            (("result", "hit"),): devices["hits"],
+            (("result", "miss"),): devices["misses"],
+        },
+    )
+    cache = response_cache.stats()
+    yield (
+        "eneraq_response_cache_lookups_total",
+        "counter",
+        "Búsquedas en la caché de respuestas",
+        {
+            (("result", "hit"),): cache["hits"],
+            (("result", "miss"),): cache["misses"],
+        },
+    )
+    yield (
+        "eneraq_idempotency_duplicates_total",
+        "counter",
+        "Payloads duplicados descartados",
+        recent_keys.stats()["duplicates"],
+    )
+    yield (
+        "eneraq_anomaly_devices",
+        "gauge",
+        "Dispositivos con estado en el detector",
+        anomaly_detector.stats()["devices"],
+    )
+
+
+registry.register_collector(_collect)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    try:
+        return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return Response(
+            f"# error: {e}\n", status=500, content_type=PROMETHEUS_CONTENT_TYPE
+        )
@@ -1,11 +1,23 @@
 from flask import Blueprint, request, jsonify, render_template
 from http import HTTPStatus
-from core.config import SessionLocal
+from core.config import INGEST_ASYNC
+from core.session import get_db
+from core.response_cache import cached_response, SHORT_CIRCUITS
+from services.ingest_queue import ingest_queue, SHORT_CIRCUIT
+from services.idempotency import HEADER, DuplicateRequest, recent_keys
 from services.short_circuit_service import (
     create_short_circuit,
+    short_circuit_key,
     get_short_circuits,
+    get_short_circuits_keyset,
     get_short_circuits_count,
 )
+from services.incident_service import (
+    get_incident_summaries,
+    get_incident_summary,
+    get_incidents,
+)
+from datetime import date, datetime, timedelta
 
 short_circuit_bp = Blueprint("short_circuit", __name__)
 
@@ -33,8 +45,23 @@ def create_short_circuit_route():
                 HTTPStatus.BAD_REQUEST,
             )
 
-        with SessionLocal() as db:
-            short_circuit, error = create_short_circuit(db, data)
+        idempotency_key = request.headers.get(HEADER)
+        if INGEST_ASYNC:
+            recent_keys.check(short_circuit_key(data, idempotency_key))
+            if not ingest_queue.submit(SHORT_CIRCUIT, data, idempotency_key):
+                return (
+                    jsonify(
+                        {"status": "error", "error": "La cola de ingesta está llena"}
+                    ),
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                )
+            return (
+                jsonify({"status": "accepted", "message": "Registro encolado"}),
+                HTTPStatus.ACCEPTED,
+            )
+
+        db = get_db()
+        short_circuit, error = create_short_circuit(db, data, idempotency_key)
 
         if error:
             return (
@@ -46,25 +73,31 @@ def create_short_circuit_route():
             jsonify(
                 {
                     "status": "success",
-                    "data": (
-                        short_circuit.to_dict()
-                        if hasattr(short_circuit, "to_dict")
-                        else {
-                            "id": short_circuit.id,
-                            "control_mac": short_circuit.control_mac,
-                            "wifi_mac": short_circuit.wifi_mac,
-                            "timestamp": (
-                                short_circuit.timestamp.isoformat()
-                                if short_circuit.timestamp
-                                else None
-                            ),
-                        }
-                    ),
+                    "data": short_circuit.to_dict(),
                 }
             ),
             HTTPStatus.CREATED,
         )
 
+    except DuplicateRequest as duplicate:
+        # Reintento de un evento ya guardado: se confirma sin duplicarlo
+        return (
+            jsonify(
+                {
+                    "status": "duplicate",
+                    "message": "El evento ya fue registrado",
+                    "data": {"id": duplicate.record_id},
+                }
+            ),
+            HTTPStatus.OK,
+        )
+
+    except ValueError as ve:
+        return (
+            jsonify({"status": "error", "error": str(ve)}),
+            HTTPStatus.BAD_REQUEST,
+        )
+
     except Exception as e:
         return (
             jsonify(
@@ -75,6 +108,7 @@ def create_short_circuit_route():
 
 
 @short_circuit_bp.route("/api/short-circuits", methods=["GET"])
+@cached_response(SHORT_CIRCUITS)
 def get_short_circuits_route():
     """
     Endpoint para obtener registros de cortocircuitos con paginación.
@@ -101,9 +135,16 @@ def get_short_circuits_route():
                 HTTPStatus.BAD_REQUEST,
             )
 
+        # Paginación por cursor (keyset) si se envía el parámetro cursor
+        keyset = "cursor" in request.args
         skip = (page - 1) * per_page
 
-        with SessionLocal() as db:
+        db = get_db()
+        if keyset:
+            result, error = get_short_circuits_keyset(
+                db, per_page, request.args.get("cursor") or None
+            )
+        else:
             result, error = get_short_circuits(db, skip, per_page)
 
         if error:
@@ -112,47 +153,43 @@ def get_short_circuits_route():
                 HTTPStatus.INTERNAL_SERVER_ERROR,
             )
 
-        # Convertir registros a diccionario
-        records = []
-        for record in result["records"]:
-            records.append(
-                {
-                    "id": record.id,
-                    "control_mac": record.control_mac,
-                    "wifi_mac": record.wifi_mac,
-                    "timestamp": (
-                        record.timestamp.isoformat() if record.timestamp else None
-                    ),
-                    "current_active": record.current_active,
-                    "current_duration_seconds": record.current_duration_seconds,
-                    "previous_active": record.previous_active,
-                    "previous_timestamp": (
-                        record.previous_timestamp.isoformat()
-                        if record.previous_timestamp
-                        else None
-                    ),
-                    "previous_duration_seconds": record.previous_duration_seconds,
-                }
-            )
+        records = [record.to_dict() for record in result["records"]]
 
         total_pages = (result["total_records"] + per_page - 1) // per_page
 
+        if keyset:
+            pagination = {
+                "per_page": per_page,
+                "next_cursor": result["next_cursor"],
+                "prev_cursor": result["prev_cursor"],
+                "total_records": result["total_records"],
+                "total_pages": total_pages,
+            }
+        else:
+            pagination = {
+                "page": page,
+                "per_page": per_page,
+                "total_records": result["total_records"],
+                "total_pages": total_pages,
+            }
+
         return (
             jsonify(
                 {
                     "status": "success",
                     "data": records,
-                    "pagination": {
-                        "page": page,
-                        "per_page": per_page,
-                        "total_records": result["total_records"],
-                        "total_pages": total_pages,
-                    },
+                    "pagination": pagination,
                 }
             ),
             HTTPStatus.OK,
         )
 
+    except ValueError as ve:
+        return (
+            jsonify({"status": "error", "error": str(ve)}),
+            HTTPStatus.BAD_REQUEST,
+        )
+
     except Exception as e:
         return (
             jsonify(
@@ -163,6 +200,7 @@ def get_short_circuits_route():
 
 
 @short_circuit_bp.route("/admin/short-circuits", methods=["GET"])
+@cached_response(SHORT_CIRCUITS)
 def admin_short_circuits():
     """
     Dashboard administrativo para cortocircuitos.
@@ -176,9 +214,13 @@ def admin_short_circuits():
         if per_page < 1 or per_page > 100:
             per_page = 10
 
+        cursor = request.args.get("cursor")
         skip = (page - 1) * per_page
 
-        with SessionLocal() as db:
+        db = get_db()
+        if cursor is not None:
+            result, error = get_short_circuits_keyset(db, per_page, cursor or None)
+        else:
             result, error = get_short_circuits(db, skip, per_page)
 
         if error:
@@ -193,6 +235,8 @@ def admin_short_circuits():
             per_page=per_page,
             total_records=result["total_records"],
             total_pages=total_pages,
+            next_cursor=result.get("next_cursor"),
+            prev_cursor=result.get("prev_cursor"),
         )
 
     except Exception as e:
@@ -200,13 +244,14 @@ def admin_short_circuits():
 
 
 @short_circuit_bp.route("/api/short-circuits/count", methods=["GET"])
+@cached_response(SHORT_CIRCUITS)
 def get_short_circuits_count_route():
     """
     Endpoint para obtener el conteo total de cortocircuitos.
     """
     try:
-        with SessionLocal() as db:
-            count, error = get_short_circuits_count(db)
+        db = get_db()
+        count, error = get_short_circuits_count(db)
 
         if error:
             return (
@@ -223,3 +268,117 @@ def get_short_circuits_count_route():
             ),
             HTTPStatus.INTERNAL_SERVER_ERROR,
         )
+
+
+@short_circuit_bp.route("/api/short-circuits/summary", methods=["GET"])
+def get_short_circuit_summaries_route():
+    """
+    Endpoint con los contadores de incidentes de todos los dispositivos.
+    """
+    try:
+        db = get_db()
+        summaries, error = get_incident_summaries(db)
+
+        if error:
+            return (
+                jsonify({"status": "error", "error": error}),
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+
+        return jsonify({"status": "success", "data": summaries}), HTTPStatus.OK
+
+    except Exception as e:
+        return (
+            jsonify(
+                {"status": "error", "error": f"Error interno del servidor: {str(e)}"}
+            ),
+            HTTPStatus.INTERNAL_SERVER_ERROR,
+        )
+
+
+@short_circuit_bp.route("/api/short-circuits/summary/<control_mac>", methods=["GET"])
+def get_short_circuit_summary_route(control_mac):
+    """
+    Endpoint con los contadores de incidentes de un control_mac: disparos,
+    segundos en cortocircuito y MTBF acumulados, más los totales entre los días
+    start y end (YYYY-MM-DD, por defecto los últimos 7 días).
+    """
+    try:
+        end = request.args.get("end")
+        end = date.fromisoformat(end) if end else datetime.utcnow().date()
+        start = request.args.get("start")
+        start = date.fromisoformat(start) if start else end - timedelta(days=6)
+        if start > end:
+            return (
+                jsonify({"status": "error", "error": "start debe ser anterior a end"}),
+                HTTPStatus.BAD_REQUEST,
+            )
+
+        db = get_db()
+        summary, error = get_incident_summary(db, control_mac, start, end)
+
+        if error:
+            return (
+                jsonify({"status": "error", "error": error}),
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+
+        if summary is None:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "error": "No hay eventos para este control_mac",
+                    }
+                ),
+                HTTPStatus.NOT_FOUND,
+            )
+
+        return jsonify({"status": "success", "data": summary}), HTTPStatus.OK
+
+    except ValueError as ve:
+        return (
+            jsonify({"status": "error", "error": str(ve)}),
+            HTTPStatus.BAD_REQUEST,
+        )
+
+    except Exception as e:
+        return (
+            jsonify(
+                {"status": "error", "error": f"Error interno del servidor: {str(e)}"}
+            ),
+            HTTPStatus.INTERNAL_SERVER_ERROR,
+        )
+
+
+@short_circuit_bp.route("/api/short-circuits/incidents", methods=["GET"])
+def get_short_circuit_incidents_route():
+    """
+    Endpoint con los incidentes más recientes, opcionalmente por control_mac.
+    """
+    try:
+        limit = request.args.get("limit", 50, type=int)
+        if limit < 1 or limit > 500:
+            return (
+                jsonify({"status": "error", "error": "limit debe estar entre 1 y 500"}),
+                HTTPStatus.BAD_REQUEST,
+            )
+
+        db = get_db()
+        incidents, error = get_incidents(db, request.args.get("control_mac"), limit)
+
+        if error:
+            return (
+                jsonify({"status": "error", "error": error}),
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+
+        return jsonify({"status": "success", "data": incidents}), HTTPStatus.OK
+
+    except Exception as e:
+        return (
+            jsonify(
+                {"status": "error", "error": f"Error interno del servidor: {str(e)}"}
+            ),
+            HTTPStatus.INTERNAL_SERVER_ERROR,
+        )
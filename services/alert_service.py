@@ -0,0 +1,85 @@
+"""
+Persistencia y consulta de las alertas del detector de anomalías.
+"""
+
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from core.config import ANOMALY_DETECTION
+from models.models import AnomalyAlert
+from services.anomaly_detector import Detection, anomaly_detector
+from services.event_bus import event_bus, ANOMALY
+
+
+def detect_anomalies(db: Session, readings: Iterable[tuple]) -> tuple:
+    """
+    Pasa por el detector las lecturas de una transacción, dadas como
+    (serial_number, valores de la lectura con id, device_id y created_at), e
+    inserta las alertas en bloque. No hace commit ni cambia el estado del
+    detector.
+
+    Retorna (filas insertadas, Detection) para confirm_alerts tras el commit.
+    """
+    detection = anomaly_detector.begin()
+    if not ANOMALY_DETECTION:
+        return [], detection
+    rows = []
+    for serial_number, values in readings:
+        for alert in detection.observe(serial_number, values["created_at"], values):
+            alert.update(
+                device_id=values["device_id"],
+                serial_number=serial_number,
+                reading_id=values["id"],
+                detected_at=values["created_at"],
+            )
+            rows.append(alert)
+    if rows:
+        db.execute(insert(AnomalyAlert), rows)
+    return rows, detection
+
+
+def confirm_alerts(rows: List[dict], detection: Optional[Detection]):
+    """
+    Después del commit: aplica al detector las lecturas evaluadas y publica en
+    el bus de eventos las alertas confirmadas.
+    """
+    if detection is not None:
+        detection.apply()
+    events = []
+    for row in rows:
+        alert = AnomalyAlert(**row).to_dict()
+        events.append((ANOMALY, row["serial_number"], row["kind"], alert))
+    event_bus.publish_many(events)
+
+
+def get_alerts(
+    db: Session,
+    serial_number: Optional[str] = None,
+    kind: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+):
+    """
+    Alertas más recientes, filtradas por dispositivo, tipo y rango de
+    detected_at.
+    """
+    try:
+        query = select(AnomalyAlert)
+        if serial_number:
+            query = query.where(AnomalyAlert.serial_number == serial_number)
+        if kind:
+            query = query.where(AnomalyAlert.kind == kind)
+        if start:
+            query = query.where(AnomalyAlert.detected_at >= start)
+        if end:
+            query = query.where(AnomalyAlert.detected_at < end)
+        query = query.order_by(
+            AnomalyAlert.detected_at.desc(), AnomalyAlert.id.desc()
+        ).limit(limit)
+        return [alert.to_dict() for alert in db.execute(query).scalars()], None
+    except Exception as e:
+        return None, str(e)
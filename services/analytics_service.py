@@ -0,0 +1,274 @@
+"""
+Análisis de calidad de energía sobre las lecturas almacenadas.
+
+Las mediciones de un dispositivo en una ventana se cargan en arreglos NumPy
+contiguos (una columna por medición, leída con un cursor del lado del
+servidor y sin objetos ORM) y todas las métricas se calculan vectorizadas.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Float, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ColumnElement
+
+from core.config import (
+    ANALYTICS_BATCH_SIZE,
+    ANALYTICS_NOMINAL_VOLTAGE,
+    ANALYTICS_VOLTAGE_TOLERANCE,
+    ANALYTICS_LEAKAGE_LIMIT,
+    ANALYTICS_POWER_FACTOR_MIN,
+    ANALYTICS_CURRENT_LIMIT,
+    ANALYTICS_MAX_GAP_SECONDS,
+)
+from models.models import EnergyDevice, EnergyReading
+
+VOLTAGE_COLUMNS = ("voltage_l1", "voltage_l2", "voltage_l3")
+CURRENT_COLUMNS = ("current_l1", "current_l2", "current_l3")
+SERIES_COLUMNS = (
+    VOLTAGE_COLUMNS
+    + CURRENT_COLUMNS
+    + ("leakage_current", "active_power_w", "apparent_power_va", "cos_fi")
+)
+
+
+class epoch_seconds(ColumnElement):
+    """
+    Segundos desde epoch de una columna DateTime (UTC sin zona), calculados en
+    la base de datos para no convertir un datetime de Python por fila.
+    """
+
+    type = Float()
+    inherit_cache = True
+
+    def __init__(self, column):
+        self.column = column
+
+
+@compiles(epoch_seconds)
+def _epoch_seconds_default(element, compiler, **kw):
+    return f"EXTRACT(EPOCH FROM {compiler.process(element.column, **kw)})"
+
+
+@compiles(epoch_seconds, "sqlite")
+def _epoch_seconds_sqlite(element, compiler, **kw):
+    return (
+        f"((julianday({compiler.process(element.column, **kw)}) - 2440587.5) * 86400.0)"
+    )
+
+
+@compiles(epoch_seconds, "mysql")
+def _epoch_seconds_mysql(element, compiler, **kw):
+    column = compiler.process(element.column, **kw)
+    return f"(TIMESTAMPDIFF(MICROSECOND, '1970-01-01', {column}) / 1000000.0)"
+
+
+def default_thresholds() -> dict:
+    """
+    Umbrales configurados por entorno (ver ANALYTICS_* en core/config.py).
+    """
+    return {
+        "nominal_voltage": ANALYTICS_NOMINAL_VOLTAGE,
+        "voltage_tolerance": ANALYTICS_VOLTAGE_TOLERANCE,
+        "leakage_limit": ANALYTICS_LEAKAGE_LIMIT,
+        "power_factor_min": ANALYTICS_POWER_FACTOR_MIN,
+        "current_limit": ANALYTICS_CURRENT_LIMIT,
+        "max_gap_seconds": ANALYTICS_MAX_GAP_SECONDS,
+    }
+
+
+def load_series(
+    db: Session,
+    serial_number: str,
+    start: datetime,
+    end: datetime,
+    batch_size: int = ANALYTICS_BATCH_SIZE,
+) -> dict:
+    """
+    Mediciones de un dispositivo en [start, end) como arreglos float64, más
+    "time" en segundos desde epoch. Los valores nulos quedan como NaN.
+    """
+    query = (
+        select(
+            epoch_seconds(EnergyReading.created_at),
+            *(getattr(EnergyReading, column) for column in SERIES_COLUMNS),
+        )
+        .join(EnergyDevice, EnergyReading.device_id == EnergyDevice.id)
+        .where(
+            EnergyDevice.serial_number == serial_number,
+            EnergyReading.created_at >= start,
+            EnergyReading.created_at < end,
+        )
+        .order_by(EnergyReading.created_at, EnergyReading.id)
+    )
+    result = (
+        db.connection()
+        .execution_options(stream_results=True, yield_per=batch_size)
+        .execute(query)
+    )
+
+    chunks = {name: [] for name in ("time",) + SERIES_COLUMNS}
+    for rows in result.partitions():
+        for name, column in zip(chunks, zip(*rows)):
+            chunks[name].append(np.array(column, dtype=np.float64))
+
+    return {
+        name: np.concatenate(parts) if parts else np.empty(0, dtype=np.float64)
+        for name, parts in chunks.items()
+    }
+
+
+def _stats(values: np.ndarray) -> dict:
+    valid = values[~np.isnan(values)]
+    if not valid.size:
+        return {"avg": None, "min": None, "max": None, "samples": 0}
+    return {
+        "avg": float(valid.mean()),
+        "min": float(valid.min()),
+        "max": float(valid.max()),
+        "samples": int(valid.size),
+    }
+
+
+def phase_imbalance(phases: np.ndarray) -> np.ndarray:
+    """
+    Desequilibrio por muestra (%) de una matriz n x 3: máxima desviación
+    respecto al promedio de las fases, dividida por ese promedio (NEMA).
+    NaN si falta alguna fase o el promedio no es positivo.
+    """
+    mean = phases.mean(axis=1)
+    deviation = np.abs(phases - mean[:, None]).max(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(mean > 0, deviation / mean * 100, np.nan)
+
+
+def _crossings(outside: np.ndarray) -> dict:
+    """
+    Eventos (entradas a la zona fuera de umbral) y muestras fuera de umbral.
+    """
+    if not outside.size:
+        return {"events": 0, "samples": 0}
+    events = np.count_nonzero(outside[1:] & ~outside[:-1]) + int(outside[0])
+    return {"events": int(events), "samples": int(np.count_nonzero(outside))}
+
+
+def power_factor(series: dict) -> np.ndarray:
+    """
+    cos φ informado, o potencia activa / aparente cuando no viene.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed = np.where(
+            series["apparent_power_va"] > 0,
+            series["active_power_w"] / series["apparent_power_va"],
+            np.nan,
+        )
+    return np.where(np.isnan(series["cos_fi"]), computed, series["cos_fi"])
+
+
+def energy_kwh(times: np.ndarray, power: np.ndarray, max_gap: float) -> dict:
+    """
+    Energía integrando la potencia activa por trapecios. Los intervalos mayores
+    a max_gap segundos (o sin potencia) no se integran.
+    """
+    if times.size < 2:
+        return {"kwh": 0.0, "covered_hours": 0.0, "gaps": 0}
+    dt = np.diff(times)
+    average = (power[1:] + power[:-1]) / 2
+    valid = (dt > 0) & (dt <= max_gap) & ~np.isnan(average)
+    return {
+        "kwh": float(np.sum(average[valid] * dt[valid]) / 3.6e6),
+        "covered_hours": float(np.sum(dt[valid]) / 3600),
+        "gaps": int(np.count_nonzero(dt > max_gap)),
+    }
+
+
+def leakage_trend(times: np.ndarray, leakage: np.ndarray) -> dict:
+    """
+    Estadísticas de la corriente de fuga y pendiente por hora (mínimos
+    cuadrados sobre las muestras válidas).
+    """
+    result = _stats(leakage)
+    valid = ~np.isnan(leakage)
+    hours = times[valid] / 3600
+    slope = None
+    if hours.size >= 2 and np.ptp(hours) > 0:
+        slope = float(np.polyfit(hours - hours[0], leakage[valid], 1)[0])
+    result["slope_per_hour"] = slope
+    return result
+
+
+def compute_power_quality(series: dict, thresholds: dict) -> dict:
+    """
+    Métricas de calidad de energía a partir de load_series.
+    """
+    voltages = np.column_stack([series[column] for column in VOLTAGE_COLUMNS])
+    currents = np.column_stack([series[column] for column in CURRENT_COLUMNS])
+    factor = power_factor(series)
+
+    nominal = thresholds["nominal_voltage"]
+    tolerance = thresholds["voltage_tolerance"]
+    with np.errstate(invalid="ignore"):
+        limits = {
+            "overvoltage": (voltages > nominal * (1 + tolerance)).any(axis=1),
+            "undervoltage": (voltages < nominal * (1 - tolerance)).any(axis=1),
+            "leakage": series["leakage_current"] > thresholds["leakage_limit"],
+            "low_power_factor": factor < thresholds["power_factor_min"],
+        }
+        if thresholds["current_limit"]:
+            limits["overcurrent"] = (currents > thresholds["current_limit"]).any(axis=1)
+
+    return {
+        "voltage_imbalance_pct": _stats(phase_imbalance(voltages)),
+        "current_imbalance_pct": _stats(phase_imbalance(currents)),
+        "power_factor": _stats(factor),
+        "active_power_w": _stats(series["active_power_w"]),
+        "energy": energy_kwh(
+            series["time"], series["active_power_w"], thresholds["max_gap_seconds"]
+        ),
+        "leakage_current": leakage_trend(series["time"], series["leakage_current"]),
+        "threshold_crossings": {
+            name: _crossings(outside) for name, outside in limits.items()
+        },
+    }
+
+
+def _isoformat(seconds: float) -> str:
+    # Redondeado a milisegundos: julianday en SQLite no conserva los microsegundos
+    milliseconds = round(float(seconds) * 1000)
+    return (datetime(1970, 1, 1) + timedelta(milliseconds=milliseconds)).isoformat()
+
+
+def get_power_quality(
+    db: Session,
+    serial_number: str,
+    start: datetime,
+    end: datetime,
+    thresholds: Optional[dict] = None,
+):
+    """
+    Análisis de calidad de energía de un dispositivo en [start, end).
+    thresholds reemplaza parcialmente a default_thresholds().
+    """
+    try:
+        limits = default_thresholds()
+        limits.update(thresholds or {})
+
+        series = load_series(db, serial_number, start, end)
+        times = series["time"]
+        result = {
+            "serial_number": serial_number,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "samples": int(times.size),
+            "first_sample": _isoformat(times[0]) if times.size else None,
+            "last_sample": _isoformat(times[-1]) if times.size else None,
+            "thresholds": limits,
+        }
+        result.update(compute_power_quality(series, limits))
+        return result, None
+
+    except Exception as e:
+        return None, str(e)
@@ -0,0 +1,410 @@
+"""
+Detección de anomalías en la ingesta.
+
+Por cada dispositivo y métrica se mantiene una ventana deslizante acotada
+(media y desviación estándar móviles con sumas acumuladas) de los valores y
+de sus tasas de cambio, y una EWMA. Cada lectura se evalúa en O(1) y las
+alertas se disparan por flanco: una condición que persiste no se repite
+hasta que se normaliza.
+
+La ingesta evalúa con una Detection sobre copias del estado y lo aplica
+recién después del commit, así una transacción fallida no deja muestras.
+
+El estado vive en memoria de cada proceso; con varios procesos cada uno
+evalúa solo las lecturas que recibe.
+"""
+
+import math
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Optional
+
+from core.config import (
+    ANOMALY_WINDOW_SIZE,
+    ANOMALY_MIN_SAMPLES,
+    ANOMALY_EWMA_ALPHA,
+    ANOMALY_ZSCORE,
+    ANOMALY_CREEP_SIGMA,
+    ANOMALY_RATE_ZSCORE,
+    ANOMALY_MAX_DEVICES,
+    ANALYTICS_NOMINAL_VOLTAGE,
+    ANALYTICS_VOLTAGE_TOLERANCE,
+    ANALYTICS_LEAKAGE_LIMIT,
+)
+
+VOLTAGE_METRICS = ("voltage_l1", "voltage_l2", "voltage_l3")
+CURRENT_METRICS = ("current_l1", "current_l2", "current_l3")
+LEAKAGE_METRIC = "leakage_current"
+METRICS = (LEAKAGE_METRIC,) + CURRENT_METRICS + VOLTAGE_METRICS
+
+# Tipos de alerta
+SPIKE = "spike"  # desvío mayor a ANOMALY_ZSCORE desviaciones de la media móvil
+VOLTAGE_SAG = "voltage_sag"
+VOLTAGE_SWELL = "voltage_swell"
+LEAKAGE_HIGH = "leakage_high"
+LEAKAGE_CREEP = "leakage_creep"  # la EWMA de la fuga sube sobre la media
+# tasa de cambio a más de ANOMALY_RATE_ZSCORE desviaciones de la habitual
+RATE_OF_CHANGE = "rate_of_change"
+
+# Con muestras más próximas (p. ej. las de un mismo lote) la tasa es ruido
+MIN_RATE_INTERVAL_SECONDS = 1.0
+
+
+class RollingWindow:
+    """
+    Media y desviación estándar de las últimas size muestras (sumas
+    acumuladas, O(1) por muestra).
+    """
+
+    __slots__ = ("values", "total", "total_squares")
+
+    def __init__(self, size: int):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def copy(self) -> "RollingWindow":
+        window = RollingWindow(self.values.maxlen)
+        window.values = self.values.copy()
+        window.total = self.total
+        window.total_squares = self.total_squares
+        return window
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / len(self.values) if self.values else None
+
+    @property
+    def std(self) -> Optional[float]:
+        count = len(self.values)
+        if count < 2:
+            return None
+        variance = (self.total_squares - self.total * self.total / count) / (count - 1)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+    def push(self, value: float):
+        if len(self.values) == self.values.maxlen:
+            oldest = self.values[0]
+            self.total -= oldest
+            self.total_squares -= oldest * oldest
+        self.values.append(value)
+        self.total += value
+        self.total_squares += value * value
+
+
+class WindowStats:
+    """
+    Estadísticas de una métrica sobre las últimas window_size muestras: los
+    valores, sus tasas de cambio por segundo, la EWMA y la última muestra.
+    """
+
+    __slots__ = (
+        "window",
+        "rates",
+        "ewma",
+        "last_value",
+        "last_time",
+        "active",
+    )
+
+    def __init__(self, window_size: int):
+        self.window = RollingWindow(window_size)
+        self.rates = RollingWindow(window_size)
+        self.ewma = None
+        self.last_value = None
+        self.last_time = None
+        self.active = set()  # tipos de alerta con la condición vigente
+
+    def copy(self) -> "WindowStats":
+        stats = WindowStats.__new__(WindowStats)
+        stats.window = self.window.copy()
+        stats.rates = self.rates.copy()
+        stats.ewma = self.ewma
+        stats.last_value = self.last_value
+        stats.last_time = self.last_time
+        stats.active = set(self.active)
+        return stats
+
+    @property
+    def count(self) -> int:
+        return self.window.count
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.window.mean
+
+    @property
+    def std(self) -> Optional[float]:
+        return self.window.std
+
+    def rate(self, value: float, timestamp: datetime) -> Optional[float]:
+        """
+        Variación por segundo respecto de la muestra anterior (None si no hay
+        o si está a menos de MIN_RATE_INTERVAL_SECONDS).
+        """
+        if self.last_time is None:
+            return None
+        seconds = (timestamp - self.last_time).total_seconds()
+        if seconds < MIN_RATE_INTERVAL_SECONDS:
+            return None
+        return (value - self.last_value) / seconds
+
+    def push(self, value: float, timestamp: datetime, alpha: float):
+        rate = self.rate(value, timestamp)
+        if rate is not None:
+            self.rates.push(rate)
+        self.window.push(value)
+        self.ewma = (
+            value if self.ewma is None else alpha * value + (1 - alpha) * self.ewma
+        )
+        self.last_value = value
+        self.last_time = timestamp
+
+
+class Detection:
+    """
+    Evaluación de las lecturas de una transacción. El estado compartido solo
+    cambia con apply(), que se llama después del commit; si la transacción
+    falla, basta con descartarla.
+
+    La primera lectura de cada dispositivo se evalúa contra el estado
+    compartido sin copiarlo; solo si el mismo dispositivo vuelve a aparecer se
+    copia su estado y se le suman las muestras ya evaluadas.
+    """
+
+    def __init__(self, detector: "AnomalyDetector"):
+        self.detector = detector
+        self._states = {}  # serial_number -> {métrica: WindowStats} (copias)
+        self._samples = {}  # serial_number -> [(métrica, valor, timestamp, activas)]
+
+    def observe(
+        self, serial_number: str, timestamp: datetime, measurements: dict
+    ) -> List[dict]:
+        """
+        Evalúa una lectura (columnas de extract_measurements). Retorna las
+        alertas nuevas como diccionarios con metric, kind, value, reference,
+        zscore y rate_per_second.
+        """
+        detector = self.detector
+        samples = self._samples.setdefault(serial_number, [])
+        state = self._states.get(serial_number)
+        if state is None and samples:
+            state = detector.snapshot(serial_number)
+            for metric, value, sample_time, active in samples:
+                state[metric].active = set(active)
+                state[metric].push(value, sample_time, detector.alpha)
+            self._states[serial_number] = state
+
+        if state is None:
+            alerts, new_samples = detector.evaluate(
+                serial_number, timestamp, measurements
+            )
+        else:
+            alerts, new_samples = detector.evaluate_state(
+                state, timestamp, measurements, push=True
+            )
+        samples.extend(new_samples)
+        return alerts
+
+    def apply(self):
+        """
+        Aplica las muestras evaluadas al estado compartido.
+        """
+        self.detector.apply(self._samples)
+        self._samples = {}
+        self._states = {}
+
+
+class AnomalyDetector:
+    """
+    Estado por dispositivo (serial_number -> {métrica: WindowStats}), con
+    como máximo max_devices dispositivos (se descarta el menos reciente).
+    """
+
+    def __init__(
+        self,
+        window_size: int = ANOMALY_WINDOW_SIZE,
+        min_samples: int = ANOMALY_MIN_SAMPLES,
+        alpha: float = ANOMALY_EWMA_ALPHA,
+        zscore: float = ANOMALY_ZSCORE,
+        creep_sigma: float = ANOMALY_CREEP_SIGMA,
+        rate_zscore: float = ANOMALY_RATE_ZSCORE,
+        max_devices: int = ANOMALY_MAX_DEVICES,
+        nominal_voltage: float = ANALYTICS_NOMINAL_VOLTAGE,
+        voltage_tolerance: float = ANALYTICS_VOLTAGE_TOLERANCE,
+        leakage_limit: float = ANALYTICS_LEAKAGE_LIMIT,
+    ):
+        self.window_size = window_size
+        self.min_samples = max(min_samples, 2)
+        self.alpha = alpha
+        # Desviación estándar de la EWMA relativa a la de las muestras
+        self.ewma_factor = math.sqrt(alpha / (2 - alpha))
+        self.zscore = zscore
+        self.creep_sigma = creep_sigma
+        self.rate_zscore = rate_zscore
+        self.max_devices = max_devices
+        self.sag_below = nominal_voltage * (1 - voltage_tolerance)
+        self.swell_above = nominal_voltage * (1 + voltage_tolerance)
+        self.leakage_limit = leakage_limit
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _device(self, serial_number: str) -> dict:
+        state = self._devices.get(serial_number)
+        if state is None:
+            state = {metric: WindowStats(self.window_size) for metric in METRICS}
+            self._devices[serial_number] = state
+            if len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(serial_number)
+        return state
+
+    def snapshot(self, serial_number: str) -> dict:
+        """
+        Copia del estado de un dispositivo (vacío si no se conoce).
+        """
+        with self._lock:
+            state = self._devices.get(serial_number)
+            if state is None:
+                return {metric: WindowStats(self.window_size) for metric in METRICS}
+            return {metric: stats.copy() for metric, stats in state.items()}
+
+    def conditions(
+        self, metric: str, value: float, rate: Optional[float], stats: WindowStats
+    ) -> dict:
+        """
+        Condiciones que se cumplen para la muestra: tipo -> (referencia, z).
+        Se evalúan contra la ventana previa a la muestra.
+        """
+        conditions = {}
+        mean, std = stats.mean, stats.std
+        z = None
+        if stats.count >= self.min_samples and std:
+            z = (value - mean) / std
+            if abs(z) > self.zscore:
+                conditions[SPIKE] = (mean, z)
+
+        # Tasa de cambio fuera de lo habitual para el dispositivo: detecta
+        # escalones y rampas rápidas aunque el valor siga dentro de la ventana
+        rates = stats.rates
+        if rate is not None and rates.count >= self.min_samples and rates.std:
+            rate_z = (rate - rates.mean) / rates.std
+            if abs(rate_z) > self.rate_zscore:
+                conditions[RATE_OF_CHANGE] = (rates.mean, rate_z)
+
+        if metric in VOLTAGE_METRICS:
+            if value < self.sag_below:
+                conditions[VOLTAGE_SAG] = (self.sag_below, z)
+            elif value > self.swell_above:
+                conditions[VOLTAGE_SWELL] = (self.swell_above, z)
+        elif metric == LEAKAGE_METRIC:
+            if self.leakage_limit and value > self.leakage_limit:
+                conditions[LEAKAGE_HIGH] = (self.leakage_limit, z)
+            if stats.count >= self.min_samples and std:
+                # Carta de control EWMA: un corrimiento sostenido y pequeño
+                # separa la EWMA de la media antes de generar un pico
+                ewma = self.alpha * value + (1 - self.alpha) * stats.ewma
+                ewma_std = std * self.ewma_factor
+                # Histéresis: una vez disparada, se mantiene hasta bajar a la
+                # mitad del umbral para no alertar en cada oscilación
+                sigma = self.creep_sigma
+                if LEAKAGE_CREEP in stats.active:
+                    sigma /= 2
+                if ewma > mean + sigma * ewma_std:
+                    conditions[LEAKAGE_CREEP] = (mean, (ewma - mean) / ewma_std)
+        return conditions
+
+    def evaluate_state(
+        self, state: dict, timestamp: datetime, measurements: dict, push: bool
+    ) -> tuple:
+        """
+        Evalúa una lectura contra state. Retorna (alertas, muestras), con las
+        muestras como (métrica, valor, timestamp, alertas activas); con push
+        también las agrega a state.
+        """
+        alerts = []
+        samples = []
+        for metric in METRICS:
+            value = measurements.get(metric)
+            if value is None:
+                continue
+            stats = state[metric]
+            rate = stats.rate(value, timestamp)
+            conditions = self.conditions(metric, value, rate, stats)
+            for kind, (reference, z) in conditions.items():
+                if kind not in stats.active:
+                    alerts.append(
+                        {
+                            "metric": metric,
+                            "kind": kind,
+                            "value": value,
+                            "reference": reference,
+                            "zscore": z,
+                            "rate_per_second": rate,
+                        }
+                    )
+            samples.append((metric, value, timestamp, frozenset(conditions)))
+            if push:
+                stats.active = set(conditions)
+                stats.push(value, timestamp, self.alpha)
+        return alerts, samples
+
+    def evaluate(
+        self, serial_number: str, timestamp: datetime, measurements: dict
+    ) -> tuple:
+        """
+        Evalúa una lectura contra el estado compartido sin modificarlo.
+        """
+        with self._lock:
+            state = self._devices.get(serial_number)
+            if state is None:
+                state = {metric: WindowStats(self.window_size) for metric in METRICS}
+            return self.evaluate_state(state, timestamp, measurements, push=False)
+
+    def begin(self) -> Detection:
+        """
+        Nueva evaluación para las lecturas de una transacción.
+        """
+        return Detection(self)
+
+    def apply(self, samples: dict):
+        """
+        Agrega al estado las muestras de una transacción confirmada
+        (serial_number -> [(métrica, valor, timestamp, alertas activas)]).
+        """
+        with self._lock:
+            for serial_number, device_samples in samples.items():
+                if not device_samples:
+                    continue
+                state = self._device(serial_number)
+                for metric, value, timestamp, active in device_samples:
+                    state[metric].active = set(active)
+                    state[metric].push(value, timestamp, self.alpha)
+
+    def observe(
+        self, serial_number: str, timestamp: datetime, measurements: dict
+    ) -> List[dict]:
+        """
+        Evalúa una lectura y actualiza el estado en el acto (sin transacción).
+        """
+        detection = self.begin()
+        alerts = detection.observe(serial_number, timestamp, measurements)
+        detection.apply()
+        return alerts
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"devices": len(self._devices), "max_devices": self.max_devices}
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+
+
+anomaly_detector = AnomalyDetector()
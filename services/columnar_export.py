@@ -0,0 +1,285 @@
+"""
+Exportación columnar binaria de lecturas para análisis masivo.
+
+El flujo se compone de una cabecera y bloques de hasta EXPORT_BATCH_SIZE
+filas, todo en little-endian:
+
+    Cabecera  b"EQC1" | u8 versión | u8 bytes por float (4 u 8)
+              | u16 columnas float, cada una u8 largo + nombre ascii
+              | u16 columnas switch, cada una u8 largo + nombre ascii
+    Bloque    u32 filas (0 = fin del flujo)
+              | u16 dispositivos nuevos, cada uno u16 largo + serial utf-8
+              | u16 estados nuevos, cada uno u16 largo + alarm_status utf-8
+              | i64[filas] created_at en microsegundos desde epoch (UTC)
+              | u16[filas] índice de dispositivo
+              | u16[filas] índice de alarm_status
+              | por columna float: f32/f64[filas] (NaN = nulo)
+              | por columna switch: u8[filas] (0 falso, 1 verdadero, 255 nulo)
+
+Los diccionarios de dispositivos y estados son acumulativos: cada bloque solo
+agrega las entradas nuevas y los índices apuntan a la lista completa. Solo se
+exportan las mediciones tipadas (los extras JSON quedan fuera).
+"""
+
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from core.config import EXPORT_BATCH_SIZE
+from models.models import EnergyDevice, EnergyReading
+from services.measurements import MEASUREMENT_COLUMNS, SWITCH_COLUMNS
+
+MAGIC = b"EQC1"
+VERSION = 1
+MIMETYPE = "application/vnd.eneraq.columnar"
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NULL_SWITCH = 255
+_FLOAT_TYPECODES = {4: "f", 8: "d"}
+
+
+def _packed(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _names(names) -> bytes:
+    parts = [struct.pack("<H", len(names))]
+    for name in names:
+        encoded = name.encode("ascii")
+        parts.append(struct.pack("<B", len(encoded)) + encoded)
+    return b"".join(parts)
+
+
+def _strings(values: List[str]) -> bytes:
+    parts = [struct.pack("<H", len(values))]
+    for value in values:
+        encoded = value.encode("utf-8")
+        parts.append(struct.pack("<H", len(encoded)) + encoded)
+    return b"".join(parts)
+
+
+def encode_header(float_size: int = 4) -> bytes:
+    if float_size not in _FLOAT_TYPECODES:
+        raise ValueError("precision debe ser 32 o 64")
+    return (
+        MAGIC
+        + struct.pack("<BB", VERSION, float_size)
+        + _names(MEASUREMENT_COLUMNS)
+        + _names(SWITCH_COLUMNS)
+    )
+
+
+class ColumnarEncoder:
+    """
+    Codifica bloques de filas (created_at, serial_number, alarm_status,
+    *MEASUREMENT_COLUMNS, *SWITCH_COLUMNS) manteniendo los diccionarios.
+    """
+
+    def __init__(self, float_size: int = 4):
+        self.header = encode_header(float_size)
+        self.float_typecode = _FLOAT_TYPECODES[float_size]
+        self._devices = {}
+        self._statuses = {}
+
+    @staticmethod
+    def _index(dictionary: dict, value: str, new: list) -> int:
+        index = dictionary.get(value)
+        if index is None:
+            if len(dictionary) >= 0xFFFF:
+                raise ValueError("Demasiados valores distintos para exportar")
+            index = dictionary[value] = len(dictionary)
+            new.append(value)
+        return index
+
+    def encode(self, rows: list) -> bytes:
+        # Transponer una sola vez: cada columna se empaqueta de forma contigua
+        created_at, serials, alarm_statuses, *values = zip(*rows)
+        new_devices, new_statuses = [], []
+        devices = self._devices
+        statuses = self._statuses
+
+        device_indexes = array(
+            "H",
+            [
+                (
+                    devices[serial]
+                    if serial in devices
+                    else self._index(devices, serial, new_devices)
+                )
+                for serial in serials
+            ],
+        )
+        status_indexes = array(
+            "H",
+            [
+                (
+                    statuses[status]
+                    if status in statuses
+                    else self._index(statuses, status, new_statuses)
+                )
+                for status in alarm_statuses
+            ],
+        )
+        timestamps = array(
+            "q", [(value - _EPOCH) // _MICROSECOND for value in created_at]
+        )
+
+        parts = [
+            struct.pack("<I", len(rows)),
+            _strings(new_devices),
+            _strings(new_statuses),
+            _packed(timestamps),
+            _packed(device_indexes),
+            _packed(status_indexes),
+        ]
+        nan = float("nan")
+        measurements = values[: len(MEASUREMENT_COLUMNS)]
+        switches = values[len(MEASUREMENT_COLUMNS) :]
+        for column in measurements:
+            parts.append(
+                _packed(
+                    array(
+                        self.float_typecode,
+                        [nan if value is None else value for value in column],
+                    )
+                )
+            )
+        for column in switches:
+            parts.append(
+                bytes([_NULL_SWITCH if value is None else value for value in column])
+            )
+        return b"".join(parts)
+
+    @staticmethod
+    def end() -> bytes:
+        return struct.pack("<I", 0)
+
+
+def _export_query(
+    serial_numbers: Optional[List[str]],
+    start: Optional[datetime],
+    end: Optional[datetime],
+):
+    query = select(
+        EnergyReading.created_at,
+        EnergyDevice.serial_number,
+        EnergyReading.alarm_status,
+        *(getattr(EnergyReading, column) for column in MEASUREMENT_COLUMNS),
+        *(getattr(EnergyReading, column) for column in SWITCH_COLUMNS),
+    ).join(EnergyDevice, EnergyReading.device_id == EnergyDevice.id)
+    if serial_numbers:
+        query = query.where(EnergyDevice.serial_number.in_(serial_numbers))
+    if start:
+        query = query.where(EnergyReading.created_at >= start)
+    if end:
+        query = query.where(EnergyReading.created_at < end)
+    return query.order_by(EnergyReading.created_at, EnergyReading.id)
+
+
+def iter_export(
+    db: Session,
+    serial_numbers: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    float_size: int = 4,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Genera el flujo columnar (cabecera, un bloque por lote y el bloque final)
+    leyendo con un cursor del lado del servidor en lotes de batch_size.
+    """
+    encoder = ColumnarEncoder(float_size)
+    yield encoder.header
+    # Core en lugar del ORM: las filas no pasan por el procesamiento de entidades
+    result = (
+        db.connection()
+        .execution_options(stream_results=True, yield_per=batch_size)
+        .execute(_export_query(serial_numbers, start, end))
+    )
+    for rows in result.partitions():
+        yield encoder.encode(rows)
+    yield encoder.end()
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.position = 0
+
+    def take(self, size: int) -> memoryview:
+        if self.position + size > len(self.data):
+            raise ValueError("Flujo columnar truncado")
+        chunk = self.data[self.position : self.position + size]
+        self.position += size
+        return chunk
+
+    def unpack(self, fmt: str):
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))
+
+    def array(self, typecode: str, count: int) -> array:
+        values = array(typecode)
+        values.frombytes(self.take(values.itemsize * count))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def names(self, length_format: str, encoding: str) -> List[str]:
+        (count,) = self.unpack("<H")
+        names = []
+        for _ in range(count):
+            (length,) = self.unpack(length_format)
+            names.append(bytes(self.take(length)).decode(encoding))
+        return names
+
+
+def decode_export(data: bytes) -> dict:
+    """
+    Decodifica un flujo completo en columnas: created_at (µs desde epoch),
+    serial_number, alarm_status y una lista por cada columna de medición o
+    switch (None para nulos).
+    """
+    reader = _Reader(data)
+    if bytes(reader.take(4)) != MAGIC:
+        raise ValueError("No es un flujo columnar de EneraQ")
+    version, float_size = reader.unpack("<BB")
+    if version != VERSION or float_size not in _FLOAT_TYPECODES:
+        raise ValueError("Versión o precisión no soportada")
+    float_columns = reader.names("<B", "ascii")
+    switch_columns = reader.names("<B", "ascii")
+
+    columns = {
+        name: []
+        for name in ["created_at", "serial_number", "alarm_status"]
+        + float_columns
+        + switch_columns
+    }
+    devices, statuses = [], []
+    while True:
+        (count,) = reader.unpack("<I")
+        if not count:
+            break
+        devices.extend(reader.names("<H", "utf-8"))
+        statuses.extend(reader.names("<H", "utf-8"))
+        columns["created_at"].extend(reader.array("q", count))
+        columns["serial_number"].extend(devices[i] for i in reader.array("H", count))
+        columns["alarm_status"].extend(statuses[i] for i in reader.array("H", count))
+        for name in float_columns:
+            columns[name].extend(
+                None if value != value else value
+                for value in reader.array(_FLOAT_TYPECODES[float_size], count)
+            )
+        for name in switch_columns:
+            columns[name].extend(
+                None if value == _NULL_SWITCH else bool(value)
+                for value in reader.take(count)
+            )
+    return columns
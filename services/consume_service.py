@@ -1,39 +1,139 @@
-from typing import List
-from models.models import EnergyDevice, EnergyReading, DeviceAlive
-from sqlalchemy.orm import Session, joinedload
+import uuid
+from typing import Iterator, List, Optional
+from models.models import EnergyDevice, EnergyReading
+from services.device_registry import device_registry, DeviceEntry
+from services.pagination import encode_cursor, decode_cursor
+from services.rollup_service import update_rollups
+from services.presence_service import record_heartbeats
+from services.latest_reading_service import (
+    update_latest_readings,
+    latest_reading_cache,
+)
+from services.event_bus import event_bus, READING
+from services.alert_service import detect_anomalies, confirm_alerts
+from services.idempotency import derive_key, recent_keys, DuplicateRequest
+from services.measurements import MEASUREMENT_COLUMNS, split_reading, raw_data_values
+from services.serializers import (
+    DEVICE_COLUMNS,
+    READING_COLUMNS,
+    READING_WIDTH,
+    device_row,
+    reading_row,
+    reading_rows,
+)
+from core.config import RAW_DATA_STORAGE
+from core.ids import uuid7
+from core.response_cache import response_cache, SENSOR_DATA
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from datetime import datetime
+import dateutil.parser
 
+MISSING_FIRMWARE = "Un dispositivo nuevo requiere 'stm32_details.firmware_version'"
 
-def save_sensor_data(db: Session, sensor_data: dict):
+
+def _device_alive_values(sensor_data: dict) -> dict:
     """
-    Guarda los datos del sensor en la base de datos.
-    - Si el dispositivo no existe, lo crea.
-    - Inserta un registro con la data recibida.
+    Extrae los campos de un heartbeat (payload con 'serial_number').
     """
+    timestamp_str = sensor_data.get("timestamp")
+    timestamp = (
+        datetime.fromisoformat(timestamp_str) if timestamp_str else datetime.utcnow()
+    )
+    return {
+        "device_name": sensor_data.get("device_name", "Unknown Device"),
+        "mac_address": sensor_data.get("mac_address", "00:00:00:00:00:00"),
+        "serial_number": sensor_data["serial_number"],
+        "state_duration": sensor_data.get("state_duration", 0),
+        "timestamp": timestamp,
+    }
 
-    if "serial_number" in sensor_data:
-        serial_number = sensor_data["serial_number"]
-        device_name = sensor_data.get("device_name", "Unknown Device")
-        mac_address = sensor_data.get("mac_address", "00:00:00:00:00:00")
-        state_duration = sensor_data.get("state_duration", 0)
-        timestamp_str = sensor_data.get("timestamp")
-        timestamp = (
-            datetime.fromisoformat(timestamp_str)
-            if timestamp_str
-            else datetime.utcnow()
+
+def _reading_values(sensor_data: dict) -> dict:
+    """
+    Extrae los campos de una lectura stm32 (sin device_id): mediciones
+    tipadas, extras JSON y el payload crudo según RAW_DATA_STORAGE.
+    """
+    values = {
+        "alarm_status": sensor_data.get("alarm_status", {}).get("status", "unknown"),
+    }
+    values.update(
+        split_reading(
+            sensor_data.get("voltages", {}),
+            sensor_data.get("currents", {}),
+            sensor_data.get("measurements", {}),
+            sensor_data.get("ln_switch_status", {}),
         )
+    )
+    values.update(raw_data_values(sensor_data, RAW_DATA_STORAGE))
+    return values
+
+
+def _measurements(values: dict) -> dict:
+    return {column: values[column] for column in MEASUREMENT_COLUMNS}
+
+
+def reading_key(sensor_data: dict, idempotency_key: Optional[str] = None):
+    """
+    Clave de idempotencia de una lectura stm32: la del header, o derivada del
+    serial_number, el timestamp del dispositivo y el contenido. None si no
+    aplica (heartbeats, o lecturas sin timestamp ni header).
+    """
+    stm32_details = sensor_data.get("stm32_details", {})
+    serial_number = stm32_details.get("serial_number")
+    if "serial_number" in sensor_data or not serial_number:
+        return None
+    return derive_key(
+        "reading",
+        serial_number,
+        sensor_data,
+        header=idempotency_key,
+        timestamp=sensor_data.get("timestamp") or stm32_details.get("timestamp"),
+    )
 
-        device_alive = DeviceAlive(
-            device_name=device_name,
-            mac_address=mac_address,
-            serial_number=serial_number,
-            state_duration=state_duration,
-            timestamp=timestamp,
+
+def _existing_reading_ids(db: Session, keys: List[str]) -> dict:
+    """
+    Ids de las lecturas ya guardadas con alguna de las claves.
+    """
+    rows = db.execute(
+        select(EnergyReading.idempotency_key, EnergyReading.id).where(
+            EnergyReading.idempotency_key.in_(keys)
         )
-        db.add(device_alive)
+    )
+    return dict(rows.all())
+
+
+def validate_sensor_data(sensor_data: dict):
+    """
+    Valida un payload de sensor sin tocar la base de datos.
+    Lanza ValueError si no es un heartbeat ni una lectura stm32 válida.
+    """
+    if not isinstance(sensor_data, dict):
+        raise ValueError("El JSON recibido debe ser un objeto")
+    if "serial_number" in sensor_data:
+        return
+    if not sensor_data.get("stm32_details", {}).get("serial_number"):
+        raise ValueError("El JSON recibido no contiene 'serial_number'")
+
+
+def save_sensor_data(
+    db: Session, sensor_data: dict, idempotency_key: Optional[str] = None
+):
+    """
+    Guarda los datos del sensor en la base de datos.
+    - Heartbeats: actualiza el estado del dispositivo (ver record_heartbeats).
+    - Lecturas: si el dispositivo no existe, lo crea e inserta la lectura.
+      Lanza DuplicateRequest si la lectura ya fue guardada (ver reading_key).
+    """
+
+    if "serial_number" in sensor_data:
+        # Heartbeat: actualiza el estado actual y registra solo los cambios
+        presence = record_heartbeats(db, [_device_alive_values(sensor_data)])[0]
         db.commit()
-        db.refresh(device_alive)
-        return device_alive
+        db.refresh(presence)
+        return presence
     else:
         # Extraer detalles principales del JSON
         stm32_details = sensor_data.get("stm32_details", {})
@@ -43,48 +143,489 @@ def save_sensor_data(db: Session, sensor_data: dict):
         if not serial_number:
             raise ValueError("El JSON recibido no contiene 'serial_number'")
 
-        # 1️⃣ Buscar dispositivo por serial_number
-        device = (
-            db.query(EnergyDevice)
-            .filter(EnergyDevice.serial_number == serial_number)
-            .first()
-        )
+        # Un reintento reciente se rechaza sin tocar la base
+        key = reading_key(sensor_data, idempotency_key)
+        recent_keys.check(key)
 
-        # 2️⃣ Si no existe, lo creamos
-        if not device:
-            device = EnergyDevice(
-                serial_number=serial_number,
-                firmware_version=firmware_version,
-            )
-            db.add(device)
-            db.flush()  # Para obtener el id sin hacer commit todavía
+        # 1️⃣ Resolver el dispositivo (caché, consulta o creación)
+        devices = _resolve_devices(db, {serial_number: firmware_version})
+        if serial_number not in devices:
+            raise ValueError(MISSING_FIRMWARE)
 
-        # 3️⃣ Crear un nuevo registro con la info
+        # 2️⃣ Crear un nuevo registro con la info, actualizar los rollups y
+        # evaluar anomalías
+        values = _reading_values(sensor_data)
         record = EnergyReading(
-            device_id=device.id,
-            alarm_status=sensor_data.get("alarm_status", {}).get("status", "unknown"),
-            switch_status=sensor_data.get("ln_switch_status", {}),
-            current_measurements=sensor_data.get("currents", {}),
-            power_measurements=sensor_data.get("measurements", {}),
-            voltage_measurements=sensor_data.get("voltages", {}),
-            raw_data=sensor_data,
+            id=uuid7(),
+            device_id=devices[serial_number].id,
+            created_at=datetime.utcnow(),
+            idempotency_key=key,
+            **values,
         )
 
-        db.add(record)
+        if key:
+            # El índice único rechaza los reintentos que ya no están en caché
+            # (add dentro del savepoint: begin_nested hace flush de lo pendiente)
+            try:
+                with db.begin_nested():
+                    db.add(record)
+                    db.flush()
+            except IntegrityError:
+                record_id = _existing_reading_ids(db, [key]).get(key)
+                if record_id is None:
+                    raise
+                recent_keys.remember(key, record_id)
+                recent_keys.count_duplicate()
+                raise DuplicateRequest(key, record_id)
+        else:
+            db.add(record)
+        update_rollups(
+            db, [(record.device_id, record.created_at, _measurements(values))]
+        )
+        latest = update_latest_readings(db, [(record, serial_number)])
+        alerts, detection = detect_anomalies(
+            db,
+            [
+                (
+                    serial_number,
+                    dict(
+                        values,
+                        id=record.id,
+                        device_id=record.device_id,
+                        created_at=record.created_at,
+                    ),
+                )
+            ],
+        )
 
-        # 4️⃣ Guardar cambios
+        # 3️⃣ Guardar cambios
         db.commit()
         db.refresh(record)
+        _remember_devices(devices)
+        recent_keys.remember(key, record.id)
+        latest_reading_cache.remember(latest)
+        response_cache.bump(SENSOR_DATA)
+        _publish_readings([(record, serial_number)])
+        confirm_alerts(alerts, detection)
 
         return record
 
 
+def _resolve_devices(db: Session, firmware_by_serial: dict) -> dict:
+    """
+    Resuelve serial_number -> DeviceEntry para todos los seriales recibidos.
+    - Consulta la caché de dispositivos y hace una sola consulta para los fallos.
+    - Crea en bloque los dispositivos que no existen. Los que no reportan
+      firmware_version (columna obligatoria) no se crean y quedan fuera del
+      resultado.
+    - Actualiza firmware_version cuando el dispositivo reporta una versión nueva.
+
+    No hace commit; llamar a _remember_devices después de confirmar.
+    """
+    devices = {}
+    misses = []
+    for serial_number in firmware_by_serial:
+        entry = device_registry.get(serial_number)
+        if entry is None:
+            misses.append(serial_number)
+        else:
+            devices[serial_number] = entry
+
+    if misses:
+        rows = db.query(
+            EnergyDevice.serial_number, EnergyDevice.id, EnergyDevice.firmware_version
+        ).filter(EnergyDevice.serial_number.in_(misses))
+        for serial_number, device_id, firmware_version in rows:
+            devices[serial_number] = DeviceEntry(device_id, firmware_version)
+
+    # Crear en bloque los dispositivos que faltan
+    now = datetime.utcnow()
+    new_devices = {
+        serial_number: {
+            "id": uuid7(),
+            "serial_number": serial_number,
+            "firmware_version": firmware_version,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for serial_number, firmware_version in firmware_by_serial.items()
+        if serial_number not in devices and firmware_version
+    }
+    if new_devices:
+        devices.update(_insert_missing_devices(db, new_devices))
+
+    # Actualizar la versión de firmware si cambió
+    firmware_updates = []
+    for serial_number, firmware_version in firmware_by_serial.items():
+        entry = devices.get(serial_number)
+        if (
+            entry is not None
+            and firmware_version
+            and firmware_version != entry.firmware_version
+        ):
+            firmware_updates.append(
+                {
+                    "id": entry.id,
+                    "firmware_version": firmware_version,
+                    "updated_at": now,
+                }
+            )
+            devices[serial_number] = DeviceEntry(entry.id, firmware_version)
+    if firmware_updates:
+        db.execute(update(EnergyDevice), firmware_updates)
+
+    return devices
+
+
+def _publish_readings(readings: List[tuple]):
+    """
+    Publica en el bus de eventos las lecturas ya confirmadas,
+    dadas como (EnergyReading, serial_number).
+    """
+    events = []
+    for record, serial_number in readings:
+        reading = record.to_dict()
+        reading["serial_number"] = serial_number
+        events.append((READING, serial_number, record.alarm_status, reading))
+    event_bus.publish_many(events)
+
+
+def _duplicate_result(index: int, record_id) -> dict:
+    return {
+        "index": index,
+        "status": "duplicate",
+        "type": "reading",
+        "id": str(record_id) if record_id else None,
+    }
+
+
+def _remember_devices(devices: dict):
+    """
+    Guarda en la caché los dispositivos de una transacción ya confirmada.
+    """
+    for serial_number, entry in devices.items():
+        device_registry.put(serial_number, entry.id, entry.firmware_version)
+
+
+def _insert_missing_devices(db: Session, new_devices: dict) -> dict:
+    """
+    Inserta en bloque los dispositivos nuevos dentro de un savepoint.
+    Si otro proceso creó alguno en paralelo, usa el existente y reintenta
+    con el resto.
+
+    Retorna un diccionario serial_number -> DeviceEntry.
+    """
+    devices = {}
+    while new_devices:
+        try:
+            with db.begin_nested():
+                db.execute(insert(EnergyDevice), list(new_devices.values()))
+        except IntegrityError:
+            existing = db.query(
+                EnergyDevice.serial_number,
+                EnergyDevice.id,
+                EnergyDevice.firmware_version,
+            ).filter(EnergyDevice.serial_number.in_(new_devices.keys()))
+            found = {
+                serial_number: DeviceEntry(device_id, firmware_version)
+                for serial_number, device_id, firmware_version in existing
+            }
+            if not found:
+                raise
+            devices.update(found)
+            new_devices = {
+                serial: values
+                for serial, values in new_devices.items()
+                if serial not in found
+            }
+            continue
+        devices.update(
+            {
+                serial: DeviceEntry(values["id"], values["firmware_version"])
+                for serial, values in new_devices.items()
+            }
+        )
+        break
+    return devices
+
+
+def _insert_readings(db: Session, rows: List[dict]) -> dict:
+    """
+    Inserta en bloque las lecturas. Si alguna tiene clave de idempotencia, el
+    insert va en un savepoint: ante un conflicto se buscan las claves ya
+    guardadas y se reintenta sin esas filas.
+
+    Retorna un diccionario clave -> id de las lecturas duplicadas (no
+    insertadas).
+    """
+    keys = [row["idempotency_key"] for row in rows if row["idempotency_key"]]
+    if not keys:
+        db.execute(insert(EnergyReading), rows)
+        return {}
+
+    duplicates = {}
+    while rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(EnergyReading), rows)
+            break
+        except IntegrityError:
+            found = _existing_reading_ids(db, keys)
+            if not found.keys() - duplicates.keys():
+                raise
+            duplicates.update(found)
+            rows = [row for row in rows if row["idempotency_key"] not in found]
+    return duplicates
+
+
+def save_sensor_data_batch(
+    db: Session,
+    items: List[dict],
+    idempotency_keys: Optional[List[Optional[str]]] = None,
+) -> List[dict]:
+    """
+    Guarda un lote mixto de lecturas stm32 y heartbeats en una sola transacción.
+    - Resuelve todos los serial_number con una única consulta.
+    - Crea en bloque los dispositivos que no existen.
+    - Inserta las lecturas con inserts masivos y actualiza el estado de los
+      dispositivos con los heartbeats, todo con un solo commit.
+    - Las lecturas ya guardadas (ver reading_key; idempotency_keys trae la
+      clave del header de cada elemento) se informan con estado "duplicate".
+
+    Retorna una lista con el estado de cada elemento, en el mismo orden.
+    """
+    results: List[dict] = [None] * len(items)
+    alive_rows = []
+    pending_readings = []  # (index, serial_number, firmware_version, values)
+    batch_keys = set()
+
+    # 1️⃣ Validar y clasificar cada elemento
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Cada elemento del lote debe ser un objeto JSON")
+
+            if "serial_number" in item:
+                alive_rows.append(_device_alive_values(item))
+                results[index] = {
+                    "index": index,
+                    "status": "success",
+                    "type": "heartbeat",
+                    "serial_number": item["serial_number"],
+                }
+            else:
+                stm32_details = item.get("stm32_details", {})
+                serial_number = stm32_details.get("serial_number")
+                if not serial_number:
+                    raise ValueError("El JSON recibido no contiene 'serial_number'")
+                key = reading_key(
+                    item, idempotency_keys[index] if idempotency_keys else None
+                )
+                if key in batch_keys:
+                    raise DuplicateRequest(key, None)
+                recent_keys.check(key)
+                if key:
+                    batch_keys.add(key)
+                values = _reading_values(item)
+                values["idempotency_key"] = key
+                pending_readings.append(
+                    (
+                        index,
+                        serial_number,
+                        stm32_details.get("firmware_version"),
+                        values,
+                    )
+                )
+        except DuplicateRequest as duplicate:
+            results[index] = _duplicate_result(index, duplicate.record_id)
+        except (ValueError, TypeError) as e:
+            results[index] = {"index": index, "status": "error", "message": str(e)}
+
+    insert_rows = []
+    reading_serials = []
+    reading_indexes = []
+    new_readings = []
+    devices = {}
+    latest = []
+    alerts, detection = [], None
+    if pending_readings:
+        # 2️⃣ Resolver todos los dispositivos (caché + una sola consulta)
+        firmware_by_serial = {}
+        for _, serial_number, firmware_version, _ in pending_readings:
+            if firmware_version or serial_number not in firmware_by_serial:
+                firmware_by_serial[serial_number] = firmware_version
+        devices = _resolve_devices(db, firmware_by_serial)
+
+        for index, serial_number, _, values in pending_readings:
+            if serial_number not in devices:
+                results[index] = {
+                    "index": index,
+                    "status": "error",
+                    "message": MISSING_FIRMWARE,
+                }
+                continue
+            values["id"] = uuid7()
+            values["device_id"] = devices[serial_number].id
+            values["created_at"] = datetime.utcnow()
+            insert_rows.append(values)
+            reading_serials.append(serial_number)
+            reading_indexes.append(index)
+            results[index] = {
+                "index": index,
+                "status": "success",
+                "type": "reading",
+                "id": str(values["id"]),
+                "device_id": str(values["device_id"]),
+            }
+
+    # 3️⃣ Inserts masivos y un único commit
+    duplicates = _insert_readings(db, insert_rows) if insert_rows else {}
+    if duplicates:
+        # Reintentos que ya no estaban en caché: los rechazó el índice único
+        kept = []
+        for index, serial_number, values in zip(
+            reading_indexes, reading_serials, insert_rows
+        ):
+            record_id = duplicates.get(values["idempotency_key"])
+            if record_id is None:
+                kept.append((serial_number, values))
+            else:
+                results[index] = _duplicate_result(index, record_id)
+        reading_serials = [serial_number for serial_number, _ in kept]
+        insert_rows = [values for _, values in kept]
+        recent_keys.count_duplicate(len(duplicates))
+    if insert_rows:
+        update_rollups(
+            db,
+            (
+                (values["device_id"], values["created_at"], _measurements(values))
+                for values in insert_rows
+            ),
+        )
+        new_readings = [
+            (EnergyReading(**values), serial_number)
+            for values, serial_number in zip(insert_rows, reading_serials)
+        ]
+        latest = update_latest_readings(db, new_readings)
+        alerts, detection = detect_anomalies(db, zip(reading_serials, insert_rows))
+    if alive_rows:
+        record_heartbeats(db, alive_rows)
+    db.commit()
+    _remember_devices(devices)
+    recent_keys.remember_many(duplicates.items())
+    recent_keys.remember_many(
+        (values["idempotency_key"], values["id"]) for values in insert_rows
+    )
+    latest_reading_cache.remember(latest)
+    if pending_readings:
+        # También cubre los dispositivos creados para el lote
+        response_cache.bump(SENSOR_DATA)
+    _publish_readings(new_readings)
+    confirm_alerts(alerts, detection)
+
+    return results
+
+
 def get_all_energy_devices_with_readings(db: Session) -> List[dict]:
     """
     Obtiene todos los dispositivos de energía con sus lecturas asociadas.
     Retorna una lista de diccionarios.
     """
-    devices = (
-        db.query(EnergyDevice).options(joinedload(EnergyDevice.energy_readings)).all()
+    devices = [device_row(row) for row in db.execute(select(*DEVICE_COLUMNS))]
+
+    # Lecturas proyectadas por columnas y agrupadas por dispositivo
+    readings = {}
+    for row in db.execute(select(*READING_COLUMNS)):
+        readings.setdefault(row[1], []).append(reading_row(row))
+    for device in devices:
+        if device["id"] in readings:
+            device["energy_readings"] = readings[device["id"]]
+    return devices
+
+
+def _readings_query(
+    serial_number: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    alarm_status: Optional[str] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    Construye la consulta de lecturas filtrada y ordenada por (created_at, id)
+    descendente, posicionada después del cursor si se indica.
+    """
+    query = select(*READING_COLUMNS, EnergyDevice.serial_number).join(
+        EnergyDevice, EnergyReading.device_id == EnergyDevice.id
+    )
+
+    if serial_number:
+        query = query.where(EnergyDevice.serial_number == serial_number)
+    if start:
+        query = query.where(EnergyReading.created_at >= start)
+    if end:
+        query = query.where(EnergyReading.created_at < end)
+    if alarm_status:
+        query = query.where(EnergyReading.alarm_status == alarm_status)
+
+    if cursor:
+        position = decode_cursor(cursor)
+        try:
+            created_at = dateutil.parser.isoparse(position["created_at"])
+            reading_id = uuid.UUID(position["id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Cursor inválido")
+        query = query.where(
+            or_(
+                EnergyReading.created_at < created_at,
+                and_(
+                    EnergyReading.created_at == created_at,
+                    EnergyReading.id < reading_id,
+                ),
+            )
+        )
+
+    return query.order_by(EnergyReading.created_at.desc(), EnergyReading.id.desc())
+
+
+def get_energy_readings_page(
+    db: Session, limit: int = 100, cursor: Optional[str] = None, **filters
+) -> dict:
+    """
+    Obtiene una página de lecturas con paginación por cursor (keyset sobre
+    created_at, id), de la más reciente a la más antigua.
+
+    Filtros: serial_number, start, end (rango de created_at) y alarm_status.
+    Retorna las lecturas y el cursor de la siguiente página (None si no hay más).
+    """
+    rows = db.execute(_readings_query(cursor=cursor, **filters).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            {"created_at": last.created_at.isoformat(), "id": str(last.id)}
+        )
+
+    return {
+        "records": reading_rows(rows, serial_index=READING_WIDTH),
+        "next_cursor": next_cursor,
+    }
+
+
+def iter_energy_readings(
+    db: Session, batch_size: int = 1000, cursor: Optional[str] = None, **filters
+) -> Iterator[dict]:
+    """
+    Recorre las lecturas filtradas con un cursor del lado del servidor
+    (yield_per), manteniendo la memoria constante sin importar el tamaño.
+    Las filas se proyectan por columnas, sin objetos ORM en la sesión.
+    """
+    rows = db.execute(
+        _readings_query(cursor=cursor, **filters),
+        execution_options={"yield_per": batch_size},
     )
-    return [device.to_dict(include_readings=True) for device in devices]
+    for row in rows:
+        result = reading_row(row)
+        result["serial_number"] = row[READING_WIDTH]
+        yield result
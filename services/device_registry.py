@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from core.config import DEVICE_CACHE_MAX_SIZE
+
+
+class DeviceEntry(NamedTuple):
+    id: object
+    firmware_version: Optional[str]
+
+
+class DeviceRegistry:
+    """
+    Caché LRU en proceso serial_number -> (id, firmware_version) de EnergyDevice.
+
+    Se llena en cada fallo de caché y solo debe actualizarse con filas ya
+    confirmadas (después del commit), para no guardar ids de transacciones
+    revertidas.
+    """
+
+    def __init__(self, max_size: int = DEVICE_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, DeviceEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, serial_number: str) -> Optional[DeviceEntry]:
+        with self._lock:
+            entry = self._entries.get(serial_number)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(serial_number)
+            self._hits += 1
+            return entry
+
+    def put(self, serial_number: str, device_id, firmware_version: Optional[str]):
+        with self._lock:
+            self._entries[serial_number] = DeviceEntry(device_id, firmware_version)
+            self._entries.move_to_end(serial_number)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, serial_number: str):
+        with self._lock:
+            self._entries.pop(serial_number, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
+
+
+device_registry = DeviceRegistry()
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import List, Optional
+
+from core.config import EVENT_BUFFER_SIZE
+
+READING = "reading"
+SHORT_CIRCUIT = "short_circuit"
+ANOMALY = "anomaly"
+
+
+class EventBus:
+    """
+    Bus pub/sub en proceso para lecturas y alarmas de cortocircuito.
+
+    Los eventos se guardan en un buffer circular con ids crecientes; los
+    suscriptores (SSE o long-poll) leen desde su último id, por lo que publicar
+    un evento cuesta lo mismo sin importar cuántos clientes escuchan.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self._events = deque(maxlen=buffer_size)
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event_type: str, device: Optional[str], level, data: dict):
+        """
+        Publica un evento. device es el serial_number o control_mac y level el
+        nivel de alarma (alarm_status, o "active"/"inactive" en cortocircuitos).
+        """
+        self.publish_many([(event_type, device, level, data)])
+
+    def publish_many(self, events: List[tuple]):
+        if not events:
+            return
+        with self._condition:
+            for event_type, device, level, data in events:
+                self._last_id += 1
+                self._events.append(
+                    {
+                        "id": self._last_id,
+                        "type": event_type,
+                        "device": device,
+                        "level": level,
+                        "data": data,
+                    }
+                )
+            self._condition.notify_all()
+
+    def _matching(self, last_id: int, types, devices, levels) -> List[dict]:
+        # Los ids son consecutivos: los posteriores a last_id son los últimos
+        # self._last_id - last_id del buffer, que se leen desde el final
+        count = min(self._last_id - last_id, len(self._events))
+        if count <= 0:
+            return []
+        tail = list(islice(reversed(self._events), count))
+        tail.reverse()
+        return [
+            event
+            for event in tail
+            if (not types or event["type"] in types)
+            and (not devices or event["device"] in devices)
+            and (not levels or event["level"] in levels)
+        ]
+
+    def wait(
+        self,
+        last_id: int,
+        timeout: float,
+        types=None,
+        devices=None,
+        levels=None,
+    ) -> List[dict]:
+        """
+        Eventos posteriores a last_id que cumplen los filtros. Si no hay, espera
+        hasta timeout segundos a que se publique alguno.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            # Ids de una ejecución anterior del proceso: empezar desde ahora
+            if last_id > self._last_id:
+                last_id = self._last_id
+            while True:
+                events = self._matching(last_id, types, devices, levels)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                # Los eventos que no cumplen los filtros no despiertan al cliente
+                last_id = max(last_id, self._last_id)
+                self._condition.wait(remaining)
+
+
+event_bus = EventBus()
@@ -0,0 +1,126 @@
+"""
+Claves de idempotencia para la ingesta de dispositivos.
+
+Un reintento de un POST se reconoce por su clave: la del header
+Idempotency-Key, o una derivada del dispositivo, el timestamp informado por el
+dispositivo y un hash del contenido. Las claves se guardan en una columna con
+índice único (energy_readings, short_circuits) y las últimas confirmadas en
+una caché LRU en proceso, de modo que un duplicado reciente se rechaza sin
+consultar la base y uno más antiguo lo rechaza el índice al insertar.
+
+Sin header ni timestamp del dispositivo no se deriva clave: dos lecturas
+idénticas pueden ser legítimas.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from core.config import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_DERIVED_KEYS
+from core.serialization import dumps
+
+HEADER = "Idempotency-Key"
+KEY_LENGTH = 32  # blake2b de 16 bytes en hexadecimal
+MAX_HEADER_LENGTH = 255
+
+
+class DuplicateRequest(Exception):
+    """
+    El payload ya fue guardado; record_id es el id del registro original.
+    """
+
+    def __init__(self, key: str, record_id):
+        super().__init__(f"Payload duplicado (clave {key})")
+        self.key = key
+        self.record_id = record_id
+
+
+def derive_key(
+    scope: str,
+    device: str,
+    payload: dict,
+    header: Optional[str] = None,
+    timestamp: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Clave de un payload de scope ("reading", "short_circuit") para un
+    dispositivo. La clave del header se acota al dispositivo para que dos
+    dispositivos no colisionen. Retorna None si no hay con qué derivarla.
+    """
+    if header:
+        if len(header) > MAX_HEADER_LENGTH:
+            raise ValueError(
+                f"{HEADER} no puede superar {MAX_HEADER_LENGTH} caracteres"
+            )
+        material = f"{scope}\0{device}\0header\0{header}".encode("utf-8")
+    elif timestamp and IDEMPOTENCY_DERIVED_KEYS:
+        material = f"{scope}\0{device}\0{timestamp}\0".encode("utf-8") + dumps(
+            payload, sort_keys=True
+        )
+    else:
+        return None
+    return hashlib.blake2b(material, digest_size=KEY_LENGTH // 2).hexdigest()
+
+
+class RecentKeys:
+    """
+    Caché LRU en proceso clave -> id del registro guardado. Solo debe llenarse
+    con registros ya confirmados (después del commit).
+    """
+
+    def __init__(self, max_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._duplicates = 0
+
+    def check(self, key: Optional[str]):
+        """
+        Lanza DuplicateRequest si la clave ya está en la caché.
+        """
+        if key is None:
+            return
+        with self._lock:
+            record_id = self._entries.get(key)
+            if record_id is None:
+                return
+            self._entries.move_to_end(key)
+            self._duplicates += 1
+        raise DuplicateRequest(key, record_id)
+
+    def get(self, key: str):
+        with self._lock:
+            return self._entries.get(key)
+
+    def remember(self, key: Optional[str], record_id):
+        if key is None or not self.max_size:
+            return
+        with self._lock:
+            self._entries[key] = record_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def remember_many(self, entries):
+        for key, record_id in entries:
+            self.remember(key, record_id)
+
+    def count_duplicate(self, amount: int = 1):
+        with self._lock:
+            self._duplicates += amount
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "duplicates": self._duplicates,
+            }
+
+
+recent_keys = RecentKeys()
@@ -0,0 +1,333 @@
+"""
+Correlación de eventos de cortocircuito en incidentes.
+
+Cada evento de short_circuits se procesa al insertarse: un evento activo abre
+un incidente para su control_mac (o se suma al abierto) y uno inactivo lo
+cierra. Los contadores por dispositivo (short_circuit_summaries) y por día
+(short_circuit_daily_stats) se actualizan en la misma transacción, por lo que
+los resúmenes se responden sin recorrer los eventos. Uso:
+
+    python -m services.incident_service   # reconstruye desde short_circuits
+"""
+
+import argparse
+import logging
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only
+
+from models.models import (
+    ShortCircuit,
+    ShortCircuitDailyStats,
+    ShortCircuitIncident,
+    ShortCircuitSummary,
+)
+from services.timestamps import naive_utc
+
+REBUILD_BATCH_SIZE = 1000
+EVENT_COLUMNS = (
+    ShortCircuit.id,
+    ShortCircuit.control_mac,
+    ShortCircuit.wifi_mac,
+    ShortCircuit.timestamp,
+    ShortCircuit.current_active,
+    ShortCircuit.current_duration_seconds,
+    ShortCircuit.previous_active,
+    ShortCircuit.previous_timestamp,
+    ShortCircuit.previous_duration_seconds,
+)
+
+
+def _seconds(start: datetime, end: datetime) -> int:
+    return max(0, int((end - start).total_seconds()))
+
+
+def _add_daily(db: Session, control_mac: str, day: date, trips: int, seconds: int):
+    table = ShortCircuitDailyStats.__table__
+    increment = (
+        update(table)
+        .where(and_(table.c.control_mac == control_mac, table.c.day == day))
+        .values(
+            trips=table.c.trips + trips,
+            active_seconds=table.c.active_seconds + seconds,
+        )
+    )
+    if db.execute(increment).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(
+                insert(table).values(
+                    control_mac=control_mac,
+                    day=day,
+                    trips=trips,
+                    active_seconds=seconds,
+                )
+            )
+    except IntegrityError:
+        # Otro proceso creó la fila del día en paralelo
+        db.execute(increment)
+
+
+def _get_summary(db: Session, control_mac: str) -> ShortCircuitSummary:
+    query = (
+        select(ShortCircuitSummary)
+        .where(ShortCircuitSummary.control_mac == control_mac)
+        .with_for_update()
+    )
+    summary = db.execute(query).scalar_one_or_none()
+    if summary is not None:
+        return summary
+    try:
+        with db.begin_nested():
+            summary = ShortCircuitSummary(
+                control_mac=control_mac,
+                trips=0,
+                active_seconds_total=0,
+                uptime_seconds_total=0,
+                event_count=0,
+            )
+            db.add(summary)
+    except IntegrityError:
+        summary = db.execute(query).scalar_one()
+    return summary
+
+
+def _open_incident(
+    db: Session, summary: ShortCircuitSummary, event: ShortCircuit, started_at
+) -> ShortCircuitIncident:
+    incident = ShortCircuitIncident(
+        control_mac=summary.control_mac,
+        wifi_mac=event.wifi_mac,
+        started_at=started_at,
+        event_count=1,
+        start_event_id=event.id,
+    )
+    db.add(incident)
+    db.flush()
+
+    if summary.last_cleared_at is not None:
+        summary.uptime_seconds_total += _seconds(summary.last_cleared_at, started_at)
+    summary.trips += 1
+    if summary.first_trip_at is None:
+        summary.first_trip_at = started_at
+    summary.last_trip_at = started_at
+    summary.open_incident_id = incident.id
+    _add_daily(db, summary.control_mac, started_at.date(), 1, 0)
+    return incident
+
+
+def _close_incident(
+    db: Session,
+    summary: ShortCircuitSummary,
+    incident: ShortCircuitIncident,
+    event: ShortCircuit,
+    ended_at: datetime,
+    duration: Optional[int] = None,
+):
+    ended_at = max(ended_at, incident.started_at)
+    if duration is None:
+        duration = _seconds(incident.started_at, ended_at)
+    incident.ended_at = ended_at
+    incident.duration_seconds = duration
+    incident.end_event_id = event.id
+    if event.id != incident.start_event_id:
+        incident.event_count += 1
+
+    summary.active_seconds_total += duration
+    summary.last_cleared_at = ended_at
+    summary.open_incident_id = None
+    _add_daily(db, summary.control_mac, incident.started_at.date(), 0, duration)
+
+
+def record_short_circuit_event(
+    db: Session, event: ShortCircuit
+) -> Optional[ShortCircuitIncident]:
+    """
+    Correlaciona un evento recién insertado (ya con id) con los incidentes de
+    su control_mac y actualiza los contadores. No hace commit.
+
+    - Activo: abre un incidente que empezó hace current_duration_seconds, o se
+      suma al que está abierto.
+    - Inactivo: cierra el incidente abierto; la duración es la informada en
+      previous si el estado anterior era activo. Si no había incidente abierto
+      pero previous indica un cortocircuito, se reconstruye ya cerrado.
+
+    Los eventos más antiguos que el último procesado solo se cuentan.
+    Retorna el incidente afectado, o None.
+    """
+    if not event.control_mac:
+        return None
+
+    summary = _get_summary(db, event.control_mac)
+    summary.event_count += 1
+    if event.wifi_mac:
+        summary.wifi_mac = event.wifi_mac
+
+    timestamp = naive_utc(event.timestamp) or datetime.utcnow()
+    if summary.last_event_at is not None and timestamp < summary.last_event_at:
+        return None
+    summary.last_event_at = timestamp
+    state_since = timestamp - timedelta(seconds=event.current_duration_seconds or 0)
+
+    incident = None
+    if summary.open_incident_id is not None:
+        incident = db.get(ShortCircuitIncident, summary.open_incident_id)
+
+    if event.current_active:
+        if incident is not None:
+            incident.event_count += 1
+            return incident
+        return _open_incident(db, summary, event, state_since)
+
+    reported = (
+        event.previous_duration_seconds
+        if event.previous_active and event.previous_duration_seconds is not None
+        else None
+    )
+    if incident is not None:
+        _close_incident(db, summary, incident, event, state_since, reported)
+        return incident
+
+    if reported is not None:
+        # No se recibió el evento de inicio: reconstruir a partir de previous
+        started_at = naive_utc(event.previous_timestamp) or state_since - timedelta(
+            seconds=reported
+        )
+        incident = _open_incident(db, summary, event, started_at)
+        _close_incident(
+            db,
+            summary,
+            incident,
+            event,
+            started_at + timedelta(seconds=reported),
+            reported,
+        )
+        return incident
+
+    return None
+
+
+def rebuild_incidents(db: Session, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """
+    Recalcula incidentes y contadores procesando todos los eventos de
+    short_circuits en orden (timestamp, id), en lotes por keyset. No hace
+    commit. Retorna la cantidad de eventos procesados.
+    """
+    for model in (ShortCircuitIncident, ShortCircuitSummary, ShortCircuitDailyStats):
+        db.execute(delete(model))
+
+    processed = 0
+    position = None
+    while True:
+        # Solo las columnas del evento: la migración 7 corre antes de que
+        # existan las columnas agregadas después
+        query = (
+            select(ShortCircuit)
+            .options(load_only(*EVENT_COLUMNS))
+            .order_by(ShortCircuit.timestamp, ShortCircuit.id)
+        )
+        if position is not None:
+            query = query.where(
+                or_(
+                    ShortCircuit.timestamp > position[0],
+                    and_(
+                        ShortCircuit.timestamp == position[0],
+                        ShortCircuit.id > position[1],
+                    ),
+                )
+            )
+        events = db.execute(query.limit(batch_size)).scalars().all()
+        if not events:
+            break
+        for event in events:
+            record_short_circuit_event(db, event)
+        db.flush()
+        position = (events[-1].timestamp, events[-1].id)
+        for event in events:
+            db.expunge(event)
+        processed += len(events)
+    return processed
+
+
+def get_incident_summaries(db: Session):
+    """
+    Contadores de todos los dispositivos con eventos de cortocircuito.
+    """
+    try:
+        summaries = db.execute(
+            select(ShortCircuitSummary).order_by(ShortCircuitSummary.control_mac)
+        ).scalars()
+        return [summary.to_dict() for summary in summaries], None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_incident_summary(db: Session, control_mac: str, start: date, end: date):
+    """
+    Contadores de un control_mac y totales de incidentes iniciados entre los
+    días start y end (inclusive), leídos de short_circuit_daily_stats.
+    Retorna None si el dispositivo no tiene eventos.
+    """
+    try:
+        summary = db.get(ShortCircuitSummary, control_mac)
+        if summary is None:
+            return None, None
+
+        days = db.execute(
+            select(ShortCircuitDailyStats).where(
+                ShortCircuitDailyStats.control_mac == control_mac,
+                ShortCircuitDailyStats.day >= start,
+                ShortCircuitDailyStats.day <= end,
+            )
+        ).scalars()
+        window = {"start": start.isoformat(), "end": end.isoformat()}
+        window["trips"] = 0
+        window["active_seconds"] = 0
+        for day in days:
+            window["trips"] += day.trips
+            window["active_seconds"] += day.active_seconds
+
+        result = summary.to_dict()
+        if summary.open_incident_id is not None:
+            incident = db.get(ShortCircuitIncident, summary.open_incident_id)
+            result["open_incident"] = incident.to_dict() if incident else None
+        result["window"] = window
+        return result, None
+
+    except Exception as e:
+        return None, str(e)
+
+
+def get_incidents(db: Session, control_mac: Optional[str] = None, limit: int = 50):
+    """
+    Incidentes más recientes, opcionalmente de un solo control_mac.
+    """
+    try:
+        query = select(ShortCircuitIncident)
+        if control_mac:
+            query = query.where(ShortCircuitIncident.control_mac == control_mac)
+        query = query.order_by(
+            ShortCircuitIncident.started_at.desc(), ShortCircuitIncident.id.desc()
+        ).limit(limit)
+        return [incident.to_dict() for incident in db.execute(query).scalars()], None
+    except Exception as e:
+        return None, str(e)
+
+
+if __name__ == "__main__":
+    from core.config import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description="Reconstruye los incidentes de cortocircuito"
+    )
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        processed = rebuild_incidents(db)
+        db.commit()
+    logging.info(f"Eventos procesados: {processed}")
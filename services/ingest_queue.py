@@ -0,0 +1,226 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import List
+
+from core.config import (
+    SessionLocal,
+    INGEST_QUEUE_MAX_SIZE,
+    INGEST_FLUSH_BATCH_SIZE,
+    INGEST_FLUSH_INTERVAL_SECONDS,
+    INGEST_WORKERS,
+)
+from services.consume_service import save_sensor_data_batch
+from services.short_circuit_service import create_short_circuits_batch
+
+SENSOR_DATA = "sensor_data"
+SHORT_CIRCUIT = "short_circuit"
+
+_STOP = object()
+
+
+class IngestQueue:
+    """
+    Cola de escritura diferida (write-behind) para la ingesta de dispositivos.
+
+    Los handlers validan el payload y lo encolan; un pool de workers en segundo
+    plano vacía la cola en micro-lotes (por tamaño o por tiempo) hacia la base
+    de datos.
+    """
+
+    def __init__(
+        self,
+        max_size: int = INGEST_QUEUE_MAX_SIZE,
+        batch_size: int = INGEST_FLUSH_BATCH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL_SECONDS,
+        workers: int = INGEST_WORKERS,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.worker_count = workers
+        self._queue = queue.Queue(maxsize=max_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "flushed": 0,
+            "failed": 0,
+            "duplicates": 0,
+            "flushes": 0,
+            "flush_seconds_total": 0.0,
+            "flush_seconds_max": 0.0,
+            "flush_seconds_last": 0.0,
+        }
+
+    def start(self):
+        """
+        Arranca los workers si todavía no están corriendo.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.worker_count):
+                thread = threading.Thread(
+                    target=self._run, name=f"ingest-worker-{number}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, payload: dict, idempotency_key: str = None) -> bool:
+        """
+        Encola un payload (con la clave del header Idempotency-Key, si vino)
+        sin bloquear. Retorna False si la cola está llena o cerrada
+        (backpressure).
+        """
+        if not self._accepting:
+            self._count("rejected")
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((kind, payload, idempotency_key))
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("enqueued")
+        return True
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Deja de aceptar payloads y espera a que los workers vacíen la cola.
+        """
+        self._accepting = False
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            # put bloqueante: los workers siguen drenando mientras tanto
+            self._queue.put((_STOP, None, None))
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Contadores de la cola: profundidad, payloads procesados y latencia de flush.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            workers = len(self._threads)
+        flushes = stats["flushes"]
+        stats["flush_seconds_avg"] = (
+            stats["flush_seconds_total"] / flushes if flushes else 0.0
+        )
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_max_size"] = self._queue.maxsize
+        stats["workers"] = workers
+        return stats
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+
+            # Acumular hasta batch_size elementos o hasta que venza el intervalo
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item[0] is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            if batch:
+                self._flush(batch)
+            if stop:
+                return
+
+    def _count_results(self, results: list, kind: str):
+        failed = duplicates = 0
+        for result in results:
+            if result["status"] == "duplicate":
+                duplicates += 1
+            elif result["status"] != "success":
+                failed += 1
+                logging.error(f"Ingest queue {kind} rejected: {result}")
+        self._count("flushed", len(results) - failed - duplicates)
+        self._count("duplicates", duplicates)
+        self._count("failed", failed)
+
+    def _flush_sensor_data(self, items: list):
+        """
+        Guarda los payloads en un lote. Si el lote entero falla, se divide a
+        la mitad y se reintenta cada parte, hasta aislar los payloads que
+        fallan solos: el resto se guarda igual.
+        """
+        try:
+            with SessionLocal() as db:
+                results = save_sensor_data_batch(
+                    db,
+                    [payload for _, payload, _ in items],
+                    [key for _, _, key in items],
+                )
+        except Exception as e:
+            if len(items) == 1:
+                logging.error(f"Ingest queue flush error: {e}")
+                self._count("failed")
+                return
+            logging.warning(
+                f"Ingest queue flush error, splitting batch of {len(items)}: {e}"
+            )
+            middle = len(items) // 2
+            self._flush_sensor_data(items[:middle])
+            self._flush_sensor_data(items[middle:])
+            return
+        self._count_results(results, "item")
+
+    def _flush_short_circuits(self, items: list):
+        """
+        Guarda los eventos en una sola sesión y transacción.
+        """
+        try:
+            with SessionLocal() as db:
+                results = create_short_circuits_batch(
+                    db, [(payload, key) for _, payload, key in items]
+                )
+        except Exception as e:
+            logging.error(f"Ingest queue short circuit error: {e}")
+            self._count("failed", len(items))
+            return
+        self._count_results(results, "short circuit")
+
+    def _flush(self, batch: list):
+        started = time.monotonic()
+        sensor_data = [item for item in batch if item[0] == SENSOR_DATA]
+        short_circuits = [item for item in batch if item[0] == SHORT_CIRCUIT]
+
+        if sensor_data:
+            self._flush_sensor_data(sensor_data)
+        if short_circuits:
+            self._flush_short_circuits(short_circuits)
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["flush_seconds_total"] += elapsed
+            self._stats["flush_seconds_last"] = elapsed
+            self._stats["flush_seconds_max"] = max(
+                self._stats["flush_seconds_max"], elapsed
+            )
+
+
+ingest_queue = IngestQueue()
+atexit.register(ingest_queue.stop)
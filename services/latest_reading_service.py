@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from core.config import LATEST_READINGS_TTL_SECONDS
+from models.models import DeviceLatestReading, EnergyDevice, EnergyReading
+
+
+class LatestReadingCache:
+    """
+    Última lectura de cada dispositivo en memoria (serial_number -> entrada).
+
+    Se actualiza tras cada commit de ingesta en este proceso y se recarga desde
+    device_latest_readings cada ttl segundos para incluir otros procesos.
+    """
+
+    def __init__(self, ttl: float = LATEST_READINGS_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def load(self, entries: List[dict]):
+        with self._lock:
+            self._entries = {entry["serial_number"]: entry for entry in entries}
+            self._loaded_at = time.monotonic()
+
+    def remember(self, entries: List[dict]):
+        with self._lock:
+            for entry in entries:
+                current = self._entries.get(entry["serial_number"])
+                if current is None or current["created_at"] <= entry["created_at"]:
+                    self._entries[entry["serial_number"]] = entry
+
+    def get(self, serial_number: str) -> Optional[dict]:
+        with self._lock:
+            return self._entries.get(serial_number)
+
+    def entries(self) -> List[dict]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._loaded_at = None
+
+
+latest_reading_cache = LatestReadingCache()
+
+
+def _entry(
+    device_id, serial_number: str, reading_id, alarm_status, created_at, reading
+) -> dict:
+    return {
+        "device_id": device_id,
+        "serial_number": serial_number,
+        "reading_id": reading_id,
+        "alarm_status": alarm_status,
+        "created_at": created_at,
+        "reading": reading,
+    }
+
+
+def update_latest_readings(db: Session, readings: List[tuple]) -> List[dict]:
+    """
+    Actualiza device_latest_readings con lecturas recién insertadas, dadas como
+    (EnergyReading, serial_number). Solo se conserva la más reciente por
+    dispositivo. No hace commit; retorna las entradas para latest_reading_cache
+    (llamar a remember después del commit).
+    """
+    newest = {}
+    for record, serial_number in readings:
+        current = newest.get(record.device_id)
+        if current is None or current[0].created_at <= record.created_at:
+            newest[record.device_id] = (record, serial_number)
+
+    table = DeviceLatestReading.__table__
+    entries = []
+    for device_id, (record, serial_number) in newest.items():
+        reading = record.to_dict()
+        reading["serial_number"] = serial_number
+        entry = _entry(
+            device_id,
+            serial_number,
+            record.id,
+            record.alarm_status,
+            record.created_at,
+            reading,
+        )
+        values = {key: value for key, value in entry.items() if key != "device_id"}
+
+        # Solo reemplazar si la lectura es más reciente que la guardada
+        newer = update(table).where(
+            and_(
+                table.c.device_id == device_id, table.c.created_at <= record.created_at
+            )
+        )
+        if not db.execute(newer.values(values)).rowcount:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(table).values(entry))
+            except IntegrityError:
+                # Ya existe una lectura más reciente o se insertó en paralelo
+                db.execute(newer.values(values))
+        entries.append(entry)
+    return entries
+
+
+def get_latest_readings(
+    db: Session,
+    alarm_status: Optional[str] = None,
+    serial_number: Optional[str] = None,
+) -> List[dict]:
+    """
+    Última lectura de cada dispositivo, servida desde memoria y recargada desde
+    device_latest_readings cuando la caché venció.
+    """
+    if latest_reading_cache.is_stale():
+        rows = db.query(DeviceLatestReading).all()
+        latest_reading_cache.load(
+            [
+                _entry(
+                    row.device_id,
+                    row.serial_number,
+                    row.reading_id,
+                    row.alarm_status,
+                    row.created_at,
+                    row.reading,
+                )
+                for row in rows
+            ]
+        )
+
+    if serial_number:
+        entry = latest_reading_cache.get(serial_number)
+        entries = [entry] if entry else []
+    else:
+        entries = latest_reading_cache.entries()
+    if alarm_status:
+        entries = [entry for entry in entries if entry["alarm_status"] == alarm_status]
+    return sorted(entries, key=lambda entry: entry["serial_number"])
+
+
+def latest_readings_etag(entries: List[dict]) -> str:
+    """
+    ETag de una respuesta: cambia solo si cambia alguna de las lecturas.
+    """
+    digest = hashlib.sha1()
+    for entry in entries:
+        digest.update(str(entry["reading_id"]).encode("ascii"))
+    return digest.hexdigest()
+
+
+def backfill_latest_readings(db: Session) -> int:
+    """
+    Reconstruye device_latest_readings a partir de energy_readings
+    (subconsulta correlacionada por dispositivo sobre el índice
+    (device_id, created_at, id)). No hace commit.
+
+    Los ids se comparan entre columnas y nunca como parámetro, así que también
+    funciona con los ids en texto anteriores a la migración 10.
+    """
+    newest = (
+        select(EnergyReading.id)
+        .where(EnergyReading.device_id == EnergyDevice.id)
+        .order_by(EnergyReading.created_at.desc(), EnergyReading.id.desc())
+        .limit(1)
+        .correlate(EnergyDevice)
+        .scalar_subquery()
+    )
+    rows = (
+        db.query(EnergyReading, EnergyDevice.serial_number)
+        .join(EnergyDevice, EnergyReading.device_id == EnergyDevice.id)
+        .filter(EnergyReading.id == newest)
+        .all()
+    )
+    if rows:
+        update_latest_readings(db, [tuple(row) for row in rows])
+    processed = len(rows)
+    db.flush()
+    latest_reading_cache.clear()
+    return processed
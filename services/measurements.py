@@ -0,0 +1,187 @@
+import json
+import zlib
+from typing import Optional, Tuple
+
+PHASES = ("L1", "L2", "L3")
+
+# Campos conocidos del payload stm32 -> columna tipada de EnergyReading
+VOLTAGE_FIELDS = {
+    "L1_N": "voltage_l1",
+    "L2_N": "voltage_l2",
+    "L3_N": "voltage_l3",
+    "L1_L2": "voltage_l1_l2",
+    "L1_L3": "voltage_l1_l3",
+    "L2_L3": "voltage_l2_l3",
+}
+CURRENT_FIELDS = {
+    "L1": "current_l1",
+    "L2": "current_l2",
+    "L3": "current_l3",
+    "leakage": "leakage_current",
+}
+POWER_FIELDS = {
+    "active_power_w": "active_power_w",
+    "apparent_power_va": "apparent_power_va",
+    "cos_fi": "cos_fi",
+}
+SWITCH_FIELDS = {
+    "L1": "switch_l1",
+    "L2": "switch_l2",
+    "L3": "switch_l3",
+    "N": "switch_n",
+}
+
+MEASUREMENT_COLUMNS = (
+    tuple(VOLTAGE_FIELDS.values())
+    + tuple(CURRENT_FIELDS.values())
+    + tuple(POWER_FIELDS.values())
+)
+SWITCH_COLUMNS = tuple(SWITCH_FIELDS.values())
+
+# Métricas agregadas en energy_reading_rollups (ver rollup_metrics)
+ROLLUP_METRICS = ("voltage", "current", "leakage", "active_power", "cos_fi")
+
+
+def _to_float(value) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value) -> Optional[bool]:
+    return value if isinstance(value, bool) else None
+
+
+def split_fields(values: dict, fields: dict, parse=_to_float) -> Tuple[dict, dict]:
+    """
+    Separa un diccionario de mediciones en columnas tipadas y extras.
+
+    Las claves conocidas (sin distinguir mayúsculas) cuyo valor se puede
+    convertir van a las columnas; el resto se conserva tal cual en extras.
+    Retorna (columnas, extras).
+    """
+    columns = dict.fromkeys(fields.values())
+    extras = {}
+    if not isinstance(values, dict):
+        return columns, extras
+
+    lookup = {key.lower(): column for key, column in fields.items()}
+    for key, value in values.items():
+        column = lookup.get(str(key).lower())
+        parsed = parse(value) if column else None
+        if parsed is None:
+            extras[key] = value
+        else:
+            columns[column] = parsed
+    return columns, extras
+
+
+def split_switches(values: dict) -> Tuple[dict, dict]:
+    """
+    split_fields para el estado de los interruptores (valores booleanos).
+    """
+    return split_fields(values, SWITCH_FIELDS, _to_bool)
+
+
+def join_fields(row, fields: dict, extras: Optional[dict]) -> dict:
+    """
+    Operación inversa de split_fields: reconstruye el diccionario original a
+    partir de las columnas tipadas de row y los extras.
+    """
+    result = {}
+    for key, column in fields.items():
+        value = getattr(row, column)
+        if value is not None:
+            result[key] = value
+    if extras:
+        result.update(extras)
+    return result
+
+
+def split_reading(voltages, currents, power, switches) -> dict:
+    """
+    Columnas de EnergyReading para los grupos de mediciones de una lectura:
+    las columnas tipadas y, en los campos JSON, solo los extras no reconocidos.
+    """
+    values = {}
+    for target, group, fields in (
+        ("voltage_measurements", voltages, VOLTAGE_FIELDS),
+        ("current_measurements", currents, CURRENT_FIELDS),
+        ("power_measurements", power, POWER_FIELDS),
+    ):
+        columns, extras = split_fields(group, fields)
+        values.update(columns)
+        values[target] = extras
+    columns, extras = split_switches(switches)
+    values.update(columns)
+    values["switch_status"] = extras
+    return values
+
+
+def raw_data_values(payload: dict, storage: str) -> dict:
+    """
+    Columnas raw_data / raw_data_compressed según el modo de almacenamiento:
+    "json" (payload completo), "compressed" (zlib) o "none" (no se guarda).
+    """
+    if storage == "compressed":
+        return {"raw_data": {}, "raw_data_compressed": compress_payload(payload)}
+    if storage == "none":
+        return {"raw_data": {}, "raw_data_compressed": None}
+    return {"raw_data": payload, "raw_data_compressed": None}
+
+
+def extract_measurements(sensor_data: dict) -> dict:
+    """
+    Extrae las mediciones numéricas conocidas de una lectura stm32.
+
+    Retorna un diccionario con voltage_l1..l3 (fase-neutro), voltage_l1_l2,
+    voltage_l1_l3, voltage_l2_l3 (entre fases), current_l1..l3, leakage_current,
+    active_power_w, apparent_power_va y cos_fi (None si el campo no viene).
+    """
+    result = {}
+    for key, fields in (
+        ("voltages", VOLTAGE_FIELDS),
+        ("currents", CURRENT_FIELDS),
+        ("measurements", POWER_FIELDS),
+    ):
+        columns, _ = split_fields(sensor_data.get(key, {}), fields)
+        result.update(columns)
+    return result
+
+
+def _phase_mean(measurements: dict, prefix: str) -> Optional[float]:
+    values = [
+        measurements[f"{prefix}_{phase.lower()}"]
+        for phase in PHASES
+        if measurements.get(f"{prefix}_{phase.lower()}") is not None
+    ]
+    return sum(values) / len(values) if values else None
+
+
+def rollup_metrics(measurements: dict) -> dict:
+    """
+    Métricas agregadas en los rollups a partir de extract_measurements:
+    voltaje fase-neutro y corriente promedio de las tres fases, corriente de fuga, potencia
+    activa y cos φ.
+    """
+    return {
+        "voltage": _phase_mean(measurements, "voltage"),
+        "current": _phase_mean(measurements, "current"),
+        "leakage": measurements.get("leakage_current"),
+        "active_power": measurements.get("active_power_w"),
+        "cos_fi": measurements.get("cos_fi"),
+    }
+
+
+def compress_payload(payload: dict) -> bytes:
+    """
+    Serializa y comprime con zlib un payload JSON.
+    """
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decompress_payload(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
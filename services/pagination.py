@@ -0,0 +1,25 @@
+import base64
+import json
+
+
+def encode_cursor(values: dict) -> str:
+    """
+    Codifica la posición de una página como un cursor opaco (base64 urlsafe).
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodifica un cursor generado por encode_cursor.
+    Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Cursor inválido: {e}")
+    if not isinstance(values, dict):
+        raise ValueError("Cursor inválido")
+    return values
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from core.config import (
+    PRESENCE_GAP_SECONDS,
+    PRESENCE_OFFLINE_AFTER_SECONDS,
+    HEARTBEAT_LOG_ALL,
+)
+from models.models import DeviceAlive, DevicePresence
+from services.timestamps import naive_utc
+
+
+def _heartbeat_event(presence: Optional[DevicePresence], heartbeat: dict):
+    """
+    Motivo para registrar el heartbeat en el historial, o None si es un
+    "sigo vivo" redundante.
+    """
+    if presence is None:
+        return "first_seen"
+    if heartbeat["timestamp"] - presence.last_seen > timedelta(
+        seconds=PRESENCE_GAP_SECONDS
+    ):
+        return "reconnect"
+    if (
+        heartbeat["state_duration"] < presence.state_duration
+        or heartbeat["mac_address"] != presence.mac_address
+        or heartbeat["device_name"] != presence.device_name
+    ):
+        return "state_change"
+    return "heartbeat" if HEARTBEAT_LOG_ALL else None
+
+
+def _insert_presence(db: Session, heartbeat: dict):
+    """
+    Crea el estado de un dispositivo nuevo dentro de un savepoint. Si otra
+    transacción lo creó primero, retorna el existente.
+    Retorna (presence, creado).
+    """
+    try:
+        with db.begin_nested():
+            presence = DevicePresence(
+                serial_number=heartbeat["serial_number"],
+                device_name=heartbeat["device_name"],
+                mac_address=heartbeat["mac_address"],
+                state_duration=heartbeat["state_duration"],
+                last_seen=heartbeat["timestamp"],
+                online_since=heartbeat["timestamp"],
+                heartbeat_count=0,
+            )
+            db.add(presence)
+        return presence, True
+    except IntegrityError:
+        presence = (
+            db.query(DevicePresence)
+            .filter(DevicePresence.serial_number == heartbeat["serial_number"])
+            .one()
+        )
+        return presence, False
+
+
+def record_heartbeats(db: Session, heartbeats: List[dict]) -> List[DevicePresence]:
+    """
+    Actualiza el estado actual de los dispositivos con una lista de heartbeats
+    (valores de DeviceAlive) y agrega una fila a device_alive solo cuando el
+    estado cambia o hubo un hueco mayor a PRESENCE_GAP_SECONDS.
+
+    Lee todos los estados previos en una sola consulta. No hace commit.
+    Retorna el estado resultante para cada heartbeat, en el mismo orden.
+    """
+    serial_numbers = {heartbeat["serial_number"] for heartbeat in heartbeats}
+    states = {
+        presence.serial_number: presence
+        for presence in db.query(DevicePresence).filter(
+            DevicePresence.serial_number.in_(serial_numbers)
+        )
+    }
+
+    results = []
+    for heartbeat in heartbeats:
+        # last_seen se guarda en UTC sin zona
+        heartbeat = dict(heartbeat, timestamp=naive_utc(heartbeat["timestamp"]))
+        serial_number = heartbeat["serial_number"]
+        presence = states.get(serial_number)
+
+        created = False
+        if presence is None:
+            presence, created = _insert_presence(db, heartbeat)
+            states[serial_number] = presence
+
+        # Heartbeats atrasados no retroceden el estado actual
+        if not created and heartbeat["timestamp"] < presence.last_seen:
+            presence.heartbeat_count += 1
+            results.append(presence)
+            continue
+
+        event = _heartbeat_event(None if created else presence, heartbeat)
+        if event:
+            db.add(DeviceAlive(event=event, **heartbeat))
+
+        if event == "reconnect":
+            presence.online_since = heartbeat["timestamp"]
+
+        presence.device_name = heartbeat["device_name"]
+        presence.mac_address = heartbeat["mac_address"]
+        presence.state_duration = heartbeat["state_duration"]
+        presence.last_seen = heartbeat["timestamp"]
+        presence.heartbeat_count += 1
+        results.append(presence)
+
+    return results
+
+
+def get_fleet_status(
+    db: Session, status: Optional[str] = None, now: Optional[datetime] = None
+) -> List[dict]:
+    """
+    Estado online/offline de todos los dispositivos a partir de device_presence.
+    - Online: desde online_since.
+    - Offline: desde last_seen (último heartbeat recibido).
+
+    status permite filtrar por "online" u "offline".
+    """
+    now = now or datetime.utcnow()
+    threshold = now - timedelta(seconds=PRESENCE_OFFLINE_AFTER_SECONDS)
+
+    query = db.query(DevicePresence)
+    if status == "online":
+        query = query.filter(DevicePresence.last_seen >= threshold)
+    elif status == "offline":
+        query = query.filter(DevicePresence.last_seen < threshold)
+
+    devices = []
+    for presence in query.order_by(DevicePresence.serial_number):
+        result = presence.to_dict()
+        online = presence.last_seen >= threshold
+        result["status"] = "online" if online else "offline"
+        since = presence.online_since if online else presence.last_seen
+        result["since"] = since.isoformat()
+        devices.append(result)
+    return devices
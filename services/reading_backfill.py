@@ -0,0 +1,103 @@
+import argparse
+import logging
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from core.config import RAW_DATA_STORAGE
+from models.models import EnergyReading
+from services.measurements import (
+    MEASUREMENT_COLUMNS,
+    SWITCH_COLUMNS,
+    raw_data_values,
+    split_reading,
+)
+
+
+def backfill_reading_columns(
+    db: Session, batch_size: int = 1000, storage: str = RAW_DATA_STORAGE
+) -> int:
+    """
+    Migra las lecturas anteriores a las columnas tipadas:
+    - Extrae las mediciones conocidas de los campos JSON a sus columnas.
+    - Deja en los campos JSON solo los extras no reconocidos.
+    - Reescribe raw_data según el modo de almacenamiento indicado.
+
+    Procesa por lotes con keyset (created_at, id) y hace commit por lote.
+    Retorna la cantidad de lecturas migradas.
+    """
+    typed_columns = MEASUREMENT_COLUMNS + SWITCH_COLUMNS
+    pending = and_(
+        *(getattr(EnergyReading, column).is_(None) for column in typed_columns)
+    )
+    query = select(
+        EnergyReading.id,
+        EnergyReading.created_at,
+        EnergyReading.voltage_measurements,
+        EnergyReading.current_measurements,
+        EnergyReading.power_measurements,
+        EnergyReading.switch_status,
+        EnergyReading.raw_data,
+        EnergyReading.raw_data_compressed,
+    ).where(pending, EnergyReading.created_at.is_not(None))
+
+    processed = 0
+    last = None
+    while True:
+        batch = query
+        if last:
+            batch = batch.where(
+                or_(
+                    EnergyReading.created_at > last[0],
+                    and_(
+                        EnergyReading.created_at == last[0],
+                        EnergyReading.id > last[1],
+                    ),
+                )
+            )
+        rows = db.execute(
+            batch.order_by(EnergyReading.created_at, EnergyReading.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            values = split_reading(
+                row.voltage_measurements,
+                row.current_measurements,
+                row.power_measurements,
+                row.switch_status,
+            )
+            if row.raw_data_compressed is None and row.raw_data:
+                values.update(raw_data_values(row.raw_data, storage))
+            values["id"] = row.id
+            updates.append(values)
+
+        db.execute(update(EnergyReading), updates)
+        db.commit()
+        processed += len(rows)
+        last = (rows[-1].created_at, rows[-1].id)
+
+    return processed
+
+
+if __name__ == "__main__":
+    from core.config import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description="Migra las lecturas existentes a las columnas tipadas"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--storage",
+        choices=("json", "compressed", "none"),
+        default=RAW_DATA_STORAGE,
+        help="Modo de almacenamiento de raw_data",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        processed = backfill_reading_columns(db, args.batch_size, args.storage)
+    logging.info(f"Lecturas migradas: {processed}")
@@ -0,0 +1,262 @@
+"""
+Retención y archivo de datos históricos.
+
+Cada política borra las filas más antiguas que su ventana, exportándolas antes
+a archivos NDJSON comprimidos con gzip (una fila plana por línea). Los borrados
+se hacen en lotes pequeños, con commit por lote, para no bloquear la ingesta.
+Uso:
+
+    python -m services.retention_service            # aplica todas las políticas
+    python -m services.retention_service --dry-run   # solo cuenta las filas
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+from core.config import (
+    RETENTION_ARCHIVE_DIR,
+    RETENTION_BATCH_SIZE,
+    RETENTION_BATCH_PAUSE_SECONDS,
+    RETENTION_READINGS_DAYS,
+    RETENTION_ROLLUP_1M_DAYS,
+    RETENTION_ROLLUP_1H_DAYS,
+    RETENTION_ROLLUP_1D_DAYS,
+    RETENTION_DEVICE_ALIVE_DAYS,
+    RETENTION_SHORT_CIRCUITS_DAYS,
+)
+from core.response_cache import response_cache, SENSOR_DATA, SHORT_CIRCUITS
+from models.models import (
+    DeviceAlive,
+    EnergyReading,
+    EnergyReadingRollup,
+    ShortCircuit,
+)
+from services.short_circuit_service import short_circuit_counter
+
+
+class RetentionPolicy(NamedTuple):
+    name: str
+    model: type
+    time_column: str
+    days: int  # 0 = conservar indefinidamente
+    granularity: Optional[str] = None  # solo para rollups
+
+
+def default_policies() -> List[RetentionPolicy]:
+    """
+    Políticas configuradas por entorno (ver RETENTION_* en core/config.py).
+    """
+    return [
+        RetentionPolicy(
+            "energy_readings", EnergyReading, "created_at", RETENTION_READINGS_DAYS
+        ),
+        RetentionPolicy(
+            "rollups_1m",
+            EnergyReadingRollup,
+            "bucket_start",
+            RETENTION_ROLLUP_1M_DAYS,
+            "1m",
+        ),
+        RetentionPolicy(
+            "rollups_1h",
+            EnergyReadingRollup,
+            "bucket_start",
+            RETENTION_ROLLUP_1H_DAYS,
+            "1h",
+        ),
+        RetentionPolicy(
+            "rollups_1d",
+            EnergyReadingRollup,
+            "bucket_start",
+            RETENTION_ROLLUP_1D_DAYS,
+            "1d",
+        ),
+        RetentionPolicy(
+            "device_alive", DeviceAlive, "timestamp", RETENTION_DEVICE_ALIVE_DAYS
+        ),
+        RetentionPolicy(
+            "short_circuits",
+            ShortCircuit,
+            "timestamp",
+            RETENTION_SHORT_CIRCUITS_DAYS,
+        ),
+    ]
+
+
+def _export_value(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+
+def _export_row(row) -> dict:
+    """
+    Fila plana para el archivo (columnas con tipos JSON primitivos).
+    Las lecturas exportan el payload crudo ya descomprimido.
+    """
+    result = {
+        column.name: _export_value(getattr(row, column.key))
+        for column in row.__table__.columns
+    }
+    if isinstance(row, EnergyReading):
+        result.pop("raw_data_compressed", None)
+        result["raw_data"] = row.raw_payload()
+    return result
+
+
+def _policy_filters(policy: RetentionPolicy, cutoff: datetime) -> list:
+    filters = [getattr(policy.model, policy.time_column) < cutoff]
+    if policy.granularity:
+        filters.append(EnergyReadingRollup.granularity == policy.granularity)
+    return filters
+
+
+def count_expired(db: Session, policy: RetentionPolicy, now: datetime) -> int:
+    if not policy.days:
+        return 0
+    cutoff = now - timedelta(days=policy.days)
+    return db.execute(
+        select(func.count())
+        .select_from(policy.model)
+        .where(*_policy_filters(policy, cutoff))
+    ).scalar()
+
+
+def apply_policy(
+    db: Session,
+    policy: RetentionPolicy,
+    now: Optional[datetime] = None,
+    archive_dir: str = RETENTION_ARCHIVE_DIR,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause_seconds: float = RETENTION_BATCH_PAUSE_SECONDS,
+) -> dict:
+    """
+    Exporta y borra en lotes las filas vencidas de una política.
+    Cada lote se escribe y sincroniza en el archivo antes de borrarse.
+
+    Retorna la cantidad de filas borradas y la ruta del archivo generado.
+    """
+    if not policy.days:
+        return {"policy": policy.name, "deleted": 0, "archive": None}
+
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=policy.days)
+    primary_key = list(policy.model.__table__.primary_key.columns)
+    key_columns = [getattr(policy.model, column.key) for column in primary_key]
+
+    query = (
+        select(policy.model)
+        .where(*_policy_filters(policy, cutoff))
+        .order_by(getattr(policy.model, policy.time_column))
+        .limit(batch_size)
+    )
+
+    deleted = 0
+    path = None
+    archive = None
+    try:
+        while True:
+            rows = db.execute(query).scalars().all()
+            if not rows:
+                break
+
+            if archive is None:
+                directory = os.path.join(archive_dir, policy.name)
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(
+                    directory,
+                    f"{policy.name}-{now.strftime('%Y%m%dT%H%M%S')}.ndjson.gz",
+                )
+                raw_file = open(path, "ab")
+                archive = gzip.GzipFile(fileobj=raw_file, mode="ab")
+
+            for row in rows:
+                archive.write(
+                    (json.dumps(_export_row(row), separators=(",", ":")) + "\n").encode(
+                        "utf-8"
+                    )
+                )
+            archive.flush()
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+
+            keys = [
+                tuple(getattr(row, column.key) for column in primary_key)
+                for row in rows
+            ]
+            if len(key_columns) == 1:
+                condition = key_columns[0].in_([key[0] for key in keys])
+            else:
+                condition = tuple_(*key_columns).in_(keys)
+            db.query(policy.model).filter(condition).delete(synchronize_session=False)
+            db.commit()
+            db.expunge_all()
+            deleted += len(rows)
+
+            if pause_seconds:
+                time.sleep(pause_seconds)
+    finally:
+        if archive is not None:
+            archive.close()
+            raw_file.close()
+
+    if policy.model is ShortCircuit and deleted:
+        short_circuit_counter.invalidate()
+        response_cache.bump(SHORT_CIRCUITS)
+    elif policy.model is EnergyReading and deleted:
+        response_cache.bump(SENSOR_DATA)
+
+    return {"policy": policy.name, "deleted": deleted, "archive": path}
+
+
+def run_retention(
+    db: Session, policies: Optional[List[RetentionPolicy]] = None, **options
+) -> List[dict]:
+    """
+    Aplica todas las políticas de retención y retorna el resultado de cada una.
+    """
+    now = datetime.utcnow()
+    results = []
+    for policy in policies or default_policies():
+        result = apply_policy(db, policy, now=now, **options)
+        logging.info(f"Retención {result}")
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    from core.config import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Retención y archivo de datos")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar filas")
+    parser.add_argument("--policy", action="append", help="Aplicar solo esta política")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    policies = [
+        policy
+        for policy in default_policies()
+        if not args.policy or policy.name in args.policy
+    ]
+    with SessionLocal() as db:
+        if args.dry_run:
+            now = datetime.utcnow()
+            for policy in policies:
+                print(f"{policy.name}: {count_expired(db, policy, now)} filas vencidas")
+        else:
+            run_retention(db, policies)
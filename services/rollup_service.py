@@ -0,0 +1,400 @@
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.models import EnergyDevice, EnergyReading, EnergyReadingRollup
+from services.measurements import (
+    MEASUREMENT_COLUMNS,
+    ROLLUP_METRICS,
+    extract_measurements,
+    rollup_metrics,
+)
+from services.timestamps import naive_utc, parse_timestamp
+
+# Granularidades de menor a mayor
+GRANULARITIES = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+
+def bucket_start(timestamp: datetime, size: timedelta) -> datetime:
+    """
+    Inicio del bucket de tamaño size que contiene timestamp (alineado a la época).
+    Los valores con zona se pasan a UTC sin zona, como las columnas.
+    """
+    timestamp = naive_utc(timestamp)
+    epoch = datetime(1970, 1, 1)
+    return timestamp - (timestamp - epoch) % size
+
+
+def _empty_aggregate() -> dict:
+    aggregate = {"sample_count": 0}
+    for metric in ROLLUP_METRICS:
+        aggregate[f"{metric}_count"] = 0
+        aggregate[f"{metric}_sum"] = 0.0
+        aggregate[f"{metric}_min"] = None
+        aggregate[f"{metric}_max"] = None
+    return aggregate
+
+
+def _merge(aggregate: dict, other: dict):
+    """
+    Combina el agregado other dentro de aggregate.
+    """
+    aggregate["sample_count"] += other["sample_count"]
+    for metric in ROLLUP_METRICS:
+        aggregate[f"{metric}_count"] += other[f"{metric}_count"]
+        aggregate[f"{metric}_sum"] += other[f"{metric}_sum"]
+        for key, pick in ((f"{metric}_min", min), (f"{metric}_max", max)):
+            if other[key] is not None:
+                aggregate[key] = (
+                    other[key]
+                    if aggregate[key] is None
+                    else pick(aggregate[key], other[key])
+                )
+
+
+def accumulate(
+    readings: Iterable[Tuple[object, datetime, dict]],
+    aggregates: Optional[dict] = None,
+    since: Optional[dict] = None,
+) -> dict:
+    """
+    Agrupa lecturas (device_id, created_at, métricas) en memoria por
+    (device_id, granularity, bucket_start) para todas las granularidades.
+    since (granularity -> datetime) omite los buckets anteriores.
+    """
+    aggregates = {} if aggregates is None else aggregates
+    for device_id, created_at, metrics in readings:
+        sample = _empty_aggregate()
+        sample["sample_count"] = 1
+        for metric in ROLLUP_METRICS:
+            value = metrics.get(metric)
+            if value is not None:
+                sample[f"{metric}_count"] = 1
+                sample[f"{metric}_sum"] = value
+                sample[f"{metric}_min"] = value
+                sample[f"{metric}_max"] = value
+
+        for granularity, size in GRANULARITIES.items():
+            start = bucket_start(created_at, size)
+            if since and start < since[granularity]:
+                continue
+            key = (device_id, granularity, start)
+            if key not in aggregates:
+                aggregates[key] = _empty_aggregate()
+            _merge(aggregates[key], sample)
+    return aggregates
+
+
+def _least(column, value):
+    return case((column.is_(None), value), (column > value, value), else_=column)
+
+
+def _greatest(column, value):
+    return case((column.is_(None), value), (column < value, value), else_=column)
+
+
+def apply_rollups(db: Session, aggregates: dict):
+    """
+    Suma los agregados a las filas de energy_reading_rollups (upsert portable:
+    UPDATE y, si no existe la fila, INSERT). No hace commit; se ejecuta dentro
+    de la transacción de la ingesta.
+    """
+    table = EnergyReadingRollup.__table__
+    for (device_id, granularity, start), aggregate in aggregates.items():
+        values = {
+            table.c.sample_count: table.c.sample_count + aggregate["sample_count"]
+        }
+        for metric in ROLLUP_METRICS:
+            count = aggregate[f"{metric}_count"]
+            if not count:
+                continue
+            values[table.c[f"{metric}_count"]] = table.c[f"{metric}_count"] + count
+            values[table.c[f"{metric}_sum"]] = (
+                table.c[f"{metric}_sum"] + aggregate[f"{metric}_sum"]
+            )
+            values[table.c[f"{metric}_min"]] = _least(
+                table.c[f"{metric}_min"], aggregate[f"{metric}_min"]
+            )
+            values[table.c[f"{metric}_max"]] = _greatest(
+                table.c[f"{metric}_max"], aggregate[f"{metric}_max"]
+            )
+
+        where = and_(
+            table.c.device_id == device_id,
+            table.c.granularity == granularity,
+            table.c.bucket_start == start,
+        )
+        if db.execute(update(table).where(where).values(values)).rowcount:
+            continue
+
+        try:
+            with db.begin_nested():
+                db.execute(
+                    insert(table).values(
+                        device_id=device_id,
+                        granularity=granularity,
+                        bucket_start=start,
+                        **aggregate,
+                    )
+                )
+        except IntegrityError:
+            # Otro proceso insertó el bucket en paralelo
+            db.execute(update(table).where(where).values(values))
+
+
+def update_rollups(db: Session, readings: Iterable[Tuple[object, datetime, dict]]):
+    """
+    Actualiza los rollups con lecturas recién insertadas, dadas como
+    (device_id, created_at, mediciones tipadas).
+    """
+    aggregates = accumulate(
+        (device_id, created_at, rollup_metrics(measurements))
+        for device_id, created_at, measurements in readings
+    )
+    apply_rollups(db, aggregates)
+
+
+def _row_measurements(row) -> dict:
+    """
+    Mediciones tipadas de una fila; si la fila es anterior a las columnas
+    tipadas (todas nulas), se extraen de los campos JSON.
+    """
+    measurements = {column: getattr(row, column) for column in MEASUREMENT_COLUMNS}
+    if any(value is not None for value in measurements.values()):
+        return measurements
+    return extract_measurements(
+        {
+            "voltages": row.voltage_measurements,
+            "currents": row.current_measurements,
+            "measurements": row.power_measurements,
+        }
+    )
+
+
+def backfill_rollups(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = 5000,
+) -> int:
+    """
+    Recalcula los rollups a partir de las lecturas crudas en [start, end).
+    El rango se amplía a días completos, se borran los rollups existentes de
+    ese rango y se reconstruyen recorriendo las lecturas por lotes.
+
+    Los rollups de buckets que empiezan antes de la lectura cruda más antigua
+    no se tocan: la retención corta a una hora cualquiera, así que esos
+    buckets pueden resumir lecturas ya borradas y son la única historia que
+    queda. En cada granularidad se recalcula desde el primer bucket que
+    empieza en o después de esa lectura. Sin lecturas no se borra nada.
+
+    Pensado para rangos cerrados o con la ingesta detenida: las lecturas que
+    lleguen al rango durante el recálculo pueden contarse dos veces.
+
+    Retorna la cantidad de lecturas procesadas.
+    """
+    day = GRANULARITIES["1d"]
+    table = EnergyReadingRollup.__table__
+
+    readings = select(
+        EnergyReading.id,
+        EnergyReading.device_id,
+        EnergyReading.created_at,
+        EnergyReading.voltage_measurements,
+        EnergyReading.current_measurements,
+        EnergyReading.power_measurements,
+        *(getattr(EnergyReading, column) for column in MEASUREMENT_COLUMNS),
+    ).where(EnergyReading.created_at.is_not(None))
+    earliest = db.execute(
+        select(func.min(EnergyReading.created_at)).where(
+            EnergyReading.created_at.is_not(None)
+        )
+    ).scalar()
+    if earliest is None:
+        return 0
+    if start:
+        start = bucket_start(start, day)
+    # Primer bucket completo de cada granularidad: en o después de la lectura
+    # cruda más antigua y del inicio pedido
+    since = {}
+    for granularity, size in GRANULARITIES.items():
+        first = bucket_start(earliest, size)
+        if first < earliest:
+            first += size
+        since[granularity] = max(first, start) if start else first
+
+    clear = delete(table).where(
+        or_(
+            *(
+                and_(table.c.granularity == granularity, table.c.bucket_start >= first)
+                for granularity, first in since.items()
+            )
+        )
+    )
+    readings = readings.where(EnergyReading.created_at >= min(since.values()))
+    if end:
+        end_day = bucket_start(end, day)
+        end = end_day + day if end_day < end else end_day
+        readings = readings.where(EnergyReading.created_at < end)
+        clear = clear.where(table.c.bucket_start < end)
+
+    db.execute(clear)
+
+    # Recorrer por lotes con keyset (created_at, id) para no mantener un
+    # cursor abierto mientras se escriben los rollups
+    processed = 0
+    last = None
+    while True:
+        query = readings
+        if last:
+            query = query.where(
+                or_(
+                    EnergyReading.created_at > last[0],
+                    and_(
+                        EnergyReading.created_at == last[0],
+                        EnergyReading.id > last[1],
+                    ),
+                )
+            )
+        rows = db.execute(
+            query.order_by(EnergyReading.created_at, EnergyReading.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        apply_rollups(
+            db,
+            accumulate(
+                (
+                    (
+                        row.device_id,
+                        row.created_at,
+                        rollup_metrics(_row_measurements(row)),
+                    )
+                    for row in rows
+                ),
+                since=since,
+            ),
+        )
+        processed += len(rows)
+        last = (rows[-1].created_at, rows[-1].id)
+
+    db.commit()
+    return processed
+
+
+def choose_granularity(resolution: timedelta) -> str:
+    """
+    Elige la granularidad más gruesa cuyo bucket no supera la resolución pedida.
+    """
+    chosen = "1m"
+    for granularity, size in GRANULARITIES.items():
+        if size <= resolution:
+            chosen = granularity
+    return chosen
+
+
+def get_rollup_series(
+    db: Session,
+    serial_number: str,
+    start: datetime,
+    end: datetime,
+    resolution: Optional[timedelta] = None,
+    max_points: int = 1000,
+):
+    """
+    Serie de agregados (avg/min/max por métrica) de un dispositivo en [start, end).
+
+    Si no se indica resolución, se usa la necesaria para no superar max_points.
+    Se lee la granularidad más gruesa que la satisface y, si la resolución es
+    mayor, se combinan buckets en memoria.
+    """
+    try:
+        start, end = naive_utc(start), naive_utc(end)
+        if resolution is None:
+            resolution = max((end - start) / max_points, GRANULARITIES["1m"])
+        granularity = choose_granularity(resolution)
+        size = GRANULARITIES[granularity]
+        if resolution < size:
+            resolution = size
+        # Redondear la resolución a un múltiplo del bucket leído
+        resolution = size * max(1, round(resolution / size))
+
+        rows = (
+            db.query(EnergyReadingRollup)
+            .join(EnergyDevice, EnergyReadingRollup.device_id == EnergyDevice.id)
+            .filter(
+                EnergyDevice.serial_number == serial_number,
+                EnergyReadingRollup.granularity == granularity,
+                EnergyReadingRollup.bucket_start >= bucket_start(start, size),
+                EnergyReadingRollup.bucket_start < end,
+            )
+            .order_by(EnergyReadingRollup.bucket_start)
+            .all()
+        )
+
+        buckets = {}
+        for row in rows:
+            key = bucket_start(row.bucket_start, resolution)
+            if key not in buckets:
+                buckets[key] = _empty_aggregate()
+            _merge(
+                buckets[key],
+                {column: getattr(row, column) for column in _empty_aggregate()},
+            )
+
+        points = []
+        for key in sorted(buckets):
+            aggregate = buckets[key]
+            point = {
+                "bucket_start": key.isoformat(),
+                "sample_count": aggregate["sample_count"],
+            }
+            for metric in ROLLUP_METRICS:
+                count = aggregate[f"{metric}_count"]
+                point[metric] = {
+                    "avg": aggregate[f"{metric}_sum"] / count if count else None,
+                    "min": aggregate[f"{metric}_min"],
+                    "max": aggregate[f"{metric}_max"],
+                }
+            points.append(point)
+
+        return {
+            "granularity": granularity,
+            "resolution_seconds": int(resolution.total_seconds()),
+            "points": points,
+        }, None
+
+    except Exception as e:
+        return None, str(e)
+
+
+if __name__ == "__main__":
+    from core.config import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Recalcula los rollups de lecturas")
+    parser.add_argument(
+        "--start",
+        help="Fecha ISO de inicio (inclusive); nunca se recalculan los buckets "
+        "que empiezan antes de la lectura cruda más antigua",
+    )
+    parser.add_argument("--end", help="Fecha ISO de fin (exclusiva)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        processed = backfill_rollups(
+            db,
+            start=parse_timestamp(args.start),
+            end=parse_timestamp(args.end),
+        )
+    logging.info(f"Rollups recalculados a partir de {processed} lecturas")
@@ -0,0 +1,117 @@
+"""
+Serializadores por proyección de columnas.
+
+Construyen la misma salida que los to_dict de los modelos directamente desde
+las tuplas de un select() de columnas, sin hidratar objetos ORM. Los valores
+datetime y UUID se entregan nativos y los convierte core.serialization.
+"""
+
+from typing import Iterable, List
+
+from models.models import EnergyDevice, EnergyReading
+from services.measurements import (
+    CURRENT_FIELDS,
+    POWER_FIELDS,
+    SWITCH_FIELDS,
+    VOLTAGE_FIELDS,
+)
+
+# (clave de salida, columna JSON de extras, campos tipados) en el orden de to_dict
+_READING_GROUPS = (
+    ("switch_status", "switch_status", SWITCH_FIELDS),
+    ("current_measurements", "current_measurements", CURRENT_FIELDS),
+    ("power_measurements", "power_measurements", POWER_FIELDS),
+    ("voltage_measurements", "voltage_measurements", VOLTAGE_FIELDS),
+)
+
+
+def _reading_columns() -> list:
+    columns = [
+        EnergyReading.id,
+        EnergyReading.device_id,
+        EnergyReading.alarm_status,
+        EnergyReading.created_at,
+    ]
+    for _, extras, fields in _READING_GROUPS:
+        columns.append(getattr(EnergyReading, extras))
+        columns.extend(getattr(EnergyReading, column) for column in fields.values())
+    return columns
+
+
+# Columnas que necesita reading_row; agregar otras (p. ej. serial_number) al final
+READING_COLUMNS = _reading_columns()
+
+
+def _group_layout():
+    """
+    Posición de cada grupo dentro de READING_COLUMNS: (clave, índice de los
+    extras, ((campo, índice), ...)), y el ancho total.
+    """
+    layout = []
+    position = 4
+    for key, _, fields in _READING_GROUPS:
+        indexes = tuple(
+            (field, position + 1 + offset) for offset, field in enumerate(fields)
+        )
+        layout.append((key, position, indexes))
+        position += 1 + len(fields)
+    return tuple(layout), position
+
+
+_GROUP_LAYOUT, READING_WIDTH = _group_layout()
+
+
+def reading_row(row) -> dict:
+    """
+    Equivalente a EnergyReading.to_dict() para una fila que empieza con
+    READING_COLUMNS.
+    """
+    result = {"id": row[0], "device_id": row[1], "alarm_status": row[2]}
+    for key, extras_index, fields in _GROUP_LAYOUT:
+        group = {}
+        for field, index in fields:
+            value = row[index]
+            if value is not None:
+                group[field] = value
+        extras = row[extras_index]
+        if extras:
+            group.update(extras)
+        result[key] = group
+    result["created_at"] = row[3]
+    return result
+
+
+def reading_rows(rows: Iterable, serial_index: int = None) -> List[dict]:
+    """
+    reading_row para varias filas; si serial_index se indica, agrega
+    serial_number desde esa posición.
+    """
+    results = []
+    for row in rows:
+        result = reading_row(row)
+        if serial_index is not None:
+            result["serial_number"] = row[serial_index]
+        results.append(result)
+    return results
+
+
+DEVICE_COLUMNS = [
+    EnergyDevice.id,
+    EnergyDevice.serial_number,
+    EnergyDevice.firmware_version,
+    EnergyDevice.created_at,
+    EnergyDevice.updated_at,
+]
+
+
+def device_row(row) -> dict:
+    """
+    Equivalente a EnergyDevice.to_dict() para una fila de DEVICE_COLUMNS.
+    """
+    return {
+        "id": row[0],
+        "serial_number": row[1],
+        "firmware_version": row[2],
+        "created_at": row[3],
+        "updated_at": row[4],
+    }
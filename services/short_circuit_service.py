@@ -1,68 +1,240 @@
+import threading
+import time
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from models.models import ShortCircuit
+from core.config import SHORT_CIRCUIT_COUNT_TTL_SECONDS, engine
+from core.response_cache import response_cache, SHORT_CIRCUITS
+from services.pagination import encode_cursor, decode_cursor
+from services.event_bus import event_bus, SHORT_CIRCUIT
+from services.incident_service import record_short_circuit_event
+from services.idempotency import derive_key, recent_keys, DuplicateRequest
+from services.timestamps import parse_timestamp
 from datetime import datetime
 import dateutil.parser
 
 
-def create_short_circuit(db: Session, short_circuit_data: dict):
+class ShortCircuitCounter:
     """
-    Crea un nuevo registro de cortocircuito en la base de datos.
+    Conteo de cortocircuitos mantenido en memoria.
+    Se siembra con un COUNT(*) en el primario, se incrementa en cada inserción
+    confirmada y se resincroniza con la base de datos cada ttl segundos (para
+    reflejar inserciones de otros procesos).
+    """
+
+    def __init__(self, ttl: float = SHORT_CIRCUIT_COUNT_TTL_SECONDS):
+        self.ttl = ttl
+        self._count = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        with self._lock:
+            if (
+                self._count is not None
+                and time.monotonic() - self._loaded_at < self.ttl
+            ):
+                return self._count
+        # Siempre del primario: una réplica atrasada dejaría fuera escrituras
+        # que los incrementos locales ya no van a sumar
+        with engine.connect() as connection:
+            count = connection.execute(
+                select(func.count()).select_from(ShortCircuit)
+            ).scalar()
+        with self._lock:
+            self._count = count
+            self._loaded_at = time.monotonic()
+        return count
+
+    def increment(self, amount: int = 1):
+        with self._lock:
+            if self._count is not None:
+                self._count += amount
+
+    def invalidate(self):
+        with self._lock:
+            self._count = None
+
+
+short_circuit_counter = ShortCircuitCounter()
+
+
+def short_circuit_key(short_circuit_data: dict, idempotency_key: str = None):
+    """
+    Clave de idempotencia de un evento: la del header, o derivada del
+    control_mac, el timestamp del dispositivo y el contenido.
+    """
+    return derive_key(
+        "short_circuit",
+        short_circuit_data.get("control_mac") or "",
+        short_circuit_data,
+        header=idempotency_key,
+        timestamp=short_circuit_data.get("timestamp"),
+    )
+
+
+def _build_short_circuit(short_circuit_data: dict, key: str) -> ShortCircuit:
+    """
+    Arma el ShortCircuit a partir del JSON recibido.
+    """
+    # Extraer datos del JSON
+    control_mac = short_circuit_data.get("control_mac")
+    wifi_mac = short_circuit_data.get("wifi_mac")
+    timestamp_str = short_circuit_data.get("timestamp")
+
+    # Parsear el ISO 8601 del dispositivo a UTC sin zona, como el resto de
+    # las columnas
+    timestamp = parse_timestamp(timestamp_str) or datetime.utcnow()
+
+    current = short_circuit_data.get("short_circuit", {}).get("current", {})
+    previous = short_circuit_data.get("short_circuit", {}).get("previous")
+
+    # Procesar timestamp previo si existe
+    previous_timestamp = parse_timestamp(
+        previous.get("timestamp") if previous else None
+    )
+
+    return ShortCircuit(
+        control_mac=control_mac,
+        wifi_mac=wifi_mac,
+        timestamp=timestamp,
+        current_active=current.get("active", False),
+        current_duration_seconds=current.get("duration_seconds", 0),
+        previous_active=previous.get("active") if previous else None,
+        previous_timestamp=previous_timestamp,
+        previous_duration_seconds=(
+            previous.get("duration_seconds") if previous else None
+        ),
+        idempotency_key=key,
+    )
+
+
+def _insert_short_circuit(db: Session, short_circuit: ShortCircuit, key: str):
+    """
+    Inserta el evento y lo correlaciona con los incidentes. No hace commit.
+    Lanza DuplicateRequest si el índice único rechaza la clave.
     """
     try:
-        # Extraer datos del JSON
-        control_mac = short_circuit_data.get("control_mac")
-        wifi_mac = short_circuit_data.get("wifi_mac")
-        timestamp_str = short_circuit_data.get("timestamp")
-
-        # Convertir timestamp a formato MySQL compatible
-        if timestamp_str:
-            # Parsear el string ISO 8601 a datetime object
-            timestamp = dateutil.parser.isoparse(timestamp_str)
-        else:
-            timestamp = datetime.utcnow()
-
-        current = short_circuit_data.get("short_circuit", {}).get("current", {})
-        previous = short_circuit_data.get("short_circuit", {}).get("previous")
-
-        # Procesar timestamp previo si existe
-        previous_timestamp_str = previous.get("timestamp") if previous else None
-        previous_timestamp = None
-        if previous_timestamp_str:
-            previous_timestamp = dateutil.parser.isoparse(previous_timestamp_str)
-
-        # Crear objeto ShortCircuit
-        short_circuit = ShortCircuit(
-            control_mac=control_mac,
-            wifi_mac=wifi_mac,
-            timestamp=timestamp,
-            current_active=current.get("active", False),
-            current_duration_seconds=current.get("duration_seconds", 0),
-            previous_active=previous.get("active") if previous else None,
-            previous_timestamp=previous_timestamp,
-            previous_duration_seconds=(
-                previous.get("duration_seconds") if previous else None
-            ),
+        # add dentro del savepoint: begin_nested hace flush de lo pendiente
+        with db.begin_nested():
+            db.add(short_circuit)
+            db.flush()
+    except IntegrityError:
+        # El índice único rechaza los reintentos que ya no están en caché
+        record_id = (
+            db.execute(
+                select(ShortCircuit.id).where(ShortCircuit.idempotency_key == key)
+            ).scalar()
+            if key
+            else None
+        )
+        if record_id is None:
+            raise
+        recent_keys.remember(key, record_id)
+        recent_keys.count_duplicate()
+        raise DuplicateRequest(key, record_id)
+    record_short_circuit_event(db, short_circuit)
+
+
+def _after_commit(saved: list):
+    """
+    Efectos de las inserciones confirmadas: cachés, contador y eventos.
+    saved es una lista de (clave, id, to_dict()) tomada antes del commit.
+    """
+    if not saved:
+        return
+    for key, record_id, _ in saved:
+        recent_keys.remember(key, record_id)
+    short_circuit_counter.increment(len(saved))
+    response_cache.bump(SHORT_CIRCUITS)
+    for _, _, data in saved:
+        event_bus.publish(
+            SHORT_CIRCUIT,
+            data["control_mac"],
+            "active" if data["current_active"] else "inactive",
+            data,
         )
 
-        # Guardar en base de datos
-        db.add(short_circuit)
+
+def create_short_circuit(
+    db: Session, short_circuit_data: dict, idempotency_key: str = None
+):
+    """
+    Crea un nuevo registro de cortocircuito en la base de datos.
+    Lanza DuplicateRequest si el evento ya fue guardado (ver short_circuit_key).
+    """
+    key = short_circuit_key(short_circuit_data, idempotency_key)
+    # Un reintento reciente se rechaza sin tocar la base
+    recent_keys.check(key)
+    try:
+        short_circuit = _build_short_circuit(short_circuit_data, key)
+
+        # Guardar en base de datos y correlacionar con los incidentes
+        _insert_short_circuit(db, short_circuit, key)
         db.commit()
         db.refresh(short_circuit)
+        _after_commit([(key, short_circuit.id, short_circuit.to_dict())])
 
         return short_circuit, None
 
+    except DuplicateRequest:
+        db.rollback()
+        raise
+
     except Exception as e:
         db.rollback()
         return None, str(e)
 
 
+def create_short_circuits_batch(db: Session, items: list) -> list:
+    """
+    Guarda varios eventos en una sola transacción. items es una lista de
+    (short_circuit_data, idempotency_key).
+
+    Cada evento se inserta en su propio savepoint: un duplicado o un error
+    solo descarta ese evento. Retorna un resultado por item con status
+    "success", "duplicate" o "error".
+    """
+    results = []
+    saved = []
+    batch_keys = set()
+    for short_circuit_data, idempotency_key in items:
+        key = short_circuit_key(short_circuit_data, idempotency_key)
+        try:
+            recent_keys.check(key)
+            if key is not None and key in batch_keys:
+                recent_keys.count_duplicate()
+                raise DuplicateRequest(key, None)
+            with db.begin_nested():
+                short_circuit = _build_short_circuit(short_circuit_data, key)
+                _insert_short_circuit(db, short_circuit, key)
+            if key is not None:
+                batch_keys.add(key)
+            # to_dict antes del commit: después expiraría y recargaría cada fila
+            saved.append((key, short_circuit.id, short_circuit.to_dict()))
+            results.append({"status": "success", "id": short_circuit.id})
+        except DuplicateRequest as duplicate:
+            results.append({"status": "duplicate", "id": duplicate.record_id})
+        except Exception as e:
+            results.append({"status": "error", "message": str(e)})
+
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    _after_commit(saved)
+    return results
+
+
 def get_short_circuits(db: Session, skip: int = 0, limit: int = 10):
     """
     Obtiene registros de cortocircuitos con paginación.
     """
     try:
-        # Obtener total de registros
-        total_records = db.query(ShortCircuit).count()
+        # Obtener total de registros (conteo mantenido en memoria)
+        total_records = short_circuit_counter.get()
 
         # Obtener registros paginados
         records = (
@@ -102,7 +274,94 @@ def get_short_circuits_count(db: Session):
     Obtiene el conteo total de registros de cortocircuitos.
     """
     try:
-        count = db.query(ShortCircuit).count()
+        count = short_circuit_counter.get()
         return count, None
     except Exception as e:
         return None, str(e)
+
+
+def _short_circuit_cursor(record: ShortCircuit, direction: str) -> str:
+    return encode_cursor(
+        {"timestamp": record.timestamp.isoformat(), "id": record.id, "d": direction}
+    )
+
+
+def get_short_circuits_keyset(db: Session, limit: int = 10, cursor: str = None):
+    """
+    Obtiene registros de cortocircuitos con paginación por cursor (keyset sobre
+    timestamp, id), del más reciente al más antiguo, sin OFFSET.
+
+    El cursor es opaco: se obtiene de next_cursor / prev_cursor de la página
+    anterior. Sin cursor se devuelve la primera página. Lanza ValueError si el
+    cursor no es válido.
+    """
+    direction = "next"
+    if cursor:
+        position = decode_cursor(cursor)
+        try:
+            timestamp = dateutil.parser.isoparse(position["timestamp"])
+            record_id = int(position["id"])
+            direction = position.get("d", "next")
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Cursor inválido")
+
+    try:
+        query = db.query(ShortCircuit)
+
+        if cursor:
+            if direction == "prev":
+                query = query.filter(
+                    or_(
+                        ShortCircuit.timestamp > timestamp,
+                        and_(
+                            ShortCircuit.timestamp == timestamp,
+                            ShortCircuit.id > record_id,
+                        ),
+                    )
+                )
+            else:
+                query = query.filter(
+                    or_(
+                        ShortCircuit.timestamp < timestamp,
+                        and_(
+                            ShortCircuit.timestamp == timestamp,
+                            ShortCircuit.id < record_id,
+                        ),
+                    )
+                )
+
+        if direction == "prev":
+            query = query.order_by(ShortCircuit.timestamp.asc(), ShortCircuit.id.asc())
+        else:
+            query = query.order_by(
+                ShortCircuit.timestamp.desc(), ShortCircuit.id.desc()
+            )
+
+        records = query.limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+
+        if direction == "prev":
+            records.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, bool(cursor)
+
+        return {
+            "records": records,
+            "total_records": short_circuit_counter.get(),
+            "limit": limit,
+            "next_cursor": (
+                _short_circuit_cursor(records[-1], "next")
+                if records and has_next
+                else None
+            ),
+            "prev_cursor": (
+                _short_circuit_cursor(records[0], "prev")
+                if records and has_prev
+                else None
+            ),
+        }, None
+
+    except Exception as e:
+        return None, str(e)
@@ -0,0 +1,28 @@
+"""
+Normalización de fechas recibidas de los dispositivos y de la URL.
+
+Las columnas DateTime guardan horas UTC sin zona; los valores con zona (por
+ejemplo "...Z" o "+02:00") se convierten a UTC antes de compararlos o
+guardarlos.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+import dateutil.parser
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Hora UTC sin zona. Los valores sin zona se asumen ya en UTC.
+    """
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parsea un ISO 8601 y lo retorna en UTC sin zona (None si viene vacío).
+    """
+    return naive_utc(dateutil.parser.isoparse(value)) if value else None